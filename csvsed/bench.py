@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# auth: metagriffin <mg.github@metagriffin.net>
+# date: 2026/10/18
+# copy: (C) Copyright 2026-EOT metagriffin -- see LICENSE.txt
+#------------------------------------------------------------------------------
+# This software is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+#------------------------------------------------------------------------------
+
+'''
+Performance benchmarks for csvsed.
+
+Generates a synthetic CSV file and times the "s", "y", "e" (both
+per-value and "continuous" mode) and "p" modifiers, and a cheap modifier
+applied to every column ("w"), through both the library API
+(`csvsed.sed.CsvFilter`) and the command-line program, reporting
+rows/sec, MB/sec and peak RSS as JSON, along with the startup time of
+the lightweight (`csvsed.lean`) and full (`csvsed.cli`) programs,
+e.g.::
+
+  $ python -m csvsed.bench --rows 100000 --output before.json
+  $ python -m csvsed.bench --rows 100000 --compare before.json
+
+Each benchmark is run in a child process so that its peak RSS is not
+affected by the other benchmarks.
+'''
+
+import os, sys, json, time, random, string, argparse, platform
+import subprocess, tempfile, traceback
+import csvkit
+
+from csvsed import sed
+
+#------------------------------------------------------------------------------
+# name => (modifier specification, uses the reduced "--exec-rows" input,
+#          columns it is applied to). The "w" (wide) scenario applies a
+#          cheap modifier to every column, so it mostly measures the
+#          per-row and per-cell overhead of `CsvFilter`.
+SCENARIOS = dict(
+  s  = ('s/[aeiou]/_/g', False, '1'),
+  y  = ('y/a-z/A-Z/', False, '1'),
+  e  = ('e/cat/', True, '1'),
+  ec = ('e/cat/c', False, '1'),
+  p  = ('p/len(s) * 2/', False, '1'),
+  w  = ('s/^#//', False, '1-'),
+)
+
+DEFAULT_SCENARIOS = ('s', 'y', 'e', 'ec', 'p', 'w')
+DEFAULT_MODES     = ('api', 'cli')
+
+# entry point name => module, for the startup time measurements
+ENTRY_POINTS = dict(
+  lean = 'csvsed.lean',
+  cli  = 'csvsed.cli',
+)
+
+#------------------------------------------------------------------------------
+def generate(stream, rows=10000, columns=8, cell_length=12, quoting=0.1,
+             cardinality=None, seed=0):
+  '''
+  Writes a synthetic CSV with a header row and `rows` data rows to
+  file-like object `stream`, and returns the number of bytes written.
+
+  :Parameters:
+
+  rows : int, optional, default: 10000
+
+    The number of data rows.
+
+  columns : int, optional, default: 8
+
+    The number of columns, named "col1" through "colN".
+
+  cell_length : int, optional, default: 12
+
+    The length of each value.
+
+  quoting : float, optional, default: 0.1
+
+    The fraction of values that contain a comma (and therefore need
+    to be quoted).
+
+  cardinality : int, optional
+
+    The number of distinct values in each column; if not specified,
+    values are (very probably) all distinct.
+
+  seed : int, optional, default: 0
+
+    The random seed, so that the same parameters always generate the
+    same data.
+  '''
+  rand  = random.Random(seed)
+  chars = string.ascii_lowercase + string.digits + ' '
+  def value():
+    ret = ''.join(rand.choice(chars) for idx in xrange(cell_length))
+    if rand.random() < quoting:
+      pos = rand.randrange(cell_length)
+      ret = ret[:pos] + ',' + ret[pos + 1:]
+    return ret
+  pools = None
+  if cardinality:
+    pools = [[value() for idx in xrange(cardinality)] for col in xrange(columns)]
+  total  = [0]
+  class Counter(object):
+    def write(self, data):
+      total[0] += len(data)
+      stream.write(data)
+  writer = csvkit.CSVKitWriter(Counter())
+  writer.writerow(['col%i' % (col + 1,) for col in xrange(columns)])
+  for row in xrange(rows):
+    if pools:
+      writer.writerow([rand.choice(pool) for pool in pools])
+    else:
+      writer.writerow([value() for col in xrange(columns)])
+  return total[0]
+
+#------------------------------------------------------------------------------
+def run_api(path, spec, columns='1'):
+  '''
+  Applies `spec` to the `columns` (a "-c" column specification) of CSV
+  file `path` via `CsvFilter`.
+  '''
+  with open(path, 'rb') as src, open(os.devnull, 'wb') as dst:
+    source = csvkit.CSVKitReader(src)
+    cnames = source.next()
+    mods   = {
+      idx: spec for idx in sed.parse_column_identifiers(columns, cnames)}
+    reader = sed.CsvFilter(
+      source, mods, header=False, cnames=cnames, window=64)
+    writer = csvkit.CSVKitWriter(dst)
+    writer.writerow(cnames)
+    try:
+      for row in reader:
+        writer.writerow(row)
+    finally:
+      reader.close()
+
+#------------------------------------------------------------------------------
+def measure_api(path, spec, columns='1'):
+  '''
+  Runs `run_api` in a forked child process and returns a tuple of
+  ``(SECONDS, PEAK_RSS_KB)``.
+  '''
+  rfd, wfd = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    code = 1
+    try:
+      os.close(rfd)
+      start = time.time()
+      run_api(path, spec, columns)
+      os.write(wfd, json.dumps(time.time() - start))
+      code = 0
+    except:
+      traceback.print_exc()
+    finally:
+      os._exit(code)
+  os.close(wfd)
+  with os.fdopen(rfd, 'rb') as fp:
+    data = fp.read()
+  pid, status, usage = os.wait4(pid, 0)
+  if status != 0:
+    raise RuntimeError('benchmark of %r failed' % (spec,))
+  return (json.loads(data), usage.ru_maxrss)
+
+#------------------------------------------------------------------------------
+def measure_cli(path, spec, module='csvsed.lean', columns='1'):
+  '''
+  Runs the csvsed program `module` (including interpreter startup) on
+  CSV file `path`, applying `spec` to the `columns` (by default, the
+  first column), and returns a tuple of ``(SECONDS, PEAK_RSS_KB)``.
+  '''
+  cmd = [sys.executable, '-m', module, '-c', columns, spec, path]
+  with open(os.devnull, 'wb') as dst:
+    start = time.time()
+    proc  = subprocess.Popen(cmd, stdout=dst)
+    pid, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.time() - start
+  proc.returncode = status
+  if status != 0:
+    raise RuntimeError('command failed: %s' % (' '.join(cmd),))
+  return (elapsed, usage.ru_maxrss)
+
+#------------------------------------------------------------------------------
+def benchmark(scenarios=DEFAULT_SCENARIOS, modes=DEFAULT_MODES, rows=100000,
+              exec_rows=1000, repeat=3, **params):
+  '''
+  Runs the benchmarks and returns the report as a JSON-serializable
+  dict. Each of the `scenarios` (keys of `SCENARIOS`) is run in each
+  of the `modes` ("api" and/or "cli") `repeat` times, keeping the
+  fastest run. Scenarios that run a program per value use `exec_rows`
+  rows instead of `rows`. The keyword arguments `params` are passed to
+  `generate`.
+  '''
+  tmpdir  = tempfile.mkdtemp(prefix='csvsed-bench-')
+  results = []
+  startup = dict()
+  try:
+    if 'cli' in modes:
+      path = os.path.join(tmpdir, 'input-startup.csv')
+      with open(path, 'wb') as fp:
+        generate(fp, rows=1, **params)
+      for name, module in ENTRY_POINTS.items():
+        runs = [measure_cli(path, 's/a/b/', module) for idx in xrange(repeat)]
+        startup[name] = dict(
+          module      = module,
+          seconds     = round(min(run[0] for run in runs), 6),
+          peak_rss_kb = max(run[1] for run in runs),
+        )
+    inputs = dict()
+    for count in set([rows, exec_rows]):
+      path = os.path.join(tmpdir, 'input-%i.csv' % (count,))
+      with open(path, 'wb') as fp:
+        inputs[count] = (path, generate(fp, rows=count, **params))
+    for name in scenarios:
+      spec, reduced, columns = SCENARIOS[name]
+      count = exec_rows if reduced else rows
+      path, size = inputs[count]
+      for mode in modes:
+        if mode == 'api':
+          measure = lambda: measure_api(path, spec, columns)
+        else:
+          measure = lambda: measure_cli(path, spec, columns=columns)
+        runs = [measure() for idx in xrange(repeat)]
+        seconds = min(run[0] for run in runs)
+        results.append(dict(
+          scenario     = name,
+          mode         = mode,
+          spec         = spec,
+          rows         = count,
+          bytes        = size,
+          seconds      = round(seconds, 6),
+          rows_per_sec = round(count / seconds, 1),
+          mb_per_sec   = round(size / seconds / 1048576.0, 3),
+          peak_rss_kb  = max(run[1] for run in runs),
+        ))
+  finally:
+    for name in os.listdir(tmpdir):
+      os.unlink(os.path.join(tmpdir, name))
+    os.rmdir(tmpdir)
+  params.update(rows=rows, exec_rows=exec_rows, repeat=repeat)
+  return dict(
+    python  = platform.python_version(),
+    machine = platform.machine(),
+    time    = int(time.time()),
+    params  = params,
+    startup = startup,
+    results = results,
+  )
+
+#------------------------------------------------------------------------------
+def compare(report, baseline):
+  '''
+  Returns a list of text lines comparing the rows/sec of each result
+  in `report` with the matching result in `baseline`, followed by the
+  startup time of each entry point.
+  '''
+  old = {(res['scenario'], res['mode']): res for res in baseline['results']}
+  ret = []
+  for res in report['results']:
+    key = (res['scenario'], res['mode'])
+    if key not in old:
+      continue
+    ratio = res['rows_per_sec'] / old[key]['rows_per_sec']
+    ret.append('%-4s %-4s %12.1f rows/s  %+7.1f%%' % (
+      key + (res['rows_per_sec'], (ratio - 1) * 100)))
+  for name, res in sorted(report.get('startup', {}).items()):
+    if name not in baseline.get('startup', {}):
+      continue
+    ratio = res['seconds'] / baseline['startup'][name]['seconds']
+    ret.append('%-9s %12.1f ms      %+7.1f%%' % (
+      name, res['seconds'] * 1000, (ratio - 1) * 100))
+  return ret
+
+#------------------------------------------------------------------------------
+def main(args=None):
+  parser = argparse.ArgumentParser(
+    description='Benchmarks csvsed on a synthetic CSV and reports the'
+    ' results as JSON.')
+  parser.add_argument(
+    '--rows', metavar='N', type=int, default=100000,
+    help='The number of rows to generate (default: %(default)s).')
+  parser.add_argument(
+    '--exec-rows', metavar='N', type=int, default=1000,
+    help='The number of rows used for scenarios that run a program per'
+    ' value (default: %(default)s).')
+  parser.add_argument(
+    '--columns', metavar='N', type=int, default=8,
+    help='The number of columns (default: %(default)s).')
+  parser.add_argument(
+    '--cell-length', metavar='N', type=int, default=12,
+    help='The length of each value (default: %(default)s).')
+  parser.add_argument(
+    '--quoting', metavar='FRACTION', type=float, default=0.1,
+    help='The fraction of values that need quoting (default: %(default)s).')
+  parser.add_argument(
+    '--cardinality', metavar='N', type=int,
+    help='The number of distinct values per column (default: unlimited).')
+  parser.add_argument(
+    '--seed', metavar='N', type=int, default=0,
+    help='The random seed (default: %(default)s).')
+  parser.add_argument(
+    '--repeat', metavar='N', type=int, default=3,
+    help='Run each benchmark N times and keep the fastest'
+    ' (default: %(default)s).')
+  parser.add_argument(
+    '--scenarios', metavar='LIST', default=','.join(DEFAULT_SCENARIOS),
+    help='A comma-separated list of the scenarios to run, among %s'
+    ' (default: %%(default)s).' % (', '.join(sorted(SCENARIOS)),))
+  parser.add_argument(
+    '--modes', metavar='LIST', default=','.join(DEFAULT_MODES),
+    help='A comma-separated list of "api" and/or "cli" (default: %(default)s).')
+  parser.add_argument(
+    '--output', metavar='PATH',
+    help='Write the JSON report to PATH instead of STDOUT.')
+  parser.add_argument(
+    '--compare', metavar='PATH',
+    help='Compare the results with a previous JSON report (written to'
+    ' STDERR).')
+  opts = parser.parse_args(args)
+  scenarios = opts.scenarios.split(',')
+  for name in scenarios:
+    if name not in SCENARIOS:
+      parser.error('unknown scenario "%s"' % (name,))
+  modes = opts.modes.split(',')
+  for mode in modes:
+    if mode not in DEFAULT_MODES:
+      parser.error('unknown mode "%s"' % (mode,))
+  report = benchmark(
+    scenarios   = scenarios,
+    modes       = modes,
+    rows        = opts.rows,
+    exec_rows   = opts.exec_rows,
+    repeat      = opts.repeat,
+    columns     = opts.columns,
+    cell_length = opts.cell_length,
+    quoting     = opts.quoting,
+    cardinality = opts.cardinality,
+    seed        = opts.seed,
+  )
+  data = json.dumps(report, indent=2, sort_keys=True) + '\n'
+  if opts.output:
+    with open(opts.output, 'wb') as fp:
+      fp.write(data)
+  else:
+    sys.stdout.write(data)
+  if opts.compare:
+    with open(opts.compare, 'rb') as fp:
+      baseline = json.load(fp)
+    for line in compare(report, baseline):
+      sys.stderr.write(line + '\n')
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+#------------------------------------------------------------------------------
+# end of $Id$
+# $ChangeLog$
+#------------------------------------------------------------------------------
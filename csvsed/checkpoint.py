@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# auth: metagriffin <mg.github@metagriffin.net>
+# date: 2026/10/18
+# copy: (C) Copyright 2026-EOT metagriffin -- see LICENSE.txt
+#------------------------------------------------------------------------------
+# This software is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+#------------------------------------------------------------------------------
+
+'''
+Checkpoints for long csvsed runs, so that a failed run can be resumed
+where it left off instead of starting over.
+
+Every so many rows, the output is synced to disk and the number of
+rows written, along with the input and output byte offsets at which
+they end, is recorded in a JSON "sidecar" file next to the output. To
+resume, the input is read from that offset on and the output is
+truncated to it. Both the input and the output must therefore be
+regular, uncompressed files.
+'''
+
+import os, json, hashlib, collections
+
+#------------------------------------------------------------------------------
+class CheckpointError(Exception): pass
+
+#------------------------------------------------------------------------------
+def sidecar(path):
+  'Returns the name of the checkpoint file for output file `path`.'
+  return path + '.checkpoint'
+
+#------------------------------------------------------------------------------
+class TrackingStream(object):
+  '''
+  Wraps the seekable file-like object `stream`, keeping track of the
+  `offset` of the data returned by `readline` (or by iterating).
+  '''
+  def __init__(self, stream):
+    self.stream = stream
+    self.offset = stream.tell()
+  def readline(self, size=-1):
+    line = self.stream.readline(size)
+    self.offset += len(line)
+    return line
+  def __iter__(self):
+    return self
+  def next(self):
+    line = self.readline()
+    if not line:
+      raise StopIteration
+    return line
+  def seek(self, offset):
+    self.stream.seek(offset)
+    self.offset = offset
+  def close(self):
+    self.stream.close()
+
+#------------------------------------------------------------------------------
+class TrackingReader(object):
+  '''
+  Wraps the CSV `reader` of a `TrackingStream`, recording the stream
+  offset at which each row ends in the `offsets` deque. The reader
+  must not read ahead of the current record (see
+  `csvsed.sed.RecordReader`).
+  '''
+  def __init__(self, reader, stream):
+    self.reader  = reader
+    self.stream  = stream
+    self.offsets = collections.deque()
+  def __iter__(self):
+    return self
+  def next(self):
+    row = self.reader.next()
+    self.offsets.append(self.stream.offset)
+    return row
+
+#------------------------------------------------------------------------------
+class Checkpoint(object):
+  '''
+  Manages the checkpoint file `path` of a run that applies `script`
+  to the input file `input`, saving a checkpoint every `interval`
+  rows. A checkpoint is only valid for the same input file (as
+  identified by its name, size and modification time) and script.
+  '''
+  def __init__(self, path, input, script, interval):
+    stat = os.stat(input)
+    self.path     = path
+    self.interval = interval
+    self.identity = dict(
+      input  = os.path.abspath(input),
+      size   = stat.st_size,
+      mtime  = stat.st_mtime,
+      script = hashlib.sha1(repr(list(script))).hexdigest(),
+    )
+    self.resumed  = False
+    self.rows     = 0
+    self.input    = 0
+    self.output   = 0
+    self.stream   = None
+    self.reader   = None
+    self.target   = None
+
+  #----------------------------------------------------------------------------
+  def load(self):
+    '''
+    Loads the last saved checkpoint, if any, and returns whether or not
+    there was one. Raises `CheckpointError` if it was saved by a run
+    with a different input or script.
+    '''
+    if not os.path.exists(self.path):
+      return False
+    try:
+      with open(self.path, 'rb') as fp:
+        state = json.load(fp)
+      identity = {key: state[key] for key in self.identity}
+      rows, input, output = state['rows'], state['input_offset'], state['output_offset']
+    except (IOError, ValueError, KeyError) as err:
+      raise CheckpointError('invalid checkpoint "%s": %s' % (self.path, err))
+    if identity != self.identity:
+      raise CheckpointError(
+        'checkpoint "%s" was made with a different input file or script'
+        ' (delete it to start over)' % (self.path,))
+    self.resumed = True
+    self.rows    = rows
+    self.input   = input
+    self.output  = output
+    return True
+
+  #----------------------------------------------------------------------------
+  def open_output(self, path):
+    '''
+    Opens the output file `path` for writing: if a checkpoint was
+    loaded, it is truncated to the checkpoint\'s offset and appended
+    to, otherwise it is created (or emptied).
+    '''
+    if not self.resumed:
+      self.target = open(path, 'wb')
+      return self.target
+    try:
+      fp = open(path, 'r+b')
+    except IOError as err:
+      raise CheckpointError('cannot resume: %s' % (err,))
+    fp.seek(0, os.SEEK_END)
+    if fp.tell() < self.output:
+      fp.close()
+      raise CheckpointError(
+        'cannot resume: output file "%s" is shorter than its checkpoint' % (path,))
+    fp.truncate(self.output)
+    fp.seek(self.output)
+    self.target = fp
+    return fp
+
+  #----------------------------------------------------------------------------
+  def track(self, stream):
+    'Returns a `TrackingStream` for the input file-like object `stream`.'
+    self.stream = TrackingStream(stream)
+    return self.stream
+
+  #----------------------------------------------------------------------------
+  def rows_from(self, reader):
+    '''
+    Returns a reader of the rows of CSV `reader` (which must read from
+    the stream returned by `track`, and have read the header row) that
+    follow the checkpoint, and records where each row ends.
+    '''
+    if self.resumed:
+      self.stream.seek(self.input)
+    self.reader = TrackingReader(reader, self.stream)
+    return self.reader
+
+  #----------------------------------------------------------------------------
+  def wrap(self, write, batch=False):
+    '''
+    Returns a function that calls the row writing function `write`
+    (which writes a list of rows if `batch` is truthy) and saves a
+    checkpoint whenever at least `interval` rows were written since
+    the last one.
+    '''
+    offsets = self.reader.offsets
+    state   = dict(pending=0)
+    def wrapper(rows):
+      ret = write(rows)
+      count = len(rows) if batch else 1
+      for idx in xrange(count):
+        offset = offsets.popleft()
+      self.rows += count
+      state['pending'] += count
+      if state['pending'] >= self.interval:
+        state['pending'] = 0
+        self.save(offset)
+      return ret
+    return wrapper
+
+  #----------------------------------------------------------------------------
+  def save(self, input):
+    '''
+    Syncs the output to disk and then atomically saves a checkpoint
+    for the rows written so far, which end at input offset `input`.
+    '''
+    self.target.flush()
+    os.fsync(self.target.fileno())
+    self.input  = input
+    self.output = self.target.tell()
+    state = dict(self.identity)
+    state.update(
+      rows=self.rows, input_offset=self.input, output_offset=self.output)
+    tmpname = self.path + '.tmp'
+    with open(tmpname, 'wb') as fp:
+      json.dump(state, fp, sort_keys=True)
+      fp.flush()
+      os.fsync(fp.fileno())
+    os.rename(tmpname, self.path)
+
+  #----------------------------------------------------------------------------
+  def remove(self):
+    'Removes the checkpoint file (i.e. once the run has completed).'
+    if os.path.exists(self.path):
+      os.unlink(self.path)
+
+#------------------------------------------------------------------------------
+# end of $Id$
+# $ChangeLog$
+#------------------------------------------------------------------------------
@@ -23,57 +23,42 @@
 Command-line interface to `csvsed.sed`.
 '''
 
-import re, sys
+import sys
 
 from csvkit import CSVKitReader, CSVKitWriter
-from csvkit.cli import CSVKitUtility, CSVFileType, parse_column_identifiers
-from csvsed import sed
+from csvkit.cli import CSVKitUtility
+from csvsed import lean
 
 #------------------------------------------------------------------------------
-class CsvSed(CSVKitUtility):
+class CsvSed(lean.SedTool, CSVKitUtility):
 
   description = 'A stream-oriented CSV modification tool. Like a ' \
       ' stripped-down "sed" command, but for tabular data.'
-  override_flags = 'f'
+  override_flags = 'fe'
+
+  #----------------------------------------------------------------------------
+  def __init__(self, args=None, output_file=None):
+    if args is None:
+      args = sys.argv[1:]
+    super(CsvSed, self).__init__(lean.normalize_args(args), output_file)
 
   #----------------------------------------------------------------------------
   def add_arguments(self):
-    self.argparser.add_argument(
-      '-c', '--columns',
-      dest='columns',
-      help='A comma separated list of column indices or names to be modified.')
-    # todo: support in-place file modification
-    # todo: make sure that it supports backup spec, eg '-i.orig'
-    # self.argparser.add_argument(
-    #   '-i', '--in-place',
-    #   dest='inplace',
-    #   help='Modify a file in-place (with a value, specifies that the original'
-    #   ' should be renamed first, e.g. "-i.orig")')
-    self.argparser.add_argument(
-      'expr', metavar='EXPR',
-      help='The "sed" expression to evaluate: currently supports substitution'
-      ' (s/REGEX/EXPR/FLAGS) and transliteration (y/SRC/DEST/FLAGS).')
-    self.argparser.add_argument(
-      'file', metavar='FILE',
-      nargs='?', type=CSVFileType(), default=sys.stdin,
-      help='The CSV file to operate on. If omitted or "-", will read from STDIN.')
+    lean.add_arguments(self.argparser)
+
+  #----------------------------------------------------------------------------
+  def csv_reader(self, stream):
+    return CSVKitReader(stream, **self.reader_kwargs)
 
   #----------------------------------------------------------------------------
-  def main(self):
-    reader = CSVKitReader(self.args.file, **self.reader_kwargs)
-    cnames = reader.next()
-    cids   = parse_column_identifiers(self.args.columns, cnames, self.args.zero_based)
-    mods   = {idx: self.args.expr for idx in cids}
-    output = CSVKitWriter(self.output_file, **self.writer_kwargs)
-    reader = sed.CsvFilter(reader, mods, header=False)
-    output.writerow(cnames)
-    for row in reader:
-      output.writerow(row)
+  def csv_writer(self, stream):
+    return CSVKitWriter(stream, **self.writer_kwargs)
 
 #------------------------------------------------------------------------------
-def main():
-  utility = CsvSed()
-  return utility.main()
+def main(args=None):
+  # note: CSVKitUtility resets SIGPIPE to its default action, which
+  #       `lean.run` undoes.
+  return lean.run(CsvSed(args))
 
 if __name__ == '__main__':
   sys.exit(main())
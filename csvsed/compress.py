@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# auth: metagriffin <mg.github@metagriffin.net>
+# date: 2026/10/18
+# copy: (C) Copyright 2026-EOT metagriffin -- see LICENSE.txt
+#------------------------------------------------------------------------------
+# This software is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+#------------------------------------------------------------------------------
+
+'''
+Transparent gzip, bzip2 and xz compressed input and output for csvsed.
+
+The (de)compression runs in a background thread that exchanges large
+blocks with the caller through a bounded queue, so that it overlaps
+with the CSV parsing and modification instead of being serialized
+with it (zlib, bz2 and lzma all release the GIL while they work). xz
+requires the `lzma` module (or its `backports.lzma` backport on python
+2).
+'''
+
+import os, re, zlib, bz2, threading, Queue
+
+#------------------------------------------------------------------------------
+# format => (magic bytes regex, file name extensions). note: the bz2
+# magic includes the block size and the magic of the first block (or,
+# for an empty stream, of the end of the stream), so that e.g. a CSV
+# header that starts with "BZh" is not mistaken for bz2 data.
+FORMATS = dict(
+  gzip = (re.compile('\x1f\x8b'), ('.gz', '.gzip')),
+  bz2  = (re.compile('BZh[1-9](?:1AY&SY|\x17rE8P\x90)'), ('.bz2', '.bzip2')),
+  xz   = (re.compile('\xfd7zXZ\x00'), ('.xz',)),
+)
+
+BLOCKSIZE = 1048576
+QUEUESIZE = 8
+
+#------------------------------------------------------------------------------
+class CompressionError(Exception): pass
+
+#------------------------------------------------------------------------------
+def _lzma():
+  try:
+    import lzma
+  except ImportError:
+    try:
+      from backports import lzma
+    except ImportError:
+      raise CompressionError(
+        'xz compression requires the "lzma" module (on python 2, install'
+        ' the "backports.lzma" package)')
+  return lzma
+
+def decompressor(format):
+  'Returns a new streaming decompressor object for `format`.'
+  if format == 'gzip':
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+  if format == 'bz2':
+    return bz2.BZ2Decompressor()
+  return _lzma().LZMADecompressor()
+
+def compressor(format, level=None):
+  'Returns a new streaming compressor object for `format`.'
+  if format == 'gzip':
+    return zlib.compressobj(
+      6 if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  if format == 'bz2':
+    return bz2.BZ2Compressor(9 if level is None else level)
+  if level is None:
+    return _lzma().LZMACompressor()
+  return _lzma().LZMACompressor(preset=level)
+
+def finished(dec):
+  '''
+  Returns whether the streaming decompressor `dec` has reached the end
+  of its compressed stream, i.e. whether the input fed to it so far
+  was complete. This may consume `dec` and must therefore only be
+  called once the input is exhausted (and before it is flushed).
+  '''
+  if getattr(dec, 'eof', None) is not None:
+    return dec.eof
+  if dec.unused_data:
+    return True
+  # note: python 2's zlib and bz2 decompressors do not have an `eof`
+  #       attribute, so instead probe whether they accept more data.
+  if hasattr(dec, 'copy'):
+    probe = dec.copy()
+    try:
+      probe.decompress('\0')
+    except zlib.error:
+      return False
+    return bool(probe.unused_data)
+  try:
+    dec.decompress('\0')
+  except EOFError:
+    return True
+  except Exception:
+    pass
+  return False
+
+#------------------------------------------------------------------------------
+def detect(path, magic=True):
+  '''
+  Returns the compression format ("gzip", "bz2" or "xz") of file
+  `path`, or ``None`` if it is not compressed. If `magic` is truthy
+  (the default), the file must exist and the format is detected from
+  its first few bytes only, so that e.g. an uncompressed "data.csv.gz"
+  is read as-is; otherwise only the extension is used (e.g. for output
+  files).
+  '''
+  if magic:
+    with open(path, 'rb') as fp:
+      head = fp.read(16)
+    for format, (regex, exts) in FORMATS.items():
+      if regex.match(head):
+        return format
+    return None
+  ext = os.path.splitext(path)[1].lower()
+  for format, (regex, exts) in FORMATS.items():
+    if ext in exts:
+      return format
+  return None
+
+#------------------------------------------------------------------------------
+class DecompressingReader(object):
+  '''
+  A read-only file-like object that returns the decompressed content
+  of the compressed file-like object `stream`, which is read and
+  decompressed by a background thread. Concatenated compressed
+  streams (e.g. as produced by "pigz" or "pbzip2") are supported; a
+  truncated stream raises a `CompressionError` once its data has been
+  read.
+  '''
+  EOF = object()
+  def __init__(self, stream, format, blocksize=BLOCKSIZE, queuesize=QUEUESIZE):
+    self.stream    = stream
+    self.format    = format
+    self.blocksize = blocksize
+    self.queue     = Queue.Queue(queuesize)
+    self.buffer    = ''
+    self.pos       = 0
+    self.eof       = False
+    self.closed    = False
+    self.thread    = threading.Thread(target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+  def _run(self):
+    try:
+      dec = decompressor(self.format)
+      while not self.closed:
+        data = self.stream.read(self.blocksize)
+        if not data:
+          if not finished(dec):
+            raise CompressionError('unexpected end of input (truncated?)')
+          break
+        while data:
+          try:
+            out = dec.decompress(data)
+          except EOFError:
+            # the previous stream ended exactly at a block boundary
+            dec = decompressor(self.format)
+            continue
+          if out:
+            self.queue.put(out)
+          data = dec.unused_data
+          if data:
+            dec = decompressor(self.format)
+      if hasattr(dec, 'flush'):
+        out = dec.flush()
+        if out:
+          self.queue.put(out)
+      self.queue.put(self.EOF)
+    except Exception as err:
+      self.queue.put(err)
+  def _fill(self):
+    'Appends the next block to the buffer; returns false at EOF.'
+    if self.eof:
+      return False
+    block = self.queue.get()
+    if block is self.EOF:
+      self.eof = True
+      return False
+    if isinstance(block, Exception):
+      self.eof = True
+      raise CompressionError(
+        'could not decompress %s input: %s' % (self.format, block))
+    self.buffer = self.buffer[self.pos:] + block
+    self.pos    = 0
+    return True
+  def readline(self, size=-1):
+    while True:
+      idx = self.buffer.find('\n', self.pos)
+      if idx >= 0 or not self._fill():
+        break
+    end = len(self.buffer) if idx < 0 else idx + 1
+    if size >= 0:
+      end = min(end, self.pos + size)
+    ret = self.buffer[self.pos:end]
+    self.pos = end
+    return ret
+  def read(self, size=-1):
+    while size < 0 or len(self.buffer) - self.pos < size:
+      if not self._fill():
+        break
+    end = len(self.buffer) if size < 0 else min(len(self.buffer), self.pos + size)
+    ret = self.buffer[self.pos:end]
+    self.pos = end
+    return ret
+  def __iter__(self):
+    return iter(self.readline, '')
+  def close(self):
+    if self.closed:
+      return
+    self.closed = True
+    # note: draining the queue so that the thread can notice `closed`.
+    while self.thread.is_alive():
+      try:
+        self.queue.get(timeout=0.1)
+      except Queue.Empty:
+        pass
+    self.stream.close()
+  def __enter__(self):
+    return self
+  def __exit__(self, *args):
+    self.close()
+
+#------------------------------------------------------------------------------
+class CompressingWriter(object):
+  '''
+  A write-only file-like object that compresses the data written to
+  it into file-like object `stream`. The data is collected into
+  blocks of `blocksize` bytes, which are compressed and written by a
+  background thread; `close()` (or `flush()`) must be called to write
+  the remaining data.
+  '''
+  EOF = object()
+  def __init__(self, stream, format, level=None, blocksize=BLOCKSIZE,
+               queuesize=QUEUESIZE):
+    self.stream    = stream
+    self.format    = format
+    self.blocksize = blocksize
+    self.parts     = []
+    self.size      = 0
+    self.error     = None
+    self.closed    = False
+    self.comp      = compressor(format, level)
+    self.queue     = Queue.Queue(queuesize)
+    self.thread    = threading.Thread(target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+  def _run(self):
+    while True:
+      block = self.queue.get()
+      try:
+        if block is self.EOF:
+          break
+        if self.error is None:
+          self.stream.write(self.comp.compress(block))
+      except Exception as err:
+        self.error = err
+      finally:
+        self.queue.task_done()
+  def _check(self):
+    if self.error is not None:
+      raise CompressionError(
+        'could not write %s output: %s' % (self.format, self.error))
+  def write(self, data):
+    self.parts.append(data)
+    self.size += len(data)
+    if self.size >= self.blocksize:
+      self._check()
+      self.queue.put(''.join(self.parts))
+      self.parts = []
+      self.size  = 0
+  def writelines(self, lines):
+    for line in lines:
+      self.write(line)
+  def flush(self):
+    '''
+    Waits until all of the data written so far has been handed to the
+    compressor and its output written to the underlying stream (note
+    that the compressor may still hold some of it back until `close`).
+    '''
+    if self.parts:
+      self.queue.put(''.join(self.parts))
+      self.parts = []
+      self.size  = 0
+    self.queue.join()
+    self._check()
+    self.stream.flush()
+  def finish(self):
+    '''
+    Compresses the remaining data and finishes the compressed stream,
+    but leaves the underlying stream open.
+    '''
+    if self.closed:
+      return
+    self.closed = True
+    if self.parts:
+      self.queue.put(''.join(self.parts))
+      self.parts = []
+    self.queue.put(self.EOF)
+    self.thread.join()
+    self._check()
+    self.stream.write(self.comp.flush())
+  def close(self):
+    'Finishes the compressed stream (see `finish`) and closes it.'
+    try:
+      self.finish()
+    finally:
+      self.stream.close()
+  def __enter__(self):
+    return self
+  def __exit__(self, *args):
+    self.close()
+
+#------------------------------------------------------------------------------
+def open_input(path, format=None, bufsize=-1):
+  '''
+  Opens file `path` for reading, transparently decompressing it if it
+  is compressed (or if `format` is specified). Uncompressed files are
+  opened with a buffer of `bufsize` bytes (see the builtin `open`).
+  '''
+  format = format or detect(path)
+  if format is None:
+    return open(path, 'rb', bufsize)
+  return DecompressingReader(open(path, 'rb'), format)
+
+#------------------------------------------------------------------------------
+def open_output(path, format=None):
+  '''
+  Opens file `path` for writing, transparently compressing the output
+  if its extension indicates a compression format (or if `format` is
+  specified).
+  '''
+  format = format or detect(path, magic=False)
+  if format is None:
+    return open(path, 'wb')
+  return CompressingWriter(open(path, 'wb'), format)
+
+#------------------------------------------------------------------------------
+# end of $Id$
+# $ChangeLog$
+#------------------------------------------------------------------------------
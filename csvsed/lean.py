@@ -0,0 +1,1060 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# auth: metagriffin <mg.github@metagriffin.net>
+# date: 2026/10/18
+# copy: (C) Copyright 2026-EOT metagriffin -- see LICENSE.txt
+#------------------------------------------------------------------------------
+# This software is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+#------------------------------------------------------------------------------
+'''
+A lightweight command-line entry point for csvsed, which only depends
+on the python standard library for plain CSV input and output.
+
+Options that need csvkit (e.g. the CSV dialect options, "--zero",
+"-v" or "--help") make `main` fall back to the full csvkit-based
+`csvsed.cli` program, which is only imported in that case.
+'''
+
+import os, re, sys, csv, errno, codecs, shlex, signal, argparse, itertools
+from cStringIO import StringIO
+
+from csvsed import sed
+
+#------------------------------------------------------------------------------
+# the (normalized) input encodings that the stdlib `csv` module can
+# parse directly, i.e. those in which the CSV syntax characters are
+# single ASCII bytes.
+ENCODINGS = ('utf-8', 'iso8859-1', 'ascii', 'cp1252')
+
+# the size of the input and output buffers with "--flush buffered".
+BUFFER_SIZE = 1 << 20
+
+# the default "--exec-window" when any "e" modifier is in "continuous"
+# mode.
+EXEC_WINDOW = 64
+
+#------------------------------------------------------------------------------
+class Fallback(Exception):
+  'Raised when the arguments require the full `csvsed.cli` program.'
+
+#------------------------------------------------------------------------------
+class ExpressionAction(argparse.Action):
+  'Appends an expression, bound to the current "-c" columns, to the script.'
+  def __call__(self, parser, namespace, values, option_string=None):
+    script = getattr(namespace, self.dest, None) or []
+    script.append((namespace.columns, values))
+    setattr(namespace, self.dest, script)
+
+#------------------------------------------------------------------------------
+class ScriptAction(argparse.Action):
+  'Appends the expressions found in a script file to the script.'
+  def __call__(self, parser, namespace, values, option_string=None):
+    script = getattr(namespace, self.dest, None) or []
+    try:
+      with open(values, 'rb') as fp:
+        script.extend(parse_script(fp, namespace.columns))
+    except (IOError, ValueError) as err:
+      parser.error('invalid script file "%s": %s' % (values, err))
+    setattr(namespace, self.dest, script)
+
+#------------------------------------------------------------------------------
+def parse_script(stream, columns=None):
+  '''
+  Parses a csvsed script from file-like object `stream` and returns a
+  list of ``(COLUMNS, EXPR)`` tuples. Each non-empty line that does not
+  start with "#" is split with shell quoting rules and must be either
+  ``COLUMNS EXPR`` or just ``EXPR``, in which case the expression
+  applies to `columns`.
+  '''
+  ret = []
+  for lineno, line in enumerate(stream):
+    line = line.strip()
+    if not line or line.startswith('#'):
+      continue
+    words = shlex.split(line)
+    if len(words) == 1:
+      ret.append((columns, words[0]))
+    elif len(words) == 2:
+      ret.append((words[0], words[1]))
+    else:
+      raise ValueError('line %i: expected "COLUMNS EXPR" or "EXPR"' % (lineno + 1,))
+  return ret
+
+#------------------------------------------------------------------------------
+def is_continuous(expr):
+  '''
+  Returns whether the modifier specification `expr` (optionally
+  preceded by an address) is a "continuous" mode "e" modifier, i.e.
+  whether it has the "c" flag.
+  '''
+  spec = sed.Address.parse(expr)[1]
+  if len(spec) < 3 or spec[0] != 'e':
+    return False
+  espec = spec.split(spec[1])
+  return len(espec) == 3 and 'c' in espec[2].lower()
+
+#------------------------------------------------------------------------------
+def flush_policy(value):
+  '''
+  Parses the "--flush" POLICY `value` into a ``(KIND, AMOUNT)`` tuple,
+  where KIND is ``"rows"`` (flush every AMOUNT rows, "row" being
+  short for "1"), ``"ms"`` (flush every AMOUNT milliseconds) or
+  ``"buffered"`` (AMOUNT is ``None``).
+  '''
+  policy = value.strip().lower()
+  if policy == 'row':
+    return ('rows', 1)
+  if policy == 'buffered':
+    return ('buffered', None)
+  match = re.match(r'^(\d+)(ms)?$', policy)
+  if not match or int(match.group(1)) < 1:
+    raise argparse.ArgumentTypeError(
+      'invalid flush policy "%s" (expected "row", N, "Nms" or "buffered")' % (value,))
+  return ('ms' if match.group(2) else 'rows', int(match.group(1)))
+
+#------------------------------------------------------------------------------
+def normalize_args(args):
+  '''
+  Returns a copy of the command-line arguments `args` in which a bare
+  "-i" is made explicitly suffix-less: as with sed, the "-i" SUFFIX
+  must be attached to the option (e.g. "-i.orig") so that a FILE
+  following a bare "-i" is not mistaken for the SUFFIX.
+  '''
+  return ['--in-place=' if arg in ('-i', '--in-place') else arg
+          for arg in args]
+
+#------------------------------------------------------------------------------
+def add_arguments(parser):
+  'Adds the csvsed-specific options to the argparse `parser`.'
+  # note: csvkit's "-e" short option is re-purposed for expressions,
+  #       so the input encoding is only available as "--encoding".
+  parser.add_argument(
+    '--encoding',
+    dest='encoding', default='utf-8',
+    help='Specify the encoding the input CSV file.')
+  parser.add_argument(
+    '-c', '--columns',
+    dest='columns',
+    help='A comma separated list of column indices or names to be modified.'
+    ' When used with "-e" or "-f", applies to all expressions that follow'
+    ' it (up to the next "-c").')
+  parser.add_argument(
+    '-e', '--expression',
+    dest='script', metavar='EXPR', action=ExpressionAction,
+    help='Add EXPR to the set of expressions to be evaluated against the'
+    ' current "-c" columns. Can be specified multiple times; all'
+    ' expressions are applied, in order, in a single pass.')
+  parser.add_argument(
+    '-f', '--script-file',
+    dest='script', metavar='SCRIPT', action=ScriptAction,
+    help='Add the expressions in file SCRIPT to the set of expressions to'
+    ' be evaluated. Each line must be either "COLUMNS EXPR" or "EXPR"'
+    ' (which then applies to the current "-c" columns), quoted as in'
+    ' a shell; blank lines and lines starting with "#" are ignored.')
+  parser.add_argument(
+    '-j', '--jobs',
+    dest='jobs', metavar='N', type=int,
+    help='Process the input in chunks with N parallel worker processes'
+    ' (if N is zero, one per CPU). The output order is preserved. With'
+    ' multiple FILEs, the workers process whole files concurrently'
+    ' instead. Requires that quotes are escaped by doubling them (i.e.'
+    ' no "-p" or "-u 3").')
+  parser.add_argument(
+    '--exec-window',
+    dest='exec_window', metavar='N', type=int,
+    help='The maximum number of rows read ahead so that values can be'
+    ' streamed to "e" modifiers without waiting for each result'
+    ' (default: %i if any "e" modifier uses the "continuous" mode "c"'
+    ' flag, otherwise 1, i.e. no read-ahead).' % (EXEC_WINDOW,))
+  parser.add_argument(
+    '--exec-timeout',
+    dest='exec_timeout', metavar='SECONDS', type=float,
+    help='The maximum number of seconds to wait for a "continuous"'
+    ' mode "e" modifier to produce the output for a single value.')
+  parser.add_argument(
+    '--exec-workers',
+    dest='exec_workers', metavar='N', type=int, default=1,
+    help='The number of concurrent executions of each "e" modifier\'s'
+    ' program (in "continuous" mode, the number of long-lived instances'
+    ' among which values are distributed). Requires an "--exec-window"'
+    ' of at least N to be effective. The output order is preserved.')
+  parser.add_argument(
+    '--cache-size',
+    dest='cache_size', metavar='N', type=int,
+    help='Cache the results of the last N distinct values of each column'
+    ' (most useful for low-cardinality columns and "e" modifiers).')
+  parser.add_argument(
+    '--cache-memory',
+    dest='cache_memory', metavar='MB', type=float,
+    help='Limit the result cache of each column to approximately MB'
+    ' megabytes (implies caching, even without "--cache-size").')
+  parser.add_argument(
+    '--exec-cache',
+    dest='exec_cache', metavar='PATH',
+    help='Persist the output of "e" modifier programs for each distinct'
+    ' input value in the sqlite database PATH (created if needed), so'
+    ' that programs are only run for values not seen in previous runs.')
+  parser.add_argument(
+    '--exec-cache-age',
+    dest='exec_cache_age', metavar='SECONDS', type=float,
+    help='Expire "--exec-cache" entries after SECONDS.')
+  parser.add_argument(
+    '--exec-cache-entries',
+    dest='exec_cache_entries', metavar='N', type=int,
+    help='Limit the "--exec-cache" to the N most recent entries.')
+  parser.add_argument(
+    '--exec-cache-clear',
+    dest='exec_cache_clear', action='store_true',
+    help='Delete all "--exec-cache" entries before processing.')
+  parser.add_argument(
+    '--batch-size',
+    dest='batch_size', metavar='N', type=int, default=256,
+    help='Apply the modifiers to batches of N rows at a time, column by'
+    ' column (default: %(default)s); use 1 to process one row at a time.'
+    ' Not used when "e" modifiers are pipelined (see "--exec-window").')
+  parser.add_argument(
+    '--passthrough',
+    dest='passthrough', action='store_true',
+    help='Output the rows in which no value is modified exactly as they'
+    ' were read (i.e. without normalizing their quoting and line'
+    ' terminators), which is also faster when most rows are unchanged.'
+    ' Requires a UTF-8 or ASCII input and the default CSV dialect.')
+  parser.add_argument(
+    '--partial',
+    dest='partial', action='store_true',
+    help='Only parse the leading values of each row, up to the last column'
+    ' that the expressions use; the rest of the row is output as it was'
+    ' read. This is much faster for wide files in which only the first'
+    ' few columns are modified. Has the same requirements as'
+    ' "--passthrough".')
+  parser.add_argument(
+    '--bytes',
+    dest='bytes_mode', action='store_true',
+    help='Process the values as UTF-8 byte strings instead of decoding'
+    ' and re-encoding every value: "s" modifiers and regex addresses'
+    ' whose patterns only match ASCII characters, and "y" modifiers'
+    ' whose characters are all ASCII, work on the bytes directly, and'
+    ' "e" modifiers pass the bytes to their programs as-is; the other'
+    ' modifiers (e.g. "p") decode the values that they modify. The'
+    ' input is not checked for invalid UTF-8. Requires a UTF-8 or ASCII'
+    ' input, and no "--maxfieldsize" or "-l".')
+  parser.add_argument(
+    '--flush',
+    dest='flush', metavar='POLICY', type=flush_policy,
+    help='When to flush the output: after every "row" (e.g. for'
+    ' "tail -f" feeds), every N rows, every "Nms" milliseconds, or'
+    ' "buffered" to use large input and output buffers for maximum'
+    ' throughput. The other policies read the input a line at a time'
+    ' (which requires a UTF-8, Latin-1, CP1252 or ASCII input) and limit'
+    ' "--batch-size" and "--exec-window", so that no row is held back'
+    ' waiting for more input. By default, the output is flushed when'
+    ' the stdio buffers are full.')
+  parser.add_argument(
+    '--stats',
+    dest='stats', action='store_true',
+    help='Print the time spent reading and writing, and the number of'
+    ' calls, changed values and time spent for each modifier on each'
+    ' column, to STDERR when done.')
+  parser.add_argument(
+    '-o', '--output',
+    dest='output', metavar='PATH',
+    help='Write the output to file PATH instead of STDOUT, compressed if'
+    ' PATH ends with ".gz", ".bz2" or ".xz".')
+  parser.add_argument(
+    '--output-dir',
+    dest='output_dir', metavar='DIR',
+    help='Write the output for each FILE to the file of the same name in'
+    ' directory DIR (created if needed), re-compressed in the same format.'
+    ' Allows multiple FILEs, which are processed concurrently with'
+    ' "--jobs".')
+  parser.add_argument(
+    '--checkpoint',
+    dest='checkpoint', metavar='N', type=int,
+    help='Every N rows, sync the "-o" output to disk and record the'
+    ' number of rows written and the input and output offsets at which'
+    ' they end in the file OUTPUT.checkpoint, which is removed when done.'
+    ' Requires an uncompressed input FILE and "-o" output, and no "-l".')
+  parser.add_argument(
+    '--resume',
+    dest='resume', action='store_true',
+    help='If the "--checkpoint" file of a previous (failed) run exists,'
+    ' continue from its last checkpoint: the input is read from the'
+    ' recorded offset and the output is truncated there and appended to.')
+  parser.add_argument(
+    '-i', '--in-place',
+    dest='inplace', metavar='SUFFIX', nargs='?', const='',
+    help='Modify the FILEs in-place, i.e. each one is written to a'
+    ' temporary file which then atomically replaces it. If SUFFIX is'
+    ' specified (it must be attached, e.g. "-i.orig"), a backup of'
+    ' each original file is made by appending SUFFIX to its name (or,'
+    ' if SUFFIX contains "*", by replacing each "*" with the file name).')
+  parser.add_argument(
+    'expr', metavar='EXPR',
+    nargs='?',
+    help='The "sed" expression to evaluate: currently supports substitution'
+    ' (s/REGEX/EXPR/FLAGS), transliteration (y/SRC/DEST/FLAGS),'
+    ' execution (e/PROGRAM/FLAGS) and python expressions (p/EXPR/FLAGS,'
+    ' e.g. "p/v * 2/" or "p|Wage / Hours|"), optionally prefixed with an'
+    ' address that selects the rows to modify: a row number "N", a'
+    ' range "N,M" (M can be "$"), the last row "$", or "/REGEX/" to'
+    ' match the cell being modified (or "[COLUMN]/REGEX/" to match'
+    ' another column), any of which can be negated with a trailing "!".'
+    ' Must be omitted if "-e" or "-f" is used.')
+  parser.add_argument(
+    'files', metavar='FILE',
+    nargs='*',
+    help='The CSV file(s) to operate on. If omitted or "-", will read from'
+    ' STDIN. Multiple files can only be specified with "-i" or'
+    ' "--output-dir", and quoted wildcard patterns (e.g. "data/*.csv")'
+    ' are expanded. Files compressed with gzip, bzip2 or xz are'
+    ' decompressed on the fly.')
+
+#------------------------------------------------------------------------------
+class SedTool(object):
+  '''
+  The csvsed program logic, shared by `LeanSed` and `csvsed.cli.CsvSed`.
+  Subclasses must set the `args`, `argparser`, `reader_kwargs`,
+  `writer_kwargs` and `output_file` attributes and implement the
+  `csv_reader` and `csv_writer` methods.
+  '''
+
+  #----------------------------------------------------------------------------
+  def get_script(self):
+    '''
+    Returns a tuple of ``(SCRIPT, FILES)`` where SCRIPT is the ordered
+    list of ``(COLUMNS, EXPR)`` tuples to apply and FILES is the list
+    of input file names. Since EXPR is optional when "-e" or "-f" is
+    used, the first positional argument is a FILE in that case.
+    '''
+    if not self.args.script:
+      if self.args.expr is None:
+        self.argparser.error('an EXPR, "-e" or "-f" option is required')
+      return ([(self.args.columns, self.args.expr)], self.args.files)
+    if self.args.expr is None:
+      return (self.args.script, self.args.files)
+    return (self.args.script, [self.args.expr] + self.args.files)
+
+  #----------------------------------------------------------------------------
+  def get_modifiers(self, script, cnames):
+    'Resolves the columns in `script` to a dict of index => expressions.'
+    mods = {}
+    for columns, expr in script:
+      for idx in sed.parse_column_identifiers(columns, cnames, self.args.zero_based):
+        mods.setdefault(idx, []).append(expr)
+    return mods
+
+  #----------------------------------------------------------------------------
+  def get_options(self):
+    'Returns the modifier options (see `csvsed.sed.spec2modifier`).'
+    memory = self.args.cache_memory
+    return dict(
+      window             = self.args.exec_window,
+      timeout            = self.args.exec_timeout,
+      workers            = self.args.exec_workers,
+      cache_size         = self.args.cache_size,
+      cache_memory       = int(memory * 1048576) if memory else None,
+      exec_cache         = self.args.exec_cache,
+      exec_cache_age     = self.args.exec_cache_age,
+      exec_cache_entries = self.args.exec_cache_entries,
+      zero_based         = self.args.zero_based,
+      bytes_mode         = self.args.bytes_mode,
+    )
+
+  #----------------------------------------------------------------------------
+  def compile(self, mods):
+    '''
+    Returns the compiled modifiers for `mods` (as returned by
+    `get_modifiers`). Modifiers are only compiled once per distinct
+    set of expressions, so that processing many files with the same
+    columns re-uses compiled regexes, caches and child processes.
+    '''
+    key = tuple(sorted((idx, tuple(exprs)) for idx, exprs in mods.items()))
+    if key not in self.compiled:
+      self.compiled[key] = sed.standardize_modifiers(
+        None, mods, **self.get_options())
+    return self.compiled[key]
+
+  #----------------------------------------------------------------------------
+  def check(self):
+    '''
+    Reports invalid combinations of options (via the `argparser`) and
+    returns the ``(SCRIPT, FILES)`` tuple (see `get_script`).
+    '''
+    script, files = self.get_script()
+    files = expand_globs(files)
+    if self.args.exec_cache_clear and not self.args.exec_cache:
+      self.argparser.error('"--exec-cache-clear" requires "--exec-cache"')
+    if self.args.inplace is not None and self.args.output_dir is not None:
+      self.argparser.error('"-i" cannot be used with "--output-dir"')
+    if self.args.inplace is not None or self.args.output_dir is not None:
+      if not files or '-' in files:
+        self.argparser.error(
+          '"-i" and "--output-dir" require one or more FILEs (and not "-")')
+      names = [os.path.basename(path) for path in files]
+      if self.args.output_dir is not None and len(set(names)) != len(names):
+        self.argparser.error('"--output-dir" requires FILEs with distinct names')
+    elif len(files) > 1:
+      self.argparser.error('multiple FILEs can only be used with "-i" or "--output-dir"')
+    if self.args.output is not None \
+        and (self.args.inplace is not None or self.args.output_dir is not None):
+      self.argparser.error('"-o" cannot be used with "-i" or "--output-dir"')
+    if self.args.checkpoint is not None:
+      from csvsed import compress
+      if self.args.checkpoint < 1:
+        self.argparser.error('"--checkpoint" requires a positive number of rows')
+      if len(files) != 1 or files[0] == '-' or self.args.output is None \
+          or compress.detect(self.args.output, magic=False) is not None:
+        self.argparser.error(
+          '"--checkpoint" requires an input FILE and an uncompressed "-o" output')
+      if self.args.jobs is not None and self.args.jobs != 1:
+        self.argparser.error('"--checkpoint" cannot be used with "--jobs"')
+      # note: the line numbers would restart (after a repeated header
+      #       label) on resume, since the header is not rewritten.
+      if self.writer_kwargs.get('line_numbers'):
+        self.argparser.error('"--checkpoint" cannot be used with "-l"')
+      if 'maxfieldsize' in self.reader_kwargs \
+          or codecs.lookup(self.args.encoding).name not in ENCODINGS:
+        self.argparser.error(
+          '"--checkpoint" requires one of the %s input encodings and no'
+          ' "--maxfieldsize"' % (', '.join(ENCODINGS),))
+    elif self.args.resume:
+      self.argparser.error('"--resume" requires "--checkpoint"')
+    if self.args.exec_window is None:
+      # note: rows are only read ahead by default for "continuous" mode
+      #       programs, so that other "e" modifiers still run their
+      #       programs one row at a time, in step with the output.
+      self.args.exec_window = 1
+      if any(is_continuous(expr) for columns, expr in script):
+        self.args.exec_window = EXEC_WINDOW
+    if self.args.jobs is not None and self.args.jobs != 1:
+      if self.writer_kwargs.get('line_numbers'):
+        self.argparser.error('"-l" cannot be used with "--jobs"')
+      if self.args.stats:
+        self.argparser.error('"--stats" cannot be used with "--jobs"')
+      # note: the input is split into records by counting quote
+      #       characters (see `sed.iter_records`), which requires that
+      #       quotes are only escaped by doubling them.
+      if 'escapechar' in self.reader_kwargs \
+          or self.reader_kwargs.get('doublequote') is False \
+          or self.reader_kwargs.get('quoting') == csv.QUOTE_NONE:
+        self.argparser.error(
+          '"--jobs" cannot be used with "-p" or "-u 3", or without doubled'
+          ' quotes')
+    if self.args.flush is not None and self.args.flush[0] != 'buffered':
+      if self.args.inplace is not None or self.args.output_dir is not None \
+          or (self.args.jobs is not None and self.args.jobs != 1):
+        self.argparser.error(
+          '"--flush" by rows or milliseconds cannot be used with "-i",'
+          ' "--output-dir" or "--jobs"')
+      if 'maxfieldsize' in self.reader_kwargs \
+          or codecs.lookup(self.args.encoding).name not in ENCODINGS:
+        self.argparser.error(
+          '"--flush" by rows or milliseconds requires one of the %s input'
+          ' encodings and no "--maxfieldsize"' % (', '.join(ENCODINGS),))
+      # note: rows are only written once their whole batch or exec
+      #       window has been read, so both are limited to the number
+      #       of rows that can be held back.
+      limit = self.args.flush[1] if self.args.flush[0] == 'rows' else 1
+      self.args.batch_size  = min(self.args.batch_size, limit)
+      self.args.exec_window = min(self.args.exec_window, limit)
+    if self.args.bytes_mode:
+      # note: the values are written as they were read, so the input
+      #       must already be in the output encoding (UTF-8).
+      if 'maxfieldsize' in self.reader_kwargs or self.writer_kwargs \
+          or codecs.lookup(self.args.encoding).name not in ('utf-8', 'ascii'):
+        self.argparser.error(
+          '"--bytes" requires a UTF-8 or ASCII input, and no "--maxfieldsize"'
+          ' or "-l"')
+    if self.args.passthrough or self.args.partial:
+      # note: raw input bytes are copied as-is, so the input must
+      #       already be in the output encoding (UTF-8) and dialect.
+      if set(self.reader_kwargs) - set(['encoding']) or self.writer_kwargs \
+          or codecs.lookup(self.args.encoding).name not in ('utf-8', 'ascii'):
+        self.argparser.error(
+          '"--passthrough" and "--partial" require a UTF-8 or ASCII input,'
+          ' the default CSV dialect and no "-l"')
+    return (script, files)
+
+  #----------------------------------------------------------------------------
+  def main(self):
+    script, files = self.check()
+    if self.args.exec_cache_clear:
+      cache = sed.DiskCache(self.args.exec_cache)
+      cache.clear()
+      cache.close()
+    self.compiled = dict()
+    self.stats    = sed.Stats() if self.args.stats else None
+    output = self.output_file
+    try:
+      if self.args.checkpoint is not None:
+        return self.process_checkpointed(script, files[0])
+      if self.args.inplace is None and self.args.output_dir is None:
+        source = self.open_input(files[0] if files else '-')
+        if self.args.output is not None:
+          from csvsed import compress
+          output = compress.open_output(self.args.output)
+        return self.process(script, source, output)
+      if self.args.output_dir is not None and not os.path.isdir(self.args.output_dir):
+        os.makedirs(self.args.output_dir)
+      if len(files) > 1 and self.args.jobs is not None and self.args.jobs != 1:
+        return self.process_files(script, files)
+      for path in files:
+        self.process_file(script, path, self.output_path(path), self.args.inplace)
+    finally:
+      if output is not self.output_file:
+        output.close()
+      self.close_compiled()
+      if self.stats is not None:
+        sys.stderr.write(self.stats.format())
+
+  #----------------------------------------------------------------------------
+  def close_compiled(self):
+    'Closes all of the modifiers compiled by `compile`.'
+    for mods in self.compiled.values():
+      sed.close_modifiers(mods.values())
+    self.compiled.clear()
+
+  #----------------------------------------------------------------------------
+  def open_input(self, path):
+    '''
+    Opens the input FILE `path` ("-" for STDIN), which is decompressed
+    on the fly if it is compressed.
+    '''
+    buffered = self.args.flush is not None and self.args.flush[0] == 'buffered'
+    if path == '-':
+      if not buffered:
+        return sys.stdin
+      return os.fdopen(os.dup(sys.stdin.fileno()), 'rb', BUFFER_SIZE)
+    from csvsed import compress
+    return compress.open_input(path, bufsize=BUFFER_SIZE if buffered else -1)
+
+  #----------------------------------------------------------------------------
+  def process_file(self, script, path, target=None, suffix=None):
+    '''
+    Processes file `path` into a temporary file in the directory of
+    file `target` (which defaults to `path`, i.e. an in-place edit),
+    which, once synced to disk, is atomically renamed over `target`.
+    If `suffix` is non-empty, a backup of the original `target` is
+    made first. Compressed files are re-compressed in the same format.
+    '''
+    import shutil, tempfile
+    from csvsed import compress
+    target = target or path
+    dirname, basename = os.path.split(os.path.abspath(target))
+    format = compress.detect(path)
+    if format is None:
+      source = open_mmap(path)
+    else:
+      source = compress.open_input(path, format)
+    output = tempfile.NamedTemporaryFile(
+      dir=dirname, prefix='.' + basename + '.', suffix='.tmp', delete=False)
+    try:
+      try:
+        if format is None:
+          self.process(script, source, output)
+        else:
+          writer = compress.CompressingWriter(output, format)
+          self.process(script, source, writer)
+          writer.finish()
+        output.flush()
+        os.fsync(output.fileno())
+      finally:
+        output.close()
+        source.close()
+      shutil.copymode(path, output.name)
+      if suffix and os.path.exists(target):
+        if '*' in suffix:
+          backup = os.path.join(dirname, suffix.replace('*', basename))
+        else:
+          backup = target + suffix
+        if os.path.exists(backup):
+          os.unlink(backup)
+        try:
+          os.link(target, backup)
+        except OSError:
+          shutil.copy2(target, backup)
+      os.rename(output.name, target)
+    except:
+      if os.path.exists(output.name):
+        os.unlink(output.name)
+      raise
+
+  #----------------------------------------------------------------------------
+  def output_path(self, path):
+    '''
+    Returns the name of the output file for FILE `path` when multiple
+    files are processed: the file of the same name in the
+    "--output-dir", or ``None`` for in-place edits.
+    '''
+    if self.args.output_dir is None:
+      return None
+    return os.path.join(self.args.output_dir, os.path.basename(path))
+
+  #----------------------------------------------------------------------------
+  def process_files(self, script, files):
+    '''
+    Processes the FILEs `files` concurrently with a pool of "--jobs"
+    worker processes, each of which processes whole files (see
+    `process_file`) and keeps its compiled modifiers, and therefore
+    the programs of "continuous" mode "e" modifiers, for all of the
+    files it processes.
+    '''
+    import multiprocessing
+    pool = multiprocessing.Pool(
+      self.args.jobs or None, _files_init, (self, script))
+    try:
+      for path in pool.imap_unordered(_files_process, files):
+        pass
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+  #----------------------------------------------------------------------------
+  def process_checkpointed(self, script, path):
+    '''
+    Processes the input file `path` into the "-o" output, saving a
+    checkpoint every "--checkpoint" rows (and, with "--resume",
+    continuing from the last checkpoint of a previous run).
+    '''
+    from csvsed import checkpoint, compress
+    if compress.detect(path) is not None:
+      raise checkpoint.CheckpointError(
+        '"--checkpoint" requires an uncompressed input FILE')
+    state = checkpoint.Checkpoint(
+      checkpoint.sidecar(self.args.output), path, script, self.args.checkpoint)
+    if self.args.resume:
+      state.load()
+    with open(path, 'rb') as source:
+      with state.open_output(self.args.output) as output:
+        self.process(script, source, output, state)
+    state.remove()
+
+  #----------------------------------------------------------------------------
+  def process(self, script, source, output, checkpoint=None):
+    '''
+    Applies `script` to the CSV in `source`, writing the result to
+    `output`. If `checkpoint` (a `csvsed.checkpoint.Checkpoint`) is
+    specified, the rows following its last checkpoint are processed,
+    and checkpoints are saved along the way. The output is flushed
+    according to the "--flush" policy.
+    '''
+    policy = self.args.flush
+    # note: checkpoints sync their output file themselves, so it is
+    #       not buffered any further.
+    if policy is None or policy[0] != 'buffered' or checkpoint is not None:
+      return self.process_rows(script, source, output, checkpoint)
+    output = BufferedOutput(output)
+    try:
+      return self.process_rows(script, source, output, checkpoint)
+    finally:
+      output.flush()
+
+  #----------------------------------------------------------------------------
+  def process_rows(self, script, source, output, checkpoint=None):
+    'Implements `process` once its `output` is set up.'
+    if self.args.jobs is not None and self.args.jobs != 1:
+      return self.process_parallel(script, source, output)
+    policy = self.args.flush
+    if checkpoint is not None:
+      source = checkpoint.track(source)
+    raw = self.args.passthrough or self.args.partial
+    streaming = policy is not None and policy[0] != 'buffered'
+    if raw or checkpoint is not None or streaming:
+      # note: a `RecordReader` never reads beyond the current record, so
+      #       the input offset at which each row ends is known, and rows
+      #       are not held back until more input arrives (as csvkit's
+      #       reader, which decodes the input with `codecs`, does).
+      kwargs = self.reader_kwargs
+      if self.args.bytes_mode:
+        kwargs = dict(kwargs, encoding=None)
+      source = sed.RecordReader(source, **kwargs)
+    elif self.args.bytes_mode:
+      source = sed.bytes_reader(source, **self.reader_kwargs)
+    else:
+      source = self.csv_reader(source)
+    try:
+      cnames = source.next()
+    except StopIteration:
+      return
+    mods   = self.compile(self.get_modifiers(script, cnames))
+    writer = self.get_writer(output)
+    if raw:
+      writer = sed.PassthroughWriter(
+        writer, output, unchanged=self.args.passthrough)
+    rows  = source
+    rowno = 0
+    if checkpoint is not None:
+      rows  = checkpoint.rows_from(source)
+      rowno = checkpoint.rows
+    reader = sed.CsvFilter(
+      rows, mods, header=False, cnames=cnames, window=self.args.exec_window,
+      rowno=rowno, stats=self.stats)
+    if self.args.partial:
+      source.limit = reader.width
+    flusher = None
+    if policy is not None and policy[0] != 'buffered':
+      flusher = Flusher(output, policy)
+    if checkpoint is None or not checkpoint.resumed:
+      writer.writerow(cnames)
+      if flusher is not None:
+        output.flush()
+    size    = self.args.batch_size
+    batched = size > 1 and not reader.pipelined
+    if batched:
+      batches = reader.iter_batches(size)
+    elif size > 1 and policy is not None and policy[0] == 'buffered':
+      # note: pipelined rows are not modified in batches, but they are
+      #       still written in batches.
+      batches = iter(lambda: list(itertools.islice(reader, size)), [])
+      batched = True
+    write = writer.writerows if batched else writer.writerow
+    if self.stats is not None:
+      write = self.stats.timer('write').wrap(write)
+    if checkpoint is not None:
+      write = checkpoint.wrap(write, batch=batched)
+    if flusher is not None:
+      write = flusher.wrap(write, batch=batched)
+    try:
+      if batched:
+        for rows in batches:
+          write(rows)
+      else:
+        for row in reader:
+          write(row)
+    finally:
+      if flusher is not None:
+        flusher.close()
+
+  #----------------------------------------------------------------------------
+  def get_writer(self, output):
+    '''
+    Returns the CSV writer for file-like object `output`: a
+    `csvsed.sed.BytesWriter` with "--bytes", and the `csv_writer`
+    otherwise.
+    '''
+    if self.args.bytes_mode:
+      return sed.BytesWriter(output, **self.writer_kwargs)
+    return self.csv_writer(output)
+
+  #----------------------------------------------------------------------------
+  def process_parallel(self, script, source, output):
+    quotechar = self.reader_kwargs.get('quotechar') or '"'
+    record = next(sed.iter_records(source, quotechar), None)
+    if record is None:
+      return
+    if self.args.bytes_mode:
+      cnames = sed.bytes_reader(StringIO(record), **self.reader_kwargs).next()
+    else:
+      cnames = self.csv_reader(StringIO(record)).next()
+    mods   = self.get_modifiers(script, cnames)
+    if self.args.passthrough:
+      output.write(record)
+    else:
+      self.get_writer(output).writerow(cnames)
+    sed.ParallelCsvFilter(
+      source, mods, jobs=self.args.jobs or None, header=False, cnames=cnames,
+      reader_kwargs=self.reader_kwargs,
+      writer_kwargs=self.writer_kwargs,
+      options=self.get_options(),
+      passthrough=self.args.passthrough,
+      partial=self.args.partial).write(output)
+
+#------------------------------------------------------------------------------
+# note: the pool workers are forked, so the `SedTool` object passed to
+#       `_files_init` is inherited rather than pickled.
+_files_state = None
+
+def _files_init(tool, script):
+  global _files_state
+  import multiprocessing.util
+  # note: each file is processed serially within its worker.
+  tool.args.jobs = 1
+  tool.compiled  = dict()
+  _files_state = (tool, script)
+  multiprocessing.util.Finalize(
+    None, tool.close_compiled, exitpriority=10)
+
+def _files_process(path):
+  tool, script = _files_state
+  tool.process_file(script, path, tool.output_path(path), tool.args.inplace)
+  return path
+
+#------------------------------------------------------------------------------
+def expand_globs(paths):
+  '''
+  Returns `paths` with each name that contains shell wildcards ("*",
+  "?" or "[") and that is not an existing file replaced by the sorted
+  names that match it, so that patterns can be quoted to avoid
+  command-line length limits with many files. Patterns that do not
+  match anything are kept as-is.
+  '''
+  import glob
+  ret = []
+  for path in paths:
+    if path != '-' and glob.has_magic(path) and not os.path.exists(path):
+      ret.extend(sorted(glob.glob(path)) or [path])
+    else:
+      ret.append(path)
+  return ret
+
+#------------------------------------------------------------------------------
+class Flusher(object):
+  '''
+  Flushes file-like object `output` according to the "--flush"
+  `policy` (see `flush_policy`) as rows are written with the
+  functions returned by `wrap`: after every N rows, or every N
+  milliseconds in which rows were written. The latter is done by a
+  background thread, so that rows are not held back while the input
+  is idle. `close` must be called when done.
+  '''
+  def __init__(self, output, policy):
+    self.output  = output
+    self.kind, self.amount = policy
+    self.pending = 0
+    self.thread  = None
+  def wrap(self, write, batch=False):
+    '''
+    Returns a function that calls the row writing function `write`
+    (which writes a list of rows if `batch` is truthy) and flushes
+    the output according to the policy.
+    '''
+    if self.kind == 'rows':
+      def wrapper(rows):
+        ret = write(rows)
+        self.pending += len(rows) if batch else 1
+        if self.pending >= self.amount:
+          self.pending = 0
+          self.output.flush()
+        return ret
+      return wrapper
+    import threading
+    self.lock    = threading.Lock()
+    self.stopped = threading.Event()
+    self.thread  = threading.Thread(target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+    def wrapper(rows):
+      with self.lock:
+        self.pending += 1
+        return write(rows)
+    return wrapper
+  def _run(self):
+    while not self.stopped.wait(self.amount / 1000.0):
+      with self.lock:
+        if self.pending:
+          self.pending = 0
+          try:
+            self.output.flush()
+          except IOError:
+            # note: the error is raised again by the final flush in
+            #       `close`, i.e. in the main thread.
+            return
+  def close(self):
+    'Stops the background thread (if any) and flushes the output.'
+    if self.thread is not None:
+      self.stopped.set()
+      self.thread.join()
+      self.thread = None
+    self.pending = 0
+    self.output.flush()
+
+#------------------------------------------------------------------------------
+class BufferedOutput(object):
+  '''
+  Collects the data written to it into blocks of `size` bytes, which
+  are written to file-like object `stream` (i.e. with far fewer
+  system calls than the default stdio buffers); `flush()` must be
+  called to write the remaining data.
+  '''
+  def __init__(self, stream, size=BUFFER_SIZE):
+    self.stream = stream
+    self.limit  = size
+    self.parts  = []
+    self.size   = 0
+  def write(self, data):
+    self.parts.append(data)
+    self.size += len(data)
+    if self.size >= self.limit:
+      self.stream.write(''.join(self.parts))
+      self.parts = []
+      self.size  = 0
+  def flush(self):
+    if self.parts:
+      self.stream.write(''.join(self.parts))
+      self.parts = []
+      self.size  = 0
+    self.stream.flush()
+
+#------------------------------------------------------------------------------
+def open_mmap(path):
+  '''
+  Opens file `path` for reading as a read-only memory map, which avoids
+  copying the data through the stdio buffers. Empty files, which cannot
+  be mapped, are opened as regular files.
+  '''
+  import mmap
+  with open(path, 'rb') as fp:
+    if os.fstat(fp.fileno()).st_size > 0:
+      return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+  return open(path, 'rb')
+
+#------------------------------------------------------------------------------
+class LeanReader(object):
+  '''
+  A minimal stand-in for `csvkit.CSVKitReader`: reads CSV records
+  from file-like object `stream` (which only needs to support
+  `readline`, so that memory maps work too) and returns them as lists
+  of unicode values decoded from `encoding`.
+  '''
+  def __init__(self, stream, encoding='utf-8'):
+    self.reader   = csv.reader(iter(stream.readline, ''))
+    self.encoding = encoding
+  def __iter__(self):
+    return self
+  def next(self):
+    encoding = self.encoding
+    return [unicode(value, encoding) for value in self.reader.next()]
+  @property
+  def line_num(self):
+    return self.reader.line_num
+
+#------------------------------------------------------------------------------
+class LeanWriter(object):
+  '''
+  A minimal stand-in for `csvkit.CSVKitWriter`: writes records to
+  file-like object `stream` as UTF-8 encoded CSV, with "\\n" line
+  terminators, ``None`` values as empty strings and embedded "\\r"
+  characters converted to "\\n".
+  '''
+  def __init__(self, stream, encoding='utf-8'):
+    self.writer   = csv.writer(stream, lineterminator='\n')
+    self.encoding = encoding
+  def writerow(self, row):
+    encoding = self.encoding
+    self.writer.writerow([
+      unicode(value if value is not None else '').replace(u'\r', u'\n').encode(encoding)
+      for value in row])
+  def writerows(self, rows):
+    encoding = self.encoding
+    self.writer.writerows(
+      [unicode(value if value is not None else '').replace(u'\r', u'\n').encode(encoding)
+       for value in row]
+      for row in rows)
+
+#------------------------------------------------------------------------------
+class LeanParser(argparse.ArgumentParser):
+  'An argument parser that raises `Fallback` instead of exiting on errors.'
+  def error(self, message):
+    raise Fallback(message)
+
+#------------------------------------------------------------------------------
+class LeanSed(SedTool):
+  '''
+  The csvsed program without csvkit. Raises `Fallback` from the
+  constructor if `args` use anything that it does not support: the
+  csvkit options (CSV dialect, "--zero", "-H", "-l", "-v", "--help"),
+  input encodings not in `ENCODINGS`, and any invalid usage (which the
+  full program then reports).
+  '''
+
+  #----------------------------------------------------------------------------
+  def __init__(self, args=None, output_file=None):
+    if args is None:
+      args = sys.argv[1:]
+    self.argparser = LeanParser(prog='csvsed', add_help=False)
+    add_arguments(self.argparser)
+    self.args, extra = self.argparser.parse_known_args(normalize_args(args))
+    if extra:
+      raise Fallback('unsupported arguments: %s' % (' '.join(extra),))
+    self.args.zero_based = False
+    try:
+      encoding = codecs.lookup(self.args.encoding).name
+    except LookupError:
+      raise Fallback('unknown encoding: %s' % (self.args.encoding,))
+    if encoding not in ENCODINGS:
+      raise Fallback('unsupported encoding: %s' % (self.args.encoding,))
+    self.reader_kwargs = dict(encoding=self.args.encoding)
+    self.writer_kwargs = dict()
+    self.check()
+    self.output_file   = output_file or sys.stdout
+    # as with csvkit, report errors without a traceback (see `run` for
+    # SIGPIPE).
+    sys.excepthook = self.excepthook
+
+  #----------------------------------------------------------------------------
+  def excepthook(self, etype, value, traceback):
+    if etype is UnicodeDecodeError:
+      sys.stderr.write(
+        'Your file is not "%s" encoded. Please specify the correct encoding'
+        ' with the --encoding flag.\n' % (self.args.encoding,))
+    else:
+      sys.stderr.write('%s\n' % (unicode(value).encode('utf-8'),))
+
+  #----------------------------------------------------------------------------
+  def csv_reader(self, stream):
+    return LeanReader(stream, **self.reader_kwargs)
+
+  #----------------------------------------------------------------------------
+  def csv_writer(self, stream):
+    return LeanWriter(stream, **self.writer_kwargs)
+
+#------------------------------------------------------------------------------
+def run(tool):
+  '''
+  Runs `tool` (a `SedTool`) and returns its exit status. SIGPIPE must
+  remain ignored (as python sets it up), because the "e" modifiers
+  rely on writes to the STDIN of a child that has exited failing with
+  EPIPE, so that the failure is reported, instead of killing the
+  program. An EPIPE on the output (e.g. when piped to "head") ends the
+  program quietly instead.
+  '''
+  if hasattr(signal, 'SIGPIPE'):
+    signal.signal(signal.SIGPIPE, signal.SIG_IGN)
+  try:
+    return tool.main()
+  except IOError as err:
+    if err.errno != errno.EPIPE:
+      raise
+    # note: STDOUT is redirected to /dev/null so that flushing it at
+    #       exit does not fail again.
+    try:
+      os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    except (OSError, ValueError):
+      pass
+    return 1
+
+#------------------------------------------------------------------------------
+def main(args=None):
+  '''
+  The "csvsed" program entry point: runs `LeanSed`, or the full
+  csvkit-based `csvsed.cli` program if `args` require it.
+  '''
+  try:
+    tool = LeanSed(args)
+  except Fallback:
+    from csvsed import cli
+    return cli.main(args)
+  return run(tool)
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+#------------------------------------------------------------------------------
+# end of $Id$
+# $ChangeLog$
+#------------------------------------------------------------------------------
@@ -24,15 +24,86 @@ A stream-oriented CSV modification tool. Like a stripped-down "sed"
 command, but for tabular data.
 '''
 
-import re, string, types, subprocess, csvkit, csv
-from csvkit.exceptions import ColumnIdentifierError
+import re, string, types, csv, collections, math
+import sys, time, itertools, sre_parse, sre_constants, __future__
+from cStringIO import StringIO
+
+# note: the heavier modules (csvkit, subprocess, threading, sqlite3,
+#       multiprocessing, ...), which are only needed by the "e" and "p"
+#       modifiers, the exec cache and parallel processing, are imported
+#       by the functions that use them to keep the startup time low.
 
 #------------------------------------------------------------------------------
 class InvalidModifierSpec(Exception): pass
+class CommandError(Exception): pass
+class ExpressionError(CommandError): pass
+
+#------------------------------------------------------------------------------
+def column_identifier_error(message):
+  'Returns a csvkit `ColumnIdentifierError` (imported on demand).'
+  from csvkit.exceptions import ColumnIdentifierError
+  return ColumnIdentifierError(message)
+
+#------------------------------------------------------------------------------
+def match_column_identifier(cnames, ident, zero_based=False):
+  '''
+  Returns the index of the column identified by `ident` (a name or a
+  position) in the column names `cnames`. This is equivalent to
+  csvkit's `match_column_identifier`, but does not import `csvkit.cli`.
+  '''
+  if isinstance(ident, basestring) and not ident.isdigit() and ident in cnames:
+    return cnames.index(ident)
+  try:
+    idx = int(ident) - ( 0 if zero_based else 1 )
+  except ValueError:
+    raise column_identifier_error(
+      'Column identifier "%s" is neither an integer, nor a existing'
+      ' column\'s name.' % (ident,))
+  if idx < 0:
+    raise column_identifier_error('Column 0 is not valid; columns are 1-based.')
+  if idx >= len(cnames):
+    raise column_identifier_error(
+      'Index %i is beyond the last named column, "%s" at index %i.'
+      % (idx, cnames[-1], len(cnames) - 1))
+  return idx
+
+#------------------------------------------------------------------------------
+def parse_column_identifiers(ids, cnames, zero_based=False):
+  '''
+  Returns the list of column indices selected by `ids`, a comma
+  separated list of column names, positions and position ranges
+  ("N-M" or "N:M", either end of which can be omitted), or all columns
+  if `ids` is empty. This is equivalent to csvkit's
+  `parse_column_identifiers`, but does not import `csvkit.cli`.
+  '''
+  if not ids:
+    return range(len(cnames))
+  ret = []
+  for ident in ids.split(','):
+    ident = ident.strip()
+    try:
+      ret.append(match_column_identifier(cnames, ident, zero_based))
+      continue
+    except Exception:
+      sep = ':' if ':' in ident else '-' if '-' in ident else None
+      if sep is None:
+        raise
+    start, end = ident.split(sep, 1)
+    try:
+      start = int(start) if start else 1
+      end   = int(end) + 1 if end else len(cnames)
+    except ValueError:
+      raise column_identifier_error(
+        'Invalid range %s. Ranges must be two integers separated by a - or'
+        ' : character.' % (ident,))
+    for idx in range(start, end):
+      ret.append(match_column_identifier(cnames, idx, zero_based))
+  return ret
 
 #------------------------------------------------------------------------------
 class CsvFilter(object):
-  def __init__(self, reader, modifiers, header=True):
+  def __init__(self, reader, modifiers, header=True, cnames=None,
+               window=1, options=None, rowno=0, final=True, stats=None):
     '''
     On-the-fly modifies CSV records coming from a csvkit reader object.
 
@@ -55,6 +126,9 @@ class CsvFilter(object):
 
       * function : takes a single string argument and returns a string
       * string : a sed-like modification specification.
+      * list : a sequence of functions and/or specifications that are
+        applied, in order, to the same cell (i.e. the output of one
+        modifier is the input to the next).
 
       Currently supported modification specifications:
 
@@ -84,18 +158,139 @@ class CsvFilter(object):
         itself. Only the "i" flag, indicating case-insensitive
         matching of `SRC`, is supported.
 
+      * Python expression: "p/EXPR/FLAGS"
+
+        Replaces the value with the result of python expression
+        `EXPR`, in which "v" is the value (converted to a number if it
+        is one), "s" is the value as a string, and other columns of
+        the same row are available by name (e.g. "Age * 2") or as
+        "row[COLUMN]" (see `P_modifier`). Only the "i" flag, which
+        leaves the value unchanged if the evaluation fails, is
+        supported.
+
       Note that the "/" character can be any character as long as it
       is used consistently and not used within the specification,
       e.g. ``s|a|b|`` is equivalent to ``s/a/b/``.
 
+      A specification can be prefixed with a sed-like address, in
+      which case it is only applied to the rows that the address
+      selects (the other rows are not modified):
+
+      * "N": data row number N (the first row after the header is 1)
+      * "N,M": data rows N through M, where M can be "$"
+      * "$": the last row
+      * "/REGEX/": rows in which the cell being modified matches REGEX
+      * "[COLUMN]/REGEX/": rows in which the cell in column COLUMN
+        (a name or a 1-based index, unless the "zero_based" option is
+        set) matches REGEX
+
+      Any address can be followed by "!" to select the rows that it
+      does not select. Regular expression addresses are matched
+      against the unmodified values, e.g. ``[Status]/^A-/s/,//g``.
+
     header : bool, optional, default: true
 
       If truthy (the default), then the first row will not be modified.
+
+    cnames : list, optional
+
+      The column names used to resolve named `modifiers` when `header`
+      is falsy (i.e. when the header row was already consumed from
+      `reader` by the caller).
+
+    window : int, optional, default: 1
+
+      The maximum number of rows to read ahead of the row being
+      returned. When greater than 1, modifiers that support pipelining
+      (i.e. that have `submit()` and `collect()` methods, such as the
+      "e" modifier) are fed values from up to `window` rows before
+      their first result is collected, which hides the latency of
+      external programs at the cost of no longer being strictly
+      one-row-in, one-row-out. In all cases, when more than one column
+      has such a modifier, each row\'s values are submitted to all of
+      them before any result is collected, so that the per-row latency
+      is that of the slowest one rather than the sum of all of them.
+
+    options : dict, optional
+
+      Keyword arguments passed to the constructor of each modifier
+      created from a specification string (see `spec2modifier`).
+
+    rowno : int, optional, default: 0
+
+      The number of data rows that precede the rows in `reader`, which
+      is used to number rows for addresses and error messages (e.g.
+      when `reader` is a chunk of a larger input).
+
+    final : bool, optional, default: true
+
+      Whether or not the last row of `reader` is the last row of the
+      input, i.e. the row selected by the "$" address.
+
+    stats : Stats, optional
+
+      If specified, the modifiers and the reader are instrumented to
+      record their number of calls, changed values and time spent into
+      this `Stats` object. When not specified, there is no overhead.
     '''
     self.reader    = reader
     self.header    = header
-    self.cnames    = None if not header else reader.next()
-    self.modifiers = standardize_modifiers(self.cnames, modifiers)
+    self.cnames    = cnames if not header else reader.next()
+    self.modifiers = standardize_modifiers(
+      self.cnames, modifiers, **(options or dict()))
+    self.stats     = stats
+    if stats is not None:
+      self.reader    = TimedReader(reader, stats.timer('read'))
+      self.modifiers = {
+        col: stats.instrument(self._cname(col), mod)
+        for col, mod in self.modifiers.items()}
+    self.window    = window
+    self.rowno     = rowno
+    self.final     = final
+    self.pending   = collections.deque()
+    self.pipelined = {
+      col: mod for col, mod in self.modifiers.items()
+      if hasattr(mod, 'submit') and hasattr(mod, 'collect')}
+    # note: even without read-ahead, the values of a row are submitted
+    #       to all of the pipelined modifiers before any result is
+    #       collected, so that e.g. the programs of several columns
+    #       run concurrently.
+    if self.window <= 1 and len(self.pipelined) < 2:
+      self.pipelined = None
+    # note: `conditional` maps the columns that are only modified in
+    #       addressed rows to their addresses, so that those columns
+    #       can be skipped entirely in the other rows.
+    self.addresses   = []
+    self.conditional = dict()
+    for col, mod in self.modifiers.items():
+      addrs, always = find_addresses(mod)
+      for addr in addrs:
+        addr.resolve(col, self.cnames)
+      self.addresses.extend(addrs)
+      addrs = [addr for addr in addrs if isinstance(addr, Address)]
+      if addrs and not always:
+        self.conditional[col] = addrs
+    # note: `width` is the number of leading columns that are used by
+    #       the modifiers and addresses (if known), i.e. the values
+    #       that a `RecordReader` needs to parse.
+    used = list(self.modifiers) + [addr.index for addr in self.addresses]
+    self.width = None
+    if used and all(isinstance(col, (int, long)) for col in used):
+      self.width = max(used) + 1
+    self.ahead = None
+    if any(addr.last for addr in self.addresses):
+      self.read = self._readAhead
+    else:
+      self.read = self._read
+    # note: `_nextRow` is selected (or generated) once, so that `next()`
+    #       does not need to check the mode of every row.
+    if self.pipelined:
+      self._nextRow = self._nextPipelined
+    elif self.addresses:
+      self._nextRow = self._nextAddressed
+    else:
+      self._nextRow = self._compile()
+    self._next = self._nextHeader if header else self._nextRow
 
   #----------------------------------------------------------------------------
   def __iter__(self):
@@ -103,16 +298,832 @@ class CsvFilter(object):
 
   #----------------------------------------------------------------------------
   def next(self):
+    return self._next()
+
+  #----------------------------------------------------------------------------
+  def _nextHeader(self):
+    self.header = False
+    self._next  = self._nextRow
+    return self.cnames
+
+  #----------------------------------------------------------------------------
+  def _nextAddressed(self):
+    row, last = self.read()
+    self.rowno += 1
+    try:
+      for col, mod in self._select(row, self.rowno, last):
+        row[col] = mod(row[col])
+    except CommandError as err:
+      self._reraise(err)
+    return row
+
+  #----------------------------------------------------------------------------
+  def _compile(self):
+    '''
+    Generates and compiles the function that reads and modifies the
+    next row when there are no addresses or pipelined modifiers, with
+    each column's modifier unrolled into a statement of its own, e.g.::
+
+      def nextRow():
+        row = read()
+        filter.rowno += 1
+        try:
+          row[0] = m0(row[0])
+          row[3] = m1(row[3])
+        except CommandError as err:
+          filter._reraise(err)
+        return row
+
+    The modifiers (or, for modifier objects, their bound `__call__`
+    methods, which avoids a lookup on every call) and the reader's
+    `next` method are bound to local names of the generated function.
+
+    Only `next()` benefits from this function, i.e. iterating over the
+    filter (as the command-line tool does with "--batch-size 1").
+    `iter_batches()` does not use it. It already amortizes the per-row
+    and per-cell overhead by applying each column's modifier to the
+    whole batch at once (see `modify_batch`).
+    '''
+    names = dict(
+      filter=self, read=self.reader.next, CommandError=CommandError)
+    body  = []
+    for idx, col in enumerate(sorted(self.modifiers)):
+      mod = self.modifiers[col]
+      if not isinstance(mod, (types.FunctionType, types.BuiltinFunctionType,
+                              types.MethodType)):
+        mod = mod.__call__
+      names['m%i' % (idx,)] = mod
+      body.append('      row[%r] = m%i(row[%r])' % (col, idx, col))
+    source = '\n'.join([
+      'def make(%s):' % (', '.join(sorted(names)),),
+      '  def nextRow():',
+      '    row = read()',
+      '    filter.rowno += 1',
+      '    try:',
+      ] + (body or ['      pass']) + [
+      '    except CommandError as err:',
+      '      filter._reraise(err)',
+      '    return row',
+      '  return nextRow',
+    ])
+    scope = dict()
+    exec compile(source, '<CsvFilter>', 'exec') in scope
+    return scope['make'](**names)
+
+  #----------------------------------------------------------------------------
+  def _nextPipelined(self):
+    # note: the addresses are evaluated when a row is read (i.e. when
+    #       its values are submitted), and their selection is restored
+    #       when the row is returned.
+    while self.reader is not None and len(self.pending) < self.window:
+      try:
+        row, last = self.read()
+      except StopIteration:
+        self.reader = None
+        break
+      items = self.modifiers.items()
+      selected = None
+      if self.addresses:
+        items = self._select(row, self.rowno + len(self.pending) + 1, last)
+        selected = [addr.selected for addr in self.addresses]
+      for col, mod in items:
+        if col in self.pipelined:
+          mod.submit(row[col])
+      self.pending.append((row, items, selected))
+    if not self.pending:
+      raise StopIteration
+    row, items, selected = self.pending.popleft()
+    self.rowno += 1
+    if selected is not None:
+      for addr, sel in itertools.izip(self.addresses, selected):
+        addr.selected = sel
+    try:
+      for col, mod in items:
+        if col in self.pipelined:
+          row[col] = mod.collect()
+        else:
+          row[col] = mod(row[col])
+    except CommandError as err:
+      self._reraise(err)
+    return row
+
+  #----------------------------------------------------------------------------
+  def iter_batches(self, size=256):
+    '''
+    Generates lists of up to `size` modified rows. Instead of calling
+    each modifier once per cell, each column\'s modifier is applied to
+    all of that column\'s values in the batch at once (see
+    `modify_batch`), which avoids most of the per-cell overhead of
+    `next()` and lets external program modifiers pipeline the whole
+    batch. If `header` is truthy, the header row is generated as a
+    batch of its own. Note that `next()` and `iter_batches()` should
+    not be mixed on the same object.
+    '''
     if self.header:
       self.header = False
-      return self.cnames
-    row = self.reader.next()
-    for col, mod in self.modifiers.items():
-      row[col] = mod(row[col])
-    return row
+      self._next  = self._nextRow
+      yield [self.cnames]
+    if any(isinstance(addr, ColumnReferences) for addr in self.addresses):
+      # note: the values of a "p" modifier\'s other columns are only
+      #       tracked for the current row, so such rows are modified
+      #       one at a time.
+      rows = iter(self._nextRow, None)
+      while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+          return
+        yield batch
+    read  = self.reader.next if not self.addresses else self.read
+    items = self.modifiers.items()
+    while True:
+      rows = []
+      try:
+        for idx in xrange(size):
+          rows.append(read())
+      except StopIteration:
+        pass
+      if not rows:
+        return
+      first = self.rowno + 1
+      self.rowno += len(rows)
+      if self.addresses:
+        rows, items = self._selectBatch(rows, first)
+      try:
+        for col, mod in items:
+          values = modify_batch(mod, [row[col] for row in rows])
+          for row, value in itertools.izip(rows, values):
+            row[col] = value
+      except CommandError as err:
+        index = getattr(err, 'index', None)
+        if index is None:
+          where = 'rows %i-%i' % (first, self.rowno)
+        else:
+          where = 'row %i' % (first + index,)
+        raise type(err)('%s: %s' % (where, err)), None, sys.exc_info()[2]
+      yield rows
+      if len(rows) < size:
+        return
+
+  #----------------------------------------------------------------------------
+  def close(self):
+    'Releases the resources (e.g. child processes) held by the modifiers.'
+    close_modifiers(self.modifiers.values())
+
+  #----------------------------------------------------------------------------
+  def _cname(self, col):
+    if self.cnames and 0 <= col < len(self.cnames):
+      return self.cnames[col]
+    return col
+
+  #----------------------------------------------------------------------------
+  def _read(self):
+    return (self.reader.next(), False)
+
+  #----------------------------------------------------------------------------
+  def _readAhead(self):
+    # note: reads one row ahead so that the last row can be identified.
+    if self.ahead is None:
+      self.ahead = [self.reader.next()]
+    if not self.ahead:
+      raise StopIteration
+    row = self.ahead.pop()
+    try:
+      self.ahead.append(self.reader.next())
+    except StopIteration:
+      pass
+    return (row, self.final and not self.ahead)
+
+  #----------------------------------------------------------------------------
+  def _select(self, row, rowno, last):
+    '''
+    Evaluates the addresses against `row` and returns the (column,
+    modifier) items that need to be applied to it.
+    '''
+    for addr in self.addresses:
+      addr.selected = addr.matches(row, rowno, last)
+    return [
+      (col, mod) for col, mod in self.modifiers.items()
+      if col not in self.conditional
+      or any(addr.selected for addr in self.conditional[col])]
+
+  #----------------------------------------------------------------------------
+  def _selectBatch(self, rows, first):
+    '''
+    Evaluates the addresses against each of the ``(row, last)`` tuples
+    in `rows` and returns a tuple of the plain rows and the (column,
+    modifier) items that need to be applied to the batch.
+    '''
+    for addr in self.addresses:
+      addr.selection = [
+        addr.matches(row, rowno, last)
+        for rowno, (row, last) in enumerate(rows, first)]
+    return (
+      [row for row, last in rows],
+      [(col, mod) for col, mod in self.modifiers.items()
+       if col not in self.conditional
+       or any(any(addr.selection) for addr in self.conditional[col])])
+
+  #----------------------------------------------------------------------------
+  def _reraise(self, err):
+    # note: `rowno` is the 1-based data row number (i.e. excluding the
+    #       header row).
+    raise type(err)('row %i: %s' % (self.rowno, err)), None, sys.exc_info()[2]
+
+#------------------------------------------------------------------------------
+class Stats(object):
+  '''
+  Collects performance statistics from `CsvFilter` objects created with
+  the `stats` parameter (and from anything else timed with `timer`).
+  The per-modifier statistics are available as the `modifiers` list of
+  `ModifierStats` objects and the other timings as the `timers` dict
+  of name => `Timer`; `as_dict()` and `format()` summarize both.
+  '''
+  def __init__(self):
+    super(Stats, self).__init__()
+    self.modifiers = []
+    self.timers    = collections.OrderedDict()
+    self._entries  = dict()
+  def timer(self, name):
+    'Returns the `Timer` named `name`, creating it if needed.'
+    if name not in self.timers:
+      self.timers[name] = Timer(name)
+    return self.timers[name]
+  def entry(self, column, name):
+    'Returns the `ModifierStats` for modifier `name` on `column`.'
+    key = (column, name)
+    if key not in self._entries:
+      self._entries[key] = ModifierStats(column, name)
+      self.modifiers.append(self._entries[key])
+    return self._entries[key]
+  def instrument(self, column, modifier):
+    '''
+    Returns a version of `modifier` (applied to `column`) that records
+    statistics into this object. Chains are instrumented per modifier,
+    and addressed modifiers only count the rows that they select.
+    '''
+    if isinstance(modifier, ModifierChain):
+      return ModifierChain(
+        [self.instrument(column, mod) for mod in modifier.modifiers])
+    if isinstance(modifier, AddressedModifier):
+      entry = self.entry(
+        column, modifier.address.spec + ' ' + modifier_name(modifier.modifier))
+      return AddressedModifier(
+        modifier.address, StatsModifier(modifier.modifier, entry))
+    return StatsModifier(modifier, self.entry(column, modifier_name(modifier)))
+  def as_dict(self):
+    return dict(
+      timers    = [timer.as_dict() for timer in self.timers.values()],
+      modifiers = [entry.as_dict() for entry in self.modifiers],
+    )
+  def format(self):
+    'Returns a human-readable table of the statistics.'
+    lines = []
+    for timer in self.timers.values():
+      lines.append('%-8s %10i calls %10.3fs' % (timer.name, timer.calls, timer.seconds))
+    if self.modifiers:
+      lines.append('%-12s %-32s %10s %10s %10s %10s' % (
+        'column', 'modifier', 'calls', 'changed', 'unchanged', 'seconds'))
+      for entry in self.modifiers:
+        lines.append('%-12s %-32s %10i %10i %10i %10.3f' % (
+          entry.column, entry.name, entry.calls, entry.changed,
+          entry.unchanged, entry.seconds))
+    return '\n'.join(lines) + '\n'
+
+#------------------------------------------------------------------------------
+class Timer(object):
+  'Accumulates the number of calls and the total time of an operation.'
+  def __init__(self, name):
+    super(Timer, self).__init__()
+    self.name    = name
+    self.calls   = 0
+    self.seconds = 0.0
+  def wrap(self, func):
+    'Returns a version of function `func` whose calls are timed.'
+    def timed(*args, **kw):
+      start = time.time()
+      try:
+        return func(*args, **kw)
+      finally:
+        self.calls   += 1
+        self.seconds += time.time() - start
+    return timed
+  def as_dict(self):
+    return dict(name=self.name, calls=self.calls, seconds=self.seconds)
+
+#------------------------------------------------------------------------------
+class TimedReader(object):
+  'Times the calls to `next()` of `reader` with `timer`.'
+  def __init__(self, reader, timer):
+    super(TimedReader, self).__init__()
+    self.reader = reader
+    self.timed  = timer.wrap(reader.next)
+  def __iter__(self):
+    return self
+  def next(self):
+    return self.timed()
+
+#------------------------------------------------------------------------------
+class ModifierStats(object):
+  'The statistics of a single modifier applied to a single column.'
+  def __init__(self, column, name):
+    super(ModifierStats, self).__init__()
+    self.column  = column
+    self.name    = name
+    self.calls   = 0
+    self.changed = 0
+    self.seconds = 0.0
+  @property
+  def unchanged(self):
+    return self.calls - self.changed
+  def as_dict(self):
+    return dict(
+      column=self.column, modifier=self.name, calls=self.calls,
+      changed=self.changed, unchanged=self.unchanged, seconds=self.seconds)
+
+#------------------------------------------------------------------------------
+class StatsModifier(object):
+  '''
+  Applies `modifier`, recording the number of values, how many of them
+  were changed and the time spent into the `ModifierStats` `entry`.
+  For pipelined modifiers, the time spent waiting in `collect()` (e.g.
+  for an external program) is included.
+  '''
+  def __init__(self, modifier, entry):
+    super(StatsModifier, self).__init__()
+    self.modifier = modifier
+    self.entry    = entry
+    if hasattr(modifier, 'submit') and hasattr(modifier, 'collect'):
+      self.pending = collections.deque()
+      self.submit  = self._submit
+      self.collect = self._collect
+  def __call__(self, value):
+    start  = time.time()
+    result = self.modifier(value)
+    entry  = self.entry
+    entry.seconds += time.time() - start
+    entry.calls   += 1
+    if result != value:
+      entry.changed += 1
+    return result
+  def batch(self, values):
+    start   = time.time()
+    results = modify_batch(self.modifier, values)
+    entry   = self.entry
+    entry.seconds += time.time() - start
+    entry.calls   += len(values)
+    entry.changed += sum(
+      1 for value, result in itertools.izip(values, results) if result != value)
+    return results
+  def _submit(self, value):
+    start = time.time()
+    self.modifier.submit(value)
+    self.entry.seconds += time.time() - start
+    self.pending.append(value)
+  def _collect(self):
+    start  = time.time()
+    result = self.modifier.collect()
+    value  = self.pending.popleft()
+    entry  = self.entry
+    entry.seconds += time.time() - start
+    entry.calls   += 1
+    if result != value:
+      entry.changed += 1
+    return result
+  def close(self):
+    close_modifiers([self.modifier])
+
+#------------------------------------------------------------------------------
+def modifier_name(modifier):
+  'Returns a short description of `modifier` (e.g. its specification).'
+  if isinstance(modifier, CachedModifier):
+    return modifier_name(modifier.modifier) + ' [cached]'
+  if isinstance(modifier, UnicodeModifier):
+    return modifier_name(modifier.modifier)
+  if isinstance(modifier, FusedModifier):
+    return ' '.join(modifier_name(mod) for mod in modifier.modifiers)
+  return getattr(modifier, 'spec', None) \
+    or getattr(modifier, '__name__', None) or type(modifier).__name__
+
+#------------------------------------------------------------------------------
+class ParallelCsvFilter(object):
+  def __init__(self, stream, modifiers, jobs=None, header=True, cnames=None,
+               chunksize=1048576, window=None,
+               reader_kwargs=None, writer_kwargs=None, options=None,
+               passthrough=False, partial=False):
+    '''
+    Applies `modifiers` to the CSV records in file-like object `stream`
+    using a pool of `jobs` worker processes. The input is split into
+    record-aligned chunks of approximately `chunksize` bytes, each of
+    which is parsed, modified and serialized by a worker; the
+    serialized chunks are then yielded (by iterating over this object)
+    in the original order.
+
+    Note that since the modifiers are compiled in each worker process,
+    `modifiers` must be picklable (which is always the case for
+    specification strings, but not necessarily for functions). Also
+    note that records are split by counting quote characters, so
+    `stream` must use an ASCII-compatible encoding.
+
+    :Parameters:
+
+    stream : file
+
+      The CSV byte stream to read from - must support `readline()`.
+
+    modifiers : { list, dict }
+
+      See `CsvFilter`.
+
+    jobs : int, optional, default: the number of CPUs
+
+      The number of worker processes.
+
+    header : bool, optional, default: true
+
+      If truthy (the default), then the first record is emitted
+      unmodified and its values are used to resolve named modifiers.
+
+    cnames : list, optional
+
+      See `CsvFilter`.
+
+    chunksize : int, optional, default: 1048576
+
+      The approximate number of bytes sent to a worker at a time.
+
+    window : int, optional, default: 2 * `jobs`
+
+      The maximum number of chunks being processed at any given time,
+      which bounds the amount of memory used.
+
+    reader_kwargs : dict, optional
+
+      Keyword arguments for the csvkit reader used in the workers.
+
+    writer_kwargs : dict, optional
+
+      Keyword arguments for the csvkit writer used in the workers.
+
+    options : dict, optional
+
+      See `CsvFilter`.
+
+    passthrough : bool, optional, default: false
+
+      If truthy, records in which no value is modified are output as
+      their original bytes (see `PassthroughWriter`) instead of being
+      re-serialized.
+
+    partial : bool, optional, default: false
+
+      If truthy, only the leading values that the modifiers use are
+      parsed (see `RecordReader`).
+    '''
+    import multiprocessing
+    self.stream        = stream
+    self.modifiers     = modifiers
+    self.jobs          = jobs or multiprocessing.cpu_count()
+    self.header        = header
+    self.cnames        = cnames
+    self.chunksize     = chunksize
+    self.window        = window or 2 * self.jobs
+    self.reader_kwargs = reader_kwargs or dict()
+    self.writer_kwargs = writer_kwargs or dict()
+    self.options       = options or dict()
+    self.passthrough   = passthrough
+    self.partial       = partial
+    self.quotechar     = self.reader_kwargs.get('quotechar') or '"'
+
+  #----------------------------------------------------------------------------
+  def __iter__(self):
+    import csvkit, multiprocessing
+    records = iter_records(self.stream, self.quotechar)
+    if self.header:
+      record = next(records, None)
+      if record is None:
+        return
+      self.cnames = csvkit.CSVKitReader(
+        StringIO(record), **self.reader_kwargs).next()
+      if self.passthrough:
+        yield record
+      else:
+        yield _serialize([self.cnames], self.writer_kwargs)
+    pool = multiprocessing.Pool(
+      self.jobs, _parallel_init,
+      (self.modifiers, self.cnames, self.reader_kwargs, self.writer_kwargs,
+       self.options, self.passthrough, self.partial))
+    # note: each chunk is submitted along with the number of records
+    #       that precede it and whether it is the last chunk (which is
+    #       only known once the next one has been read), so that row
+    #       addresses select the same rows as in serial mode.
+    counter = [0]
+    def count(records):
+      for record in records:
+        counter[0] += 1
+        yield record
+    try:
+      pending = collections.deque()
+      held    = None
+      rowno   = 0
+      for chunk in iter_chunks(count(records), self.chunksize):
+        if held is not None:
+          if len(pending) >= self.window:
+            yield pending.popleft().get()
+          pending.append(pool.apply_async(_parallel_filter, held + (False,)))
+        held  = (chunk, rowno)
+        rowno = counter[0]
+      if held is not None:
+        pending.append(pool.apply_async(_parallel_filter, held + (True,)))
+      while pending:
+        yield pending.popleft().get()
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+  #----------------------------------------------------------------------------
+  def write(self, output):
+    'Writes all of the serialized records to file-like object `output`.'
+    for data in self:
+      output.write(data)
+
+#------------------------------------------------------------------------------
+_parallel_state = None
+
+def _parallel_init(modifiers, cnames, reader_kwargs, writer_kwargs, options,
+                   passthrough, partial):
+  global _parallel_state
+  import multiprocessing.util
+  modifiers = standardize_modifiers(cnames, modifiers, **options)
+  _parallel_state = (
+    modifiers, cnames, reader_kwargs, writer_kwargs, passthrough, partial,
+    options.get('bytes_mode', False))
+  multiprocessing.util.Finalize(
+    None, close_modifiers, (modifiers.values(),), exitpriority=10)
+
+def _parallel_filter(chunk, rowno, final):
+  import csvkit
+  modifiers, cnames, reader_kwargs, writer_kwargs, passthrough, partial, \
+    bytes_mode = _parallel_state
+  if passthrough or partial:
+    kwargs = dict(reader_kwargs, encoding=None) if bytes_mode else reader_kwargs
+    source = RecordReader(StringIO(chunk), **kwargs)
+  elif bytes_mode:
+    source = bytes_reader(StringIO(chunk), **reader_kwargs)
+  else:
+    source = csvkit.CSVKitReader(StringIO(chunk), **reader_kwargs)
+  reader = CsvFilter(
+    source, modifiers, header=False, cnames=cnames, rowno=rowno, final=final)
+  if partial:
+    source.limit = reader.width
+  return _serialize(reader, writer_kwargs, passthrough, partial, bytes_mode)
+
+def _serialize(rows, writer_kwargs, passthrough=False, partial=False,
+               bytes_mode=False):
+  import csvkit
+  buf = StringIO()
+  if bytes_mode:
+    writer = BytesWriter(buf, **writer_kwargs)
+  else:
+    writer = csvkit.CSVKitWriter(buf, **writer_kwargs)
+  if passthrough or partial:
+    writer = PassthroughWriter(writer, buf, unchanged=passthrough)
+  writer.writerows(rows)
+  return buf.getvalue()
+
+#------------------------------------------------------------------------------
+def iter_records(stream, quotechar='"'):
+  '''
+  Generates the raw CSV records in file-like object `stream`, where a
+  record may span multiple lines if a quoted value contains newlines.
+  '''
+  parts = []
+  odd   = False
+  for line in iter(stream.readline, ''):
+    parts.append(line)
+    if line.count(quotechar) % 2:
+      odd = not odd
+    if not odd:
+      yield ''.join(parts)
+      parts = []
+  if parts:
+    yield ''.join(parts)
+
+#------------------------------------------------------------------------------
+def iter_chunks(records, size):
+  '''
+  Groups the raw CSV `records` into chunks of approximately `size`
+  bytes, never splitting a record.
+  '''
+  parts  = []
+  length = 0
+  for record in records:
+    parts.append(record)
+    length += len(record)
+    if length >= size:
+      yield ''.join(parts)
+      parts  = []
+      length = 0
+  if parts:
+    yield ''.join(parts)
+
+#------------------------------------------------------------------------------
+class Record(list):
+  '''
+  A row (list of values) as read by `RecordReader`, which also holds
+  the `raw` bytes of the record and the `original` values, so that
+  `PassthroughWriter` can tell whether or not the row was modified,
+  and the unparsed `tail` of the record (see `RecordReader`).
+  '''
+  __slots__ = ('raw', 'original', 'tail')
+
+#------------------------------------------------------------------------------
+class RecordReader(object):
+  '''
+  Reads CSV records from the byte stream `stream` (which only needs to
+  support `readline`) and returns them as `Record` objects of unicode
+  values decoded from `encoding`, which must be ASCII-compatible (or,
+  if `encoding` is ``None``, of byte string values). The keyword
+  arguments `kwargs` are passed to `csv.reader`.
+
+  If `limit` is set (it can be changed between records, e.g. after
+  the header row was read), only the first `limit` values of each
+  record are parsed; the rest of the record, starting with the
+  delimiter that follows the last parsed value and excluding the line
+  terminator, is kept as the record\'s raw `tail`. Records that the
+  fast field scanner cannot handle (e.g. text following a closing
+  quote) are parsed completely.
+  '''
+  def __init__(self, stream, encoding='utf-8', limit=None, **kwargs):
+    self.stream   = stream
+    self.lines    = []
+    self.kwargs   = kwargs
+    self.reader   = csv.reader(self._readlines(stream), **kwargs)
+    self.encoding = encoding
+    self.limit    = limit
+    self.records  = None
+    delim = re.escape(kwargs.get('delimiter', ','))
+    quote = re.escape(kwargs.get('quotechar', '"'))
+    self.field = re.compile(
+      r'(?:%(q)s([^%(q)s]*(?:%(q)s%(q)s[^%(q)s]*)*)%(q)s|(?!%(q)s)([^%(d)s\r\n]*))'
+      r'(%(d)s|\r\n|\n|\r|\Z)' % dict(d=delim, q=quote))
+    self.quote = kwargs.get('quotechar', '"')
+  def _readlines(self, stream):
+    # note: `csv.reader` never reads beyond the last line of a record,
+    #       so the lines collected during a `next()` call are exactly
+    #       that record's bytes.
+    lines = self.lines
+    for line in iter(stream.readline, ''):
+      lines.append(line)
+      yield line
+  def __iter__(self):
+    return self
+  def next(self):
+    if self.limit is not None:
+      return self._nextPartial()
+    del self.lines[:]
+    encoding = self.encoding
+    values   = self.reader.next()
+    if encoding is not None:
+      values = [unicode(value, encoding) for value in values]
+    ret = Record(values)
+    ret.raw      = ''.join(self.lines)
+    ret.original = values
+    ret.tail     = ''
+    return ret
+  def _nextPartial(self):
+    if self.records is None:
+      self.records = iter_records(self.stream, self.quote)
+    record = self.records.next()
+    values = []
+    pos    = 0
+    match  = self.field.match
+    double = self.quote * 2
+    tail   = ''
+    # note: as with the csv module, blank lines are empty rows.
+    while record.rstrip('\r\n'):
+      res = match(record, pos)
+      if res is None:
+        # note: falling back to the csv module for malformed records
+        values = csv.reader(record.splitlines(True), **self.kwargs).next()
+        break
+      quoted, plain, sep = res.groups()
+      if quoted is not None:
+        values.append(quoted.replace(double, self.quote))
+      else:
+        values.append(plain)
+      pos = res.end()
+      if sep in ('', '\n', '\r\n', '\r'):
+        break
+      if len(values) >= self.limit:
+        tail = record[pos - len(sep):].rstrip('\r\n')
+        break
+    encoding = self.encoding
+    if encoding is not None:
+      values = [unicode(value, encoding) for value in values]
+    ret = Record(values)
+    ret.raw      = record
+    ret.original = values
+    ret.tail     = tail
+    return ret
+  @property
+  def line_num(self):
+    return self.reader.line_num
+
+#------------------------------------------------------------------------------
+class PassthroughWriter(object):
+  '''
+  Wraps the CSV `writer` of file-like object `stream` so that the raw
+  bytes of the `Record` objects read by a `RecordReader` are written
+  as-is where possible: if `unchanged` is truthy (the default), rows
+  whose values were all left unchanged are written as their original
+  bytes instead of being re-serialized (which would normalize their
+  quoting and line terminators), and the unparsed `tail` of partially
+  parsed rows is appended to their serialized values. The output
+  encoding (UTF-8) and CSV dialect of `writer` must therefore match
+  those of the input.
+  '''
+  def __init__(self, writer, stream, unchanged=True):
+    self.writer    = writer
+    self.stream    = stream
+    self.unchanged = unchanged
+    self.buffer    = StringIO()
+    # note: the line terminator determines which values get quoted, and
+    #       a row with a single empty value is written as '""', so the
+    #       head is written with an extra empty value, which is stripped
+    #       along with the line terminator before the tail.
+    self.head      = csv.writer(self.buffer, lineterminator='\n')
+  def writerow(self, row):
+    if not isinstance(row, Record):
+      return self.writer.writerow(row)
+    if self.unchanged and row == row.original:
+      return self.stream.write(row.raw)
+    if not row.tail:
+      return self.writer.writerow(row)
+    self.buffer.seek(0)
+    self.buffer.truncate()
+    self.head.writerow([encode_value(value) for value in row] + [''])
+    self.stream.write(self.buffer.getvalue()[:-2] + row.tail + '\n')
+  def writerows(self, rows):
+    for row in rows:
+      self.writerow(row)
 
 #------------------------------------------------------------------------------
-def standardize_modifiers(cnames, modifiers):
+def as_text(value):
+  'Returns `value` decoded from UTF-8 if it is a byte string.'
+  return value.decode('utf-8') if isinstance(value, str) else value
+
+def encode_value(value):
+  '''
+  Returns `value` as a UTF-8 byte string for writing to a CSV file,
+  with ``None`` as an empty string and embedded "\\r" characters
+  converted to "\\n" (as csvkit\'s writer does).
+  '''
+  if value is None:
+    return ''
+  if isinstance(value, unicode):
+    value = value.encode('utf-8')
+  elif not isinstance(value, str):
+    value = str(value)
+  return value.replace('\r', '\n')
+
+#------------------------------------------------------------------------------
+def bytes_reader(stream, encoding=None, **kwargs):
+  '''
+  Returns a CSV reader of the records in the byte stream `stream` (which
+  only needs to support `readline`) that returns their values as byte
+  strings, i.e. without decoding them (see the `bytes_mode` option of
+  `spec2modifier`). The `encoding` is ignored, so that csvkit reader
+  keyword arguments can be used; the other keyword arguments `kwargs`
+  are passed to `csv.reader`.
+  '''
+  return csv.reader(iter(stream.readline, ''), **kwargs)
+
+#------------------------------------------------------------------------------
+class BytesWriter(object):
+  '''
+  Writes rows of byte string values (as read by `bytes_reader`) to
+  file-like object `stream` as CSV, without re-encoding them, but
+  otherwise like csvkit\'s writer (see `encode_value`). The keyword
+  arguments `kwargs` are passed to `csv.writer`.
+  '''
+  def __init__(self, stream, **kwargs):
+    kwargs.setdefault('lineterminator', '\n')
+    self.writer = csv.writer(stream, **kwargs)
+  def writerow(self, row):
+    self.writer.writerow([
+      value.replace('\r', '\n') if type(value) is str else encode_value(value)
+      for value in row])
+  def writerows(self, rows):
+    self.writer.writerows(
+      [value.replace('\r', '\n') if type(value) is str else encode_value(value)
+       for value in row]
+      for row in rows)
+
+#------------------------------------------------------------------------------
+def standardize_modifiers(cnames, modifiers, **options):
   # TODO: csvkit.grep.standardize_patterns could be refactored to support
   #       this process here as well...
   try:
@@ -120,8 +1131,8 @@ def standardize_modifiers(cnames, modifiers):
     modifiers = {k: v for k, v in modifiers.items() if v}
   except AttributeError:
     # Fallback to sequence of modifiers
-    return {i: spec2modifier(v) for i, v in enumerate(modifiers) if v}
-  modifiers = {k: spec2modifier(v) for k, v in modifiers.items()}
+    return {i: spec2modifier(v, **options) for i, v in enumerate(modifiers) if v}
+  modifiers = {k: spec2modifier(v, **options) for k, v in modifiers.items()}
   if not cnames:
     return modifiers
   p2 = {}
@@ -129,7 +1140,7 @@ def standardize_modifiers(cnames, modifiers):
     if k in cnames:
       idx = cnames.index(k)
       if idx in modifiers:
-        raise ColumnIdentifierError(
+        raise column_identifier_error(
           'Column %s has index %i which already has a pattern.' % (k,idx))
       p2[idx] = modifiers[k]
     else:
@@ -137,31 +1148,717 @@ def standardize_modifiers(cnames, modifiers):
   return p2
 
 #------------------------------------------------------------------------------
-def spec2modifier(obj):
+def spec2modifier(obj, cache_size=None, cache_memory=None, **options):
+  '''
+  Converts `obj` into a modifier (see `CsvFilter` for the supported
+  formats). The keyword arguments `options` are passed to the
+  constructor of each modifier created from a specification string;
+  each modifier type picks the options that it supports and ignores
+  the others.
+
+  If `cache_size` (the maximum number of entries) or `cache_memory`
+  (the approximate maximum number of bytes) is specified, the
+  resulting modifier is wrapped in a `CachedModifier`, which is only
+  appropriate if the modifier always returns the same output for the
+  same input. (For specifications with an address, the cache wraps
+  the modifier within the `AddressedModifier`.)
+
+  If the `bytes_mode` option is truthy, the values are UTF-8 byte
+  strings instead of unicode strings (see `bytes_reader`). Modifiers
+  that can work on the bytes directly, with the same result, do so
+  (e.g. "s" modifiers whose patterns cannot match part of a multi-byte
+  character); the others are wrapped in a `UnicodeModifier`. Function
+  modifiers are always given the values as-is.
+  '''
   # obj is function
   if hasattr(obj, '__call__'):
-    return obj
+    mod = obj
+  # obj is a sequence of modifiers to be applied in order
+  elif isinstance(obj, (list, tuple)):
+    mods = fuse_modifiers([spec2modifier(mod, **options) for mod in obj if mod])
+    mod  = mods[0] if len(mods) == 1 else ModifierChain(mods)
   # obj is a specification string
-  return eval(obj[0].upper() + '_modifier')(obj)
+  else:
+    address, spec = Address.parse(obj, **options)
+    if not spec:
+      raise InvalidModifierSpec(obj)
+    mod = eval(spec[0].upper() + '_modifier')(spec, **options)
+    if options.get('bytes_mode') and not getattr(mod, 'bytes_mode', False):
+      mod = UnicodeModifier(mod)
+    if address is not None:
+      mod = AddressedModifier(address, mod)
+  if cache_size or cache_memory:
+    mod = cache_modifier(mod, size=cache_size, memory=cache_memory)
+  return mod
+
+#------------------------------------------------------------------------------
+def cache_modifier(modifier, size=None, memory=None):
+  '''
+  Wraps `modifier` in a `CachedModifier`. Since the result of an
+  `AddressedModifier` depends on the row, the modifiers within it
+  (and within chains that contain one) are wrapped instead; "p"
+  modifiers that refer to other columns are not cached at all.
+  '''
+  if isinstance(modifier, AddressedModifier):
+    modifier.modifier = cache_modifier(modifier.modifier, size, memory)
+    return modifier
+  if isinstance(modifier, (P_modifier, UnicodeModifier)) \
+      and find_addresses(modifier)[0]:
+    # the result also depends on the other columns
+    return modifier
+  if isinstance(modifier, ModifierChain) and find_addresses(modifier)[0]:
+    modifier.modifiers = [
+      cache_modifier(mod, size, memory) for mod in modifier.modifiers]
+    return modifier
+  return CachedModifier(modifier, size=size, memory=memory)
+
+#------------------------------------------------------------------------------
+class ModifierChain(object):
+  '''
+  Applies a sequence of modifiers, in order, to a single value. If one
+  of them supports pipelining (see `CsvFilter`), so does the chain:
+  the modifiers that precede the first such modifier are applied when
+  a value is submitted, and the others when its result is collected.
+  '''
+  def __init__(self, modifiers):
+    super(ModifierChain, self).__init__()
+    self.modifiers = list(modifiers)
+    for idx, mod in enumerate(self.modifiers):
+      if hasattr(mod, 'submit') and hasattr(mod, 'collect'):
+        self.head    = self.modifiers[:idx]
+        self.pipe    = mod
+        self.tail    = self.modifiers[idx + 1:]
+        self.submit  = self._submit
+        self.collect = self._collect
+        break
+  def __call__(self, value):
+    for mod in self.modifiers:
+      value = mod(value)
+    return value
+  def batch(self, values):
+    for mod in self.modifiers:
+      values = modify_batch(mod, values)
+    return values
+  def _submit(self, value):
+    for mod in self.head:
+      value = mod(value)
+    self.pipe.submit(value)
+  def _collect(self):
+    value = self.pipe.collect()
+    for mod in self.tail:
+      value = mod(value)
+    return value
+  def close(self):
+    close_modifiers(self.modifiers)
+
+#------------------------------------------------------------------------------
+class Address(object):
+  '''
+  A sed-like row address (see `CsvFilter` for the syntax), which is
+  parsed from the start of a modifier specification by `parse`. Before
+  the modifiers are applied to a row, `CsvFilter` sets the `selected`
+  attribute (or, for batches, the `selection` list) of each address
+  to whether or not it selects that row (or each row in the batch).
+  '''
+  SPEC = re.compile(r'''
+    ^(?:
+        (?P<first>\d+)(?:,(?P<end>\d+|\$))?
+      | (?P<last>\$)
+      | (?:\[(?P<column>[^\]]+)\])?/(?P<regex>(?:[^/\\]|\\.)*)/
+    )(?P<negate>!?)\s*
+    ''', re.VERBOSE)
+  def __init__(self, first=None, end=None, last=False, column=None,
+               regex=None, negate=False, zero_based=False, bytes_mode=False):
+    super(Address, self).__init__()
+    self.first      = first
+    self.end        = end if end is not None and end >= first else first
+    self.last       = last
+    self.column     = column
+    self.regex      = None
+    self.decode     = False
+    if regex is not None:
+      self.regex, self.decode = compile_pattern(regex, 0, bytes_mode)
+    self.negate     = negate
+    self.zero_based = zero_based
+    self.spec       = None
+    self.index      = None
+    self.selected   = False
+    self.selection  = []
+  @classmethod
+  def parse(cls, spec, zero_based=False, bytes_mode=False, **options):
+    '''
+    Splits the modifier specification `spec` into a tuple of
+    ``(ADDRESS, SPEC)``, where ADDRESS is ``None`` if `spec` does not
+    start with an address.
+    '''
+    match = cls.SPEC.match(spec)
+    if not match:
+      return (None, spec)
+    first, end = match.group('first'), match.group('end')
+    address = cls(
+      first      = int(first) if first is not None else None,
+      end        = ( sys.maxint if end == '$'
+                     else int(end) if end is not None else None ),
+      last       = bool(match.group('last')),
+      column     = match.group('column'),
+      regex      = match.group('regex'),
+      negate     = bool(match.group('negate')),
+      zero_based = zero_based,
+      bytes_mode = bytes_mode)
+    address.spec = spec[:match.end()].strip()
+    return (address, spec[match.end():])
+  def resolve(self, col, cnames):
+    '''
+    Resolves the column that a regex address is matched against, where
+    `col` is the index of the column being modified and `cnames` is
+    the list of column names (or ``None`` if not known).
+    '''
+    if self.column is None:
+      self.index = col
+    elif cnames is None:
+      self.index = int(self.column) - ( 0 if self.zero_based else 1 )
+    else:
+      self.index = match_column_identifier(cnames, self.column, self.zero_based)
+  def matches(self, row, rowno, last):
+    '''
+    Returns whether or not this address selects `row`, which is data
+    row number `rowno` and, if `last` is truthy, the last row.
+    '''
+    if self.regex is not None:
+      value = row[self.index]
+      if self.decode:
+        value = as_text(value)
+      ret = self.regex.search(value) is not None
+    elif self.last:
+      ret = last
+    else:
+      ret = self.first <= rowno <= self.end
+    return ret != self.negate
+
+#------------------------------------------------------------------------------
+class AddressedModifier(object):
+  '''
+  Applies `modifier` only to the values of the rows selected by
+  `address`; the values of the other rows are returned unchanged.
+  '''
+  def __init__(self, address, modifier):
+    super(AddressedModifier, self).__init__()
+    self.address  = address
+    self.modifier = modifier
+    if hasattr(modifier, 'submit') and hasattr(modifier, 'collect'):
+      self.pending = collections.deque()
+      self.submit  = self._submit
+      self.collect = self._collect
+  def __call__(self, value):
+    if not self.address.selected:
+      return value
+    return self.modifier(value)
+  def batch(self, values):
+    idxs = [idx for idx, sel in enumerate(self.address.selection) if sel]
+    if not idxs:
+      return values
+    if len(idxs) == len(values):
+      return modify_batch(self.modifier, values)
+    values = list(values)
+    try:
+      results = modify_batch(self.modifier, [values[idx] for idx in idxs])
+    except CommandError as err:
+      if getattr(err, 'index', None) is not None:
+        err.index = idxs[err.index]
+      raise
+    for idx, value in itertools.izip(idxs, results):
+      values[idx] = value
+    return values
+  def _submit(self, value):
+    # note: unselected values are queued as-is so that `collect` returns
+    #       the results in submission order.
+    if self.address.selected:
+      self.modifier.submit(value)
+      self.pending.append(None)
+    else:
+      self.pending.append((value,))
+  def _collect(self):
+    item = self.pending.popleft()
+    if item is None:
+      return self.modifier.collect()
+    return item[0]
+  def close(self):
+    close_modifiers([self.modifier])
+
+#------------------------------------------------------------------------------
+def fuse_modifiers(modifiers):
+  '''
+  Returns a copy of the list `modifiers` in which each run of
+  consecutive `S_modifier` objects that can be applied in a single
+  pass is replaced with a `FusedModifier`. A substitution can only be
+  fused if it is global, case-sensitive, has a literal replacement and
+  a pattern that only matches a small set of literal strings (see
+  `substitution_literals`). Furthermore, so that the result is the
+  same as applying the substitutions in order, none of the patterns
+  in a run may overlap each other or the replacement of a preceding
+  substitution in the same run (or, if that replacement is empty, be
+  longer than one character).
+  '''
+  ret  = []
+  run  = []
+  def flush():
+    if len(run) > 1:
+      ret.append(FusedModifier([mod for mod, lits in run]))
+    else:
+      ret.extend([mod for mod, lits in run])
+    del run[:]
+  for mod in modifiers:
+    lits = substitution_literals(mod)
+    if lits is None:
+      flush()
+      ret.append(mod)
+      continue
+    for pmod, plits in run:
+      if any(_overlaps(lit, plit) for lit in lits for plit in plits) \
+          or any(_overlaps(lit, pmod.repl) if pmod.repl else len(lit) > 1
+                 for lit in lits):
+        flush()
+        break
+    run.append((mod, lits))
+  flush()
+  return ret
+
+#------------------------------------------------------------------------------
+def substitution_literals(modifier):
+  '''
+  Returns the list of literal strings matched by `modifier` if it is an
+  `S_modifier` that is eligible for fusion (see `fuse_modifiers`),
+  otherwise ``None``. Patterns built from literals, character sets
+  and alternations are expanded into the (at most 256) strings that
+  they can match.
+  '''
+  if not isinstance(modifier, S_modifier) or modifier.count != 0 \
+      or '\\' in modifier.repl:
+    return None
+  regex = modifier.regex
+  try:
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+  except Exception:
+    return None
+  if parsed.pattern.flags & re.IGNORECASE:
+    return None
+  char = unichr if isinstance(regex.pattern, unicode) else chr
+  # note: the strings are enumerated in the order in which the regex
+  #       engine would try them, so that an alternation of them matches
+  #       the same string at any given position.
+  def expand(seq):
+    ret = ['']
+    for op, av in seq:
+      if op == sre_constants.LITERAL:
+        alts = [char(av)]
+      elif op == sre_constants.IN \
+          and all(iop == sre_constants.LITERAL for iop, iav in av):
+        alts = [char(iav) for iop, iav in av]
+      elif op == sre_constants.BRANCH:
+        alts = []
+        for alt in av[1]:
+          alt = expand(alt)
+          if alt is None:
+            return None
+          alts.extend(alt)
+      elif op == sre_constants.SUBPATTERN:
+        alts = expand(av[-1])
+        if alts is None:
+          return None
+      else:
+        return None
+      ret = [head + tail for head in ret for tail in alts]
+      if len(ret) > 256:
+        return None
+    return ret
+  lits = expand(parsed)
+  if not lits or '' in lits:
+    return None
+  return lits
+
+#------------------------------------------------------------------------------
+def _overlaps(a, b):
+  if a in b or b in a:
+    return True
+  for size in range(1, min(len(a), len(b))):
+    if a[-size:] == b[:size] or b[-size:] == a[:size]:
+      return True
+  return False
+
+#------------------------------------------------------------------------------
+class FusedModifier(object):
+  '''
+  Applies a sequence of literal `S_modifier` substitutions in a single
+  scan of each value by combining their patterns into one alternation
+  and dispatching each match to its replacement. See `fuse_modifiers`
+  for the conditions under which this is equivalent to applying the
+  substitutions in order.
+  '''
+  def __init__(self, modifiers):
+    super(FusedModifier, self).__init__()
+    self.modifiers = list(modifiers)
+    self.table     = dict()
+    lits = []
+    for mod in self.modifiers:
+      for lit in substitution_literals(mod):
+        if lit not in self.table:
+          self.table[lit] = mod.repl
+          lits.append(lit)
+    self.regex = re.compile('|'.join(re.escape(lit) for lit in lits))
+    self.repl  = lambda match: self.table[match.group()]
+  def __call__(self, value):
+    return self.regex.sub(self.repl, value)
+  def batch(self, values):
+    sub, repl = self.regex.sub, self.repl
+    return [sub(repl, value) for value in values]
+
+#------------------------------------------------------------------------------
+def modify_batch(modifier, values):
+  '''
+  Applies `modifier` to each value in the list `values` and returns the
+  list of results. Modifiers can optionally implement a `batch(values)`
+  method that does this more efficiently than calling the modifier once
+  per value; modifiers that support pipelining (see `CsvFilter`) have
+  all of `values` submitted before any result is collected.
+
+  If a `CommandError` is raised, its `index` attribute is set to the
+  index of the value that failed (unless the modifier\'s `batch` method
+  already set it) so that callers can report exactly which row failed.
+  '''
+  batch = getattr(modifier, 'batch', None)
+  if batch is not None:
+    return batch(values)
+  ret = []
+  if hasattr(modifier, 'submit') and hasattr(modifier, 'collect'):
+    for value in values:
+      modifier.submit(value)
+    results = (modifier.collect() for value in values)
+  else:
+    results = itertools.imap(modifier, values)
+  # note: `list.extend` keeps the results that precede a failure, so
+  #       their count is the index of the value that failed.
+  try:
+    ret.extend(results)
+  except CommandError as err:
+    if getattr(err, 'index', None) is None:
+      err.index = len(ret)
+    raise
+  return ret
+
+#------------------------------------------------------------------------------
+def close_modifiers(modifiers):
+  'Releases the resources (e.g. child processes) held by `modifiers`.'
+  for mod in modifiers:
+    if hasattr(mod, 'close'):
+      mod.close()
+
+#------------------------------------------------------------------------------
+def find_addresses(modifier):
+  '''
+  Returns a tuple of ``(ADDRESSES, ALWAYS)``, where ADDRESSES is the
+  list of the `Address` objects used by `modifier` (including within
+  chains and caches, and the `ColumnReferences` of "p" modifiers) and
+  ALWAYS is whether or not some part of it is applied regardless of
+  the addresses.
+  '''
+  if isinstance(modifier, AddressedModifier):
+    return ([modifier.address] + find_addresses(modifier.modifier)[0], False)
+  if isinstance(modifier, (CachedModifier, StatsModifier, UnicodeModifier)):
+    return find_addresses(modifier.modifier)
+  if isinstance(modifier, P_modifier) and modifier.references is not None:
+    return ([modifier.references], True)
+  if isinstance(modifier, ModifierChain):
+    ret = ([], False)
+    for mod in modifier.modifiers:
+      addrs, always = find_addresses(mod)
+      ret = (ret[0] + addrs, ret[1] or always)
+    return ret
+  return ([], True)
+
+#------------------------------------------------------------------------------
+def required_literals(regex):
+  '''
+  Analyzes the compiled regular expression `regex` and returns a
+  ``(prefix, literal)`` tuple, where `prefix` is a string that every
+  matched string must start with (only for patterns anchored at the
+  start of the string) and `literal` is the longest string that every
+  match must contain. Either is ``None`` if it could not be
+  determined; only plain ASCII literals are extracted, and nothing is
+  extracted for case-insensitive patterns.
+  '''
+  try:
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+  except Exception:
+    return (None, None)
+  if parsed.pattern.flags & re.IGNORECASE:
+    return (None, None)
+  # note: the sequence is flattened into characters, with `None`
+  #       marking anything that is not a plain literal. groups are
+  #       inlined because their content is required too.
+  def flatten(seq):
+    for op, av in seq:
+      if op == sre_constants.LITERAL and av < 128:
+        yield chr(av)
+      elif op == sre_constants.SUBPATTERN:
+        for item in flatten(av[-1]):
+          yield item
+      else:
+        yield None
+  items = list(flatten(parsed))
+  prefix = None
+  if parsed.data and parsed.data[0][0] == sre_constants.AT:
+    anchor = parsed.data[0][1]
+    if anchor == sre_constants.AT_BEGINNING_STRING \
+        or ( anchor == sre_constants.AT_BEGINNING
+             and not parsed.pattern.flags & re.MULTILINE ):
+      prefix = ''.join(itertools.takewhile(lambda c: c is not None, items[1:]))
+  literal = max(
+    [''.join(run) for key, run in itertools.groupby(items, lambda c: c is not None)
+     if key] or [''], key=len)
+  if prefix and literal in prefix:
+    literal = None
+  return (prefix or None, literal or None)
+
+#------------------------------------------------------------------------------
+def byte_safe(regex):
+  '''
+  Returns whether or not the compiled `regex` matches UTF-8 encoded
+  byte strings exactly like it matches the decoded unicode strings,
+  i.e. whether it is a non-unicode, non-locale pattern that can only
+  match ASCII characters (and therefore never part of a multi-byte
+  character).
+  '''
+  if isinstance(regex.pattern, unicode) or regex.flags & (re.UNICODE | re.LOCALE):
+    return False
+  try:
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+  except Exception:
+    return False
+  if parsed.pattern.flags & (re.UNICODE | re.LOCALE):
+    return False
+  negated = (
+    sre_constants.CATEGORY_NOT_DIGIT, sre_constants.CATEGORY_NOT_SPACE,
+    sre_constants.CATEGORY_NOT_WORD, sre_constants.CATEGORY_NOT_LINEBREAK)
+  def safe(seq):
+    for op, av in seq:
+      if op in (sre_constants.ANY, sre_constants.NOT_LITERAL, sre_constants.NEGATE):
+        return False
+      if op == sre_constants.LITERAL and av > 127:
+        return False
+      if op == sre_constants.RANGE and av[1] > 127:
+        return False
+      if op == sre_constants.CATEGORY and av in negated:
+        return False
+      if op == sre_constants.IN and not safe(av):
+        return False
+      if op == sre_constants.BRANCH and not all(safe(alt) for alt in av[1]):
+        return False
+      if op in (sre_constants.SUBPATTERN, sre_constants.MAX_REPEAT,
+                sre_constants.MIN_REPEAT, sre_constants.ASSERT,
+                sre_constants.ASSERT_NOT) and not safe(av[-1]):
+        return False
+      if op == sre_constants.GROUPREF_EXISTS \
+          and not all(safe(alt) for alt in av[1:] if alt is not None):
+        return False
+    return True
+  return safe(parsed)
+
+def compile_pattern(pattern, flags=0, bytes_mode=False):
+  '''
+  Compiles the regular expression `pattern` for matching values that
+  are unicode strings or, if `bytes_mode` is truthy, UTF-8 byte
+  strings. Returns a tuple of ``(REGEX, DECODE)``, where DECODE is
+  whether or not byte string values must be decoded for REGEX to
+  match them correctly (see `byte_safe`).
+  '''
+  if not bytes_mode:
+    return (re.compile(pattern, flags), False)
+  if isinstance(pattern, unicode):
+    pattern = pattern.encode('utf-8')
+  regex = re.compile(pattern, flags)
+  if byte_safe(regex):
+    return (regex, False)
+  return (re.compile(pattern.decode('utf-8'), flags), True)
+
+#------------------------------------------------------------------------------
+class UnicodeModifier(object):
+  '''
+  Applies `modifier`, which needs unicode semantics (e.g. a "p"
+  modifier, or an "s" modifier whose pattern can match part of a
+  multi-byte character), to UTF-8 byte string values: they are decoded
+  before, and the results encoded after, being modified.
+  '''
+  def __init__(self, modifier):
+    super(UnicodeModifier, self).__init__()
+    self.modifier = modifier
+  def __call__(self, value):
+    return encode_value(self.modifier(as_text(value)))
+  def batch(self, values):
+    return [
+      encode_value(value)
+      for value in modify_batch(self.modifier, [as_text(value) for value in values])]
+  def close(self):
+    close_modifiers([self.modifier])
 
 #------------------------------------------------------------------------------
 class S_modifier(object):
   'The "substitution" modifier ("s/REGEX/REPL/FLAGS").'
-  def __init__(self, spec):
+  def __init__(self, spec, bytes_mode=False, **options):
     super(S_modifier, self).__init__()
     if not spec or len(spec) < 4 or spec[0] != 's':
       raise InvalidModifierSpec(spec)
     sspec = spec.split(spec[1])
     if len(sspec) != 4:
       raise InvalidModifierSpec(spec)
+    self.spec  = spec
     flags = 0
     for flag in sspec[3].upper():
       flags |= getattr(re, flag, 0)
-    self.regex = re.compile(sspec[1], flags)
+    self.regex, decode = compile_pattern(sspec[1], flags, bytes_mode)
     self.repl  = sspec[2]
+    # note: in bytes mode, the values are only decoded (see
+    #       `spec2modifier`) if the pattern needs unicode semantics.
+    self.bytes_mode = bytes_mode and not decode
+    if decode:
+      self.repl = as_text(self.repl)
+    elif bytes_mode and isinstance(self.repl, unicode):
+      self.repl = self.repl.encode('utf-8')
     self.count = 0 if 'g' in sspec[3].lower() else 1
+    self.prefix, self.literal = required_literals(self.regex)
   def __call__(self, value):
+    if self.prefix is not None and not value.startswith(self.prefix):
+      return value
+    if self.literal is not None and self.literal not in value:
+      return value
     return self.regex.sub(self.repl, value, count=self.count)
+  def batch(self, values):
+    if self.prefix is not None or self.literal is not None:
+      return [self(value) for value in values]
+    sub, repl, count = self.regex.sub, self.repl, self.count
+    return [sub(repl, value, count) for value in values]
+
+#------------------------------------------------------------------------------
+class CachedModifier(object):
+  '''
+  Memoizes the results of another modifier, evicting the least recently
+  used entries when there are more than `size` entries or when they use
+  more than approximately `memory` bytes. The number of cache hits,
+  misses and evictions are available as the `hits`, `misses` and
+  `evictions` attributes.
+
+  If the wrapped modifier supports pipelining (see `CsvFilter`), then
+  so does the cache: only the values that are neither cached nor
+  already in flight are submitted to the wrapped modifier.
+  '''
+  # note: the LRU list is a circular doubly-linked list of
+  #       [PREV, NEXT, KEY, VALUE, SIZE] entries, as in py3's lru_cache.
+  PREV, NEXT, KEY, VALUE, SIZE = range(5)
+  def __init__(self, modifier, size=None, memory=None):
+    super(CachedModifier, self).__init__()
+    self.modifier  = modifier
+    self.size      = size
+    self.memory    = memory
+    self.hits      = 0
+    self.misses    = 0
+    self.evictions = 0
+    self.used      = 0
+    self.cache     = dict()
+    self.root      = []
+    self.root[:]   = [self.root, self.root, None, None, 0]
+    if hasattr(modifier, 'submit') and hasattr(modifier, 'collect'):
+      self.pending  = collections.deque()
+      self.inflight = dict()
+      self.submit   = self._submit
+      self.collect  = self._collect
+  def __call__(self, value):
+    entry = self.cache.get(value)
+    if entry is not None:
+      self.hits += 1
+      self._touch(entry)
+      return entry[self.VALUE]
+    self.misses += 1
+    return self._store(value, self.modifier(value))
+  def _submit(self, value):
+    # note: `pending` holds [RESULT] for hits and for duplicates of
+    #       values that are still in flight (the result is filled in
+    #       when the first one is collected), and None for misses.
+    entry = self.cache.get(value)
+    if entry is not None:
+      self.hits += 1
+      self._touch(entry)
+      return self.pending.append(([entry[self.VALUE]], value))
+    result = self.inflight.get(value)
+    if result is not None:
+      self.hits += 1
+      return self.pending.append((result, value))
+    self.misses += 1
+    self.modifier.submit(value)
+    self.inflight[value] = []
+    self.pending.append((None, value))
+  def _collect(self):
+    result, value = self.pending.popleft()
+    if result is not None:
+      return result[0]
+    result = self.modifier.collect()
+    self.inflight.pop(value).append(result)
+    return self._store(value, result)
+  def batch(self, values):
+    ret    = []
+    misses = collections.OrderedDict()
+    for idx, value in enumerate(values):
+      entry = self.cache.get(value)
+      if entry is not None:
+        self.hits += 1
+        self._touch(entry)
+        ret.append(entry[self.VALUE])
+        continue
+      if value in misses:
+        self.hits += 1
+      else:
+        self.misses += 1
+      misses.setdefault(value, []).append(idx)
+      ret.append(None)
+    if misses:
+      try:
+        results = modify_batch(self.modifier, misses.keys())
+      except CommandError as err:
+        if getattr(err, 'index', None) is not None:
+          err.index = misses.values()[err.index][0]
+        raise
+      for (value, idxs), result in itertools.izip(misses.items(), results):
+        self._store(value, result)
+        for idx in idxs:
+          ret[idx] = result
+    return ret
+  def close(self):
+    close_modifiers([self.modifier])
+  def _touch(self, entry):
+    root = self.root
+    entry[self.PREV][self.NEXT] = entry[self.NEXT]
+    entry[self.NEXT][self.PREV] = entry[self.PREV]
+    last = root[self.PREV]
+    last[self.NEXT] = root[self.PREV] = entry
+    entry[self.PREV] = last
+    entry[self.NEXT] = root
+  def _store(self, key, value):
+    if key in self.cache:
+      return value
+    root  = self.root
+    last  = root[self.PREV]
+    size  = sys.getsizeof(key) + sys.getsizeof(value)
+    entry = [last, root, key, value, size]
+    last[self.NEXT] = root[self.PREV] = self.cache[key] = entry
+    self.used += size
+    while self.cache and (
+        ( self.size and len(self.cache) > self.size )
+        or ( self.memory and self.used > self.memory )):
+      oldest = root[self.NEXT]
+      root[self.NEXT] = oldest[self.NEXT]
+      oldest[self.NEXT][self.PREV] = root
+      del self.cache[oldest[self.KEY]]
+      self.used -= oldest[self.SIZE]
+      self.evictions += 1
+    return value
 
 #------------------------------------------------------------------------------
 def cranges(spec):
@@ -185,34 +1882,83 @@ def cranges(spec):
 #------------------------------------------------------------------------------
 class Y_modifier(object):
   'The "transliterate" modifier ("y/SOURCE/DESTINATION/FLAGS").'
-  # todo: the python2 string.maketrans & string.translate functions
+  # note: the python2 string.maketrans & string.translate functions
   #       only work on non-unicode input and csvkit produces unicode
-  #       values... so the current 'y' modifier does not use them.
-  #       *HOWEVER*, python3's version *does* work, so in py3 mode,
-  #       use that!
-  def __init__(self, spec):
+  #       values... so two tables are pre-computed: a code-point map
+  #       for unicode.translate() and, when the spec only contains
+  #       single-byte characters, a 256-byte table for str.translate().
+  def __init__(self, spec, bytes_mode=False, **options):
     super(Y_modifier, self).__init__()
     if not spec or len(spec) < 4 or spec[0] != 'y':
       raise InvalidModifierSpec(spec)
     yspec = spec.split(spec[1])
     if len(yspec) != 4:
       raise InvalidModifierSpec(spec)
+    self.spec = spec
     yspec[1] = cranges(yspec[1])
     yspec[2] = cranges(yspec[2])
     if 'i' in yspec[3].lower():
-      # self.table = string.maketrans(yspec[1].lower() + yspec[1].upper(),
-      #                               2 * yspec[2])
       self.src = yspec[1].lower() + yspec[1].upper()
       self.dst = 2 * yspec[2]
     else:
-      # self.table = string.maketrans(yspec[1], yspec[2])
       self.src = yspec[1]
       self.dst = yspec[2]
+    if bytes_mode:
+      # note: the values are UTF-8, so only the ASCII bytes can be
+      #       translated individually; otherwise they are decoded.
+      self.src = as_text(self.src)
+      self.dst = as_text(self.dst)
     if len(self.src) != len(self.dst):
       raise InvalidModifierSpec(spec)
+    self.utable = self._makeUnicodeTable()
+    self.btable = self._makeByteTable()
+    self.bytes_mode = bytes_mode and self.btable is not None
+  def _makeUnicodeTable(self):
+    # note: the first occurrence of a character in `src` wins, which
+    #       mirrors the `src.find()` semantics of the original loop.
+    try:
+      src = unicode(self.src)
+      dst = unicode(self.dst)
+    except UnicodeDecodeError:
+      return None
+    table = dict()
+    for sch, dch in zip(src, dst):
+      table.setdefault(ord(sch), dch)
+    return table
+  def _makeByteTable(self):
+    limit = 127 if isinstance(self.src + self.dst, unicode) else 255
+    table = [chr(idx) for idx in range(256)]
+    seen  = set()
+    for sch, dch in zip(self.src, self.dst):
+      if ord(sch) > limit or ord(dch) > limit:
+        return None
+      if sch in seen:
+        continue
+      seen.add(sch)
+      table[ord(sch)] = chr(ord(dch))
+    return ''.join(table)
   def __call__(self, value):
-    # return string.translate(val, self.table)
-    # TODO: this could be *much* more efficient...
+    if isinstance(value, unicode):
+      if self.utable is not None:
+        return value.translate(self.utable)
+    elif self.btable is not None:
+      return value.translate(self.btable)
+    return self._translate(value)
+  def batch(self, values):
+    if self.bytes_mode:
+      btable = self.btable
+      return [value.translate(btable) for value in values]
+    utable = self.utable
+    if utable is not None:
+      try:
+        return [value.translate(utable) for value in values]
+      except TypeError:
+        # a non-unicode value: fallback to per-value type detection
+        pass
+    return map(self, values)
+  def _translate(self, value):
+    # fallback for when `value` and the spec cannot be reconciled into
+    # a translation table (e.g. non-ASCII byte strings in the spec).
     ret = ''
     for ch in value:
       idx = self.src.find(ch)
@@ -222,6 +1968,212 @@ class Y_modifier(object):
         ret += self.dst[idx]
     return ret
 
+#------------------------------------------------------------------------------
+# the only builtins (and modules) available to "p" modifier expressions
+EXPRESSION_BUILTINS = {
+  'True': True, 'False': False, 'None': None,
+  'abs': abs, 'bool': bool, 'divmod': divmod, 'float': float,
+  'format': format, 'int': int, 'len': len, 'long': long, 'max': max,
+  'min': min, 'pow': pow, 'round': round, 'sorted': sorted,
+  'str': unicode, 'sum': sum, 'unicode': unicode,
+  'math': math,
+}
+
+# the only syntax (by AST node type name) and attributes allowed in
+# "p" modifier expressions: anything else, e.g. the attributes of
+# frames, generators and functions, could escape the restricted
+# builtins.
+EXPRESSION_NODES = frozenset('''
+  Expression Load Store Name Num Str List Tuple Dict Set
+  BoolOp And Or UnaryOp Not Invert UAdd USub
+  BinOp Add Sub Mult Div FloorDiv Mod Pow LShift RShift BitOr BitXor BitAnd
+  Compare Eq NotEq Lt LtE Gt GtE Is IsNot In NotIn
+  IfExp Call keyword Attribute Subscript Index Slice
+  ListComp SetComp DictComp GeneratorExp comprehension
+'''.split())
+
+EXPRESSION_ATTRIBUTES = frozenset('''
+  capitalize center count endswith expandtabs find index isalnum isalpha
+  isdecimal isdigit islower isnumeric isspace istitle isupper join ljust
+  lower lstrip partition replace rfind rindex rjust rpartition rsplit
+  rstrip split splitlines startswith strip swapcase title upper zfill
+  real imag conjugate is_integer bit_length get keys values items
+  ceil floor trunc sqrt exp log log10 pow fabs fmod hypot isnan isinf
+  sin cos tan asin acos atan atan2 degrees radians pi e
+'''.split())
+
+NUMBER = re.compile(r'^[-+]?(?:\d+(\.\d*)?|(\.\d+))([eE][-+]?\d+)?$')
+
+def coerce_number(value):
+  '''
+  Returns `value` as an int (or long) or a float if it is a decimal
+  number (e.g. "42", "-1.5" or "2e3"), and as-is otherwise.
+  '''
+  match = NUMBER.match(value)
+  if match is None:
+    return value
+  if match.group(1) is None and match.group(2) is None and match.group(3) is None:
+    return int(value)
+  return float(value)
+
+def format_result(value):
+  'Converts the result of a "p" modifier expression to a unicode value.'
+  if isinstance(value, unicode):
+    return value
+  if isinstance(value, str):
+    return value.decode('utf-8')
+  if isinstance(value, float):
+    return unicode(repr(value))
+  if value is None:
+    return u''
+  return unicode(value)
+
+#------------------------------------------------------------------------------
+class ColumnReferences(object):
+  '''
+  The other columns of the row that the expression of the "p" modifier
+  `modifier` refers to, by bare `names` and by the constant `keys` of
+  ``row[KEY]``. It implements the `Address` protocol (`resolve`,
+  `matches`, `index` and `last`), which makes `CsvFilter` set its
+  `selected` attribute (or its `selection` list, for batches) to the
+  unmodified values of those columns for each row.
+  '''
+  last = False
+  def __init__(self, modifier, names, keys, zero_based=False):
+    super(ColumnReferences, self).__init__()
+    self.modifier   = modifier
+    self.names      = names
+    self.keys       = keys
+    self.zero_based = zero_based
+    self.index      = None
+    self.params     = []
+    self.indices    = []
+    self.selected   = None
+    self.selection  = []
+  def resolve(self, col, cnames):
+    '''
+    Resolves the referenced columns, where `col` is the index of the
+    column being modified and `cnames` is the list of column names (or
+    ``None`` if not known), and re-compiles the modifier\'s expression
+    accordingly. The keys must be column names or indices; names that
+    are not column names are left to the expression (e.g. comprehension
+    variables).
+    '''
+    self.params  = [name for name in self.names if cnames and name in cnames]
+    self.indices = [cnames.index(name) for name in self.params]
+    for key in self.keys:
+      if cnames is None:
+        self.indices.append(int(key) - ( 0 if self.zero_based else 1 ))
+      else:
+        self.indices.append(match_column_identifier(cnames, key, self.zero_based))
+    self.index = max(self.indices + [col])
+    self.modifier._compile()
+  def matches(self, row, rowno, last):
+    return [row[idx] for idx in self.indices]
+
+#------------------------------------------------------------------------------
+class P_modifier(object):
+  '''
+  The "python expression" modifier ("p/EXPR/FLAGS"). EXPR is a python
+  expression that is compiled once and evaluated for each value with
+  the following names:
+
+  * ``v``: the value, converted to a number if it is one
+  * ``s``: the value, as a string
+  * ``row[COLUMN]``: the value of another column of the same row (a
+    name or an index, which must be a constant), converted to a number
+    if it is one
+  * any column name that is a valid identifier, e.g. ``Age``, which is
+    the same as ``row[\'Age\']``
+
+  Other columns are always their unmodified values. Only a few safe
+  builtins (see `EXPRESSION_BUILTINS`), syntax elements (see
+  `EXPRESSION_NODES`) and attributes (see `EXPRESSION_ATTRIBUTES`) are
+  allowed, names that start with an underscore are rejected, and only
+  ``row`` can be subscripted with a string. The result
+  is converted back to a string. If an evaluation fails, an
+  `ExpressionError` is raised, unless the "i" flag is set, in which
+  case the value is left unchanged.
+  '''
+  def __init__(self, spec, zero_based=False, **options):
+    super(P_modifier, self).__init__()
+    if not spec or len(spec) < 3 or spec[0] != 'p':
+      raise InvalidModifierSpec(spec)
+    pspec = spec.split(spec[1])
+    if len(pspec) != 3:
+      raise InvalidModifierSpec(spec)
+    self.spec   = spec
+    self.expr   = pspec[1]
+    self.ignore = 'i' in pspec[2].lower()
+    import ast
+    try:
+      tree = ast.parse(self.expr.strip(), '<p>', 'eval')
+    except SyntaxError as err:
+      raise InvalidModifierSpec('%s (%s)' % (spec, err))
+    names = set()
+    bound = set()
+    keys  = []
+    for node in ast.walk(tree):
+      if type(node).__name__ not in EXPRESSION_NODES:
+        raise InvalidModifierSpec(
+          '%s (unsupported syntax: %s)' % (spec, type(node).__name__))
+      if isinstance(node, ast.Attribute) and node.attr not in EXPRESSION_ATTRIBUTES:
+        raise InvalidModifierSpec('%s (unsupported attribute %s)' % (spec, node.attr))
+      if isinstance(node, ast.Name):
+        if node.id.startswith('_'):
+          raise InvalidModifierSpec('%s (private name %s)' % (spec, node.id))
+        names.add(node.id)
+        if isinstance(node.ctx, ast.Store):
+          # note: comprehension variables are not column references
+          bound.add(node.id)
+      if not isinstance(node, ast.Subscript):
+        continue
+      key = node.slice
+      if isinstance(node.value, ast.Name) and node.value.id == 'row':
+        if not isinstance(key, ast.Index) \
+            or not isinstance(key.value, (ast.Str, ast.Num)):
+          raise InvalidModifierSpec(
+            '%s (the COLUMN in row[COLUMN] must be a constant)' % (spec,))
+        keys.append(key.value.s if isinstance(key.value, ast.Str) else key.value.n)
+      elif isinstance(key, ast.Index) and isinstance(key.value, ast.Str):
+        raise InvalidModifierSpec(
+          '%s (only row[COLUMN] can be subscripted with a string)' % (spec,))
+    names -= set(EXPRESSION_BUILTINS) | set(['v', 's', 'row']) | bound
+    self.references = None
+    if names or keys:
+      self.references = ColumnReferences(self, sorted(names), keys, zero_based)
+    self._compile()
+  def _compile(self):
+    # note: the expression is compiled into a function whose parameters
+    #       are the names it uses, which is faster than `eval()` with a
+    #       namespace dict.
+    params = ['v', 's']
+    if self.references is not None:
+      params += ['row'] + self.references.params
+    source = 'lambda %s: (%s)' % (', '.join(params), self.expr.strip())
+    # note: "/" is true division (e.g. "Wage / Hours"), regardless of
+    #       the division semantics of this module.
+    code = compile(
+      source, '<p>', 'eval', __future__.division.compiler_flag, True)
+    self.func = eval(code, dict(__builtins__=EXPRESSION_BUILTINS))
+  def __call__(self, value):
+    try:
+      if self.references is None:
+        return format_result(self.func(coerce_number(value), value))
+      return self._evaluate(value, self.references.selected)
+    except Exception as err:
+      if self.ignore:
+        return value
+      raise ExpressionError('expression "%s" failed: %s' % (self.expr, err))
+  def _evaluate(self, value, others):
+    if others is None:
+      raise ValueError('column references require a row')
+    refs   = self.references
+    others = [coerce_number(as_text(other)) for other in others]
+    row    = dict(itertools.izip(refs.keys, others[len(refs.params):]))
+    return format_result(self.func(
+      coerce_number(value), value, row, *others[:len(refs.params)]))
+
 #------------------------------------------------------------------------------
 class ReadlineIterator(object):
   'An iterator that calls readline() to get its next value.'
@@ -233,10 +2185,277 @@ class ReadlineIterator(object):
     if not line: raise StopIteration
     return line
 
+#------------------------------------------------------------------------------
+class Coprocess(object):
+  '''
+  Manages a long-lived child process that reads single-column CSV rows
+  on STDIN and writes exactly one single-column CSV row to STDOUT for
+  each input row. Values are fed to the child by a writer thread (so
+  that up to `window` values can be in flight at a time), results are
+  collected by a reader thread in order, and STDERR is continuously
+  drained (the last few lines are kept for error reporting) so that a
+  chatty child can never block on a full pipe.
+  '''
+
+  EOF = object()
+
+  def __init__(self, command, window=64, timeout=None, bytes_mode=False):
+    import subprocess, threading, Queue
+    super(Coprocess, self).__init__()
+    self.command = command
+    self.timeout = timeout
+    self.bytes_mode = bytes_mode
+    self.proc    = subprocess.Popen(
+      command, shell=True,
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    self.inbox   = Queue.Queue(max(1, window))
+    self.outbox  = Queue.Queue()
+    self.errput  = collections.deque(maxlen=20)
+    self.threads = []
+    for target in (self._writer, self._reader, self._drainer):
+      thread = threading.Thread(target=target)
+      thread.daemon = True
+      thread.start()
+      self.threads.append(thread)
+  def _writer(self):
+    if self.bytes_mode:
+      writer = BytesWriter(self.proc.stdin)
+    else:
+      import csvkit
+      writer = csvkit.CSVKitWriter(self.proc.stdin)
+    try:
+      while True:
+        value = self.inbox.get()
+        if value is self.EOF:
+          break
+        writer.writerow([value])
+        if self.inbox.empty():
+          self.proc.stdin.flush()
+    except (IOError, OSError):
+      # the child went away -- the reader will report the failure
+      pass
+    finally:
+      try:
+        self.proc.stdin.close()
+      except (IOError, OSError):
+        pass
+  def _reader(self):
+    # note: not using csvkit's reader because there is no easy way of
+    # making it not read-ahead (which breaks the "continuous" mode).
+    # todo: fix csvkit so that it can be used in non-read-ahead mode.
+    try:
+      empty = '' if self.bytes_mode else u''
+      for row in csv.reader(ReadlineIterator(self.proc.stdout)):
+        if not row:
+          self.outbox.put(empty)
+        else:
+          self.outbox.put(row[0] if self.bytes_mode else row[0].decode('utf-8'))
+    except Exception as err:
+      self.outbox.put(err)
+    self.outbox.put(self.EOF)
+  def _drainer(self):
+    for line in iter(self.proc.stderr.readline, ''):
+      self.errput.append(line)
+  def _error(self, message):
+    return CommandError('command "%s" %s: %s' % (
+      self.command, message, ''.join(self.errput)))
+  def submit(self, value):
+    'Queues `value` to be sent to the child process.'
+    self.inbox.put(value)
+  def collect(self):
+    'Returns the result for the oldest submitted value.'
+    import Queue
+    try:
+      ret = self.outbox.get(timeout=self.timeout)
+    except Queue.Empty:
+      self.kill()
+      raise self._error('timed out after %s seconds' % (self.timeout,))
+    if ret is self.EOF:
+      # note: re-queueing so that subsequent calls fail the same way
+      self.outbox.put(ret)
+      status = self.proc.wait()
+      # note: waiting (briefly) for the drainer to read the rest of
+      #       STDERR, so that the error includes the child's last words.
+      self.threads[-1].join(1)
+      raise self._error('terminated with status %r' % (status,))
+    if isinstance(ret, Exception):
+      raise self._error('produced invalid output (%s)' % (ret,))
+    return ret
+  def __call__(self, value):
+    self.submit(value)
+    return self.collect()
+  def kill(self):
+    try:
+      self.proc.kill()
+    except OSError:
+      pass
+  def close(self):
+    'Closes the child\'s STDIN and waits for it to terminate.'
+    self.inbox.put(self.EOF)
+    ret = self.proc.wait()
+    # note: also waiting (briefly, in case a grandchild still holds the
+    #       pipes open) for the threads to see EOF, since daemon threads
+    #       that are still running when the interpreter exits can fail
+    #       noisily.
+    for thread in self.threads:
+      thread.join(1)
+    return ret
+
+#------------------------------------------------------------------------------
+class DiskCache(object):
+  '''
+  A persistent, sqlite-backed cache of external program results, keyed
+  by the program\'s command, flags and input value. Multiple processes
+  can safely use the same cache concurrently; since the cache is only
+  an optimization, failures to write to it (e.g. because another
+  process holds a lock for too long) are ignored.
+
+  :Parameters:
+
+  path : str
+
+    The path to the sqlite database, which is created if needed.
+
+  max_age : float, optional
+
+    The number of seconds after which an entry expires.
+
+  max_entries : int, optional
+
+    The maximum number of entries to keep; when exceeded, the oldest
+    entries are deleted (this is checked when the cache is opened and
+    closed).
+  '''
+  # note: values are stored as UTF-8 BLOBs along with whether or not
+  #       the output was unicode, so that cache hits return the same
+  #       type as a program execution would have.
+  SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS csvsed_exec_cache (
+      command   TEXT NOT NULL,
+      flags     TEXT NOT NULL,
+      input     BLOB NOT NULL,
+      output    BLOB NOT NULL,
+      isunicode INTEGER NOT NULL,
+      created   REAL NOT NULL,
+      PRIMARY KEY (command, flags, input)
+    );
+    CREATE INDEX IF NOT EXISTS csvsed_exec_cache_created
+      ON csvsed_exec_cache (created);
+  '''
+  def __init__(self, path, max_age=None, max_entries=None, batch=1000):
+    import sqlite3
+    super(DiskCache, self).__init__()
+    self.path        = path
+    self.max_age     = max_age
+    self.max_entries = max_entries
+    self.batch       = batch
+    self.dirty       = 0
+    self.db          = sqlite3.connect(path, timeout=30)
+    try:
+      self.db.execute('PRAGMA journal_mode=WAL')
+    except sqlite3.DatabaseError:
+      pass
+    self.db.executescript(self.SCHEMA)
+    self.prune()
+  @staticmethod
+  def _blob(value):
+    if isinstance(value, unicode):
+      value = value.encode('utf-8')
+    return buffer(value)
+  def get(self, command, flags, value):
+    'Returns the cached output for `value` or None if not cached.'
+    sql = 'SELECT output, isunicode, created FROM csvsed_exec_cache' \
+      ' WHERE command = ? AND flags = ? AND input = ?'
+    row = self.db.execute(sql, (command, flags, self._blob(value))).fetchone()
+    if row is None:
+      return None
+    if self.max_age is not None and row[2] < time.time() - self.max_age:
+      return None
+    if row[1]:
+      return str(row[0]).decode('utf-8')
+    return str(row[0])
+  def put(self, command, flags, value, output):
+    'Stores `output` as the result for `value`.'
+    import sqlite3
+    sql = 'INSERT OR REPLACE INTO csvsed_exec_cache VALUES (?, ?, ?, ?, ?, ?)'
+    try:
+      self.db.execute(sql, (
+        command, flags, self._blob(value), self._blob(output),
+        isinstance(output, unicode), time.time()))
+      self.dirty += 1
+      if self.dirty >= self.batch:
+        self.commit()
+    except sqlite3.OperationalError:
+      self.db.rollback()
+      self.dirty = 0
+  def commit(self):
+    import sqlite3
+    try:
+      self.db.commit()
+    except sqlite3.OperationalError:
+      self.db.rollback()
+    self.dirty = 0
+  def prune(self):
+    'Deletes the expired entries and the oldest excess entries.'
+    import sqlite3
+    try:
+      if self.max_age is not None:
+        self.db.execute(
+          'DELETE FROM csvsed_exec_cache WHERE created < ?',
+          (time.time() - self.max_age,))
+      if self.max_entries is not None:
+        self.db.execute(
+          'DELETE FROM csvsed_exec_cache WHERE rowid IN ('
+          ' SELECT rowid FROM csvsed_exec_cache'
+          ' ORDER BY created DESC LIMIT -1 OFFSET ?)',
+          (self.max_entries,))
+    except sqlite3.OperationalError:
+      self.db.rollback()
+    self.commit()
+  def clear(self, command=None):
+    'Deletes all entries (or only those for `command`).'
+    if command is None:
+      self.db.execute('DELETE FROM csvsed_exec_cache')
+    else:
+      self.db.execute(
+        'DELETE FROM csvsed_exec_cache WHERE command = ?', (command,))
+    self.db.commit()
+  def close(self):
+    if self.db is None:
+      return
+    self.prune()
+    self.db.close()
+    self.db = None
+
 #------------------------------------------------------------------------------
 class E_modifier(object):
   'The "execute" external program modifier ("e/PROGRAM+OPTIONS/FLAGS").'
-  def __init__(self, spec):
+  def __init__(self, spec, window=64, timeout=None, workers=1,
+               exec_cache=None, exec_cache_age=None, exec_cache_entries=None,
+               bytes_mode=False, **options):
+    '''
+    In "continuous" mode (the "c" flag), `window` is the maximum number
+    of values that can be sent to the program before its output is
+    collected, and `timeout` is the number of seconds to wait for the
+    program\'s output for a single value before it is killed.
+
+    `workers` is the number of concurrent executions of the program
+    when values are pipelined (see `CsvFilter`): in normal mode, up to
+    that many instances of the program run at the same time, each for
+    a single value; in "continuous" mode, that many long-lived
+    instances are started and values are distributed among them in a
+    round-robin fashion. In both cases, results are collected in the
+    order in which the values were submitted.
+
+    If `exec_cache` is specified, it is the path to a `DiskCache`
+    database that persists the program\'s output for each input value
+    across runs, so that the program is only executed for values it
+    has not seen before. `exec_cache_age` and `exec_cache_entries` are
+    the `DiskCache` `max_age` and `max_entries` parameters.
+
+    If `bytes_mode` is truthy, the values are UTF-8 byte strings, which
+    are passed to the program, and its output returned, as-is.
+    '''
     super(E_modifier, self).__init__()
     if not spec or len(spec) < 3 or spec[0] != 'e':
       raise InvalidModifierSpec(spec)
@@ -244,32 +2463,86 @@ class E_modifier(object):
     if len(espec) != 3:
       raise InvalidModifierSpec(spec)
     espec[2] = espec[2].lower()
+    self.spec    = spec
     self.command = espec[1]
+    self.flags   = espec[2]
     self.index   = 1 if 'i' in espec[2] else None
     self.csv     = 'c' in espec[2]
+    self.workers = max(1, workers or 1)
+    self.bytes_mode = bytes_mode
+    self.pending = collections.deque()
+    self.pool    = None
+    self.procs   = None
+    self.cache   = None
+    if exec_cache:
+      self.cache   = DiskCache(
+        exec_cache, max_age=exec_cache_age, max_entries=exec_cache_entries)
+      self.results = collections.deque()
     if not self.csv:
       return
-    self.proc = subprocess.Popen(
-      self.command, shell=True, bufsize=0,
-      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    self.writer = csvkit.CSVKitWriter(self.proc.stdin)
-    # note: not using csvkit's reader because there is no easy way of
-    # making it not read-ahead (which breaks the "continuous" mode).
-    # self.reader = csvkit.CSVKitReader(self.proc.stdout)
-    # todo: fix csvkit so that it can be used in non-read-ahead mode.
-    self.reader = csv.reader(ReadlineIterator(self.proc.stdout))
+    self.procs = [
+      Coprocess(self.command, window=window, timeout=timeout, bytes_mode=bytes_mode)
+      for idx in range(self.workers)]
+    self.cycle = itertools.cycle(self.procs)
   def __call__(self, value):
+    if self.cache is None:
+      return self._call(value)
+    ret = self.cache.get(self.command, self.flags, value)
+    if ret is None:
+      ret = self._call(value)
+      self.cache.put(self.command, self.flags, value, ret)
+    return ret
+  def _call(self, value):
     if not self.csv:
       return self.execOnce(value)
-    self.writer.writerow([value])
-    return self.reader.next()[0].decode('utf-8')
+    return self.procs[0](value)
+  def submit(self, value):
+    'Queues `value` for execution; see `collect()` for the result.'
+    if self.cache is not None:
+      ret = self.cache.get(self.command, self.flags, value)
+      self.results.append((ret, value))
+      if ret is not None:
+        return
+    if not self.csv:
+      # note: the thread pool is only started once values are pipelined,
+      #       so that each column\'s executions run concurrently with
+      #       those of the other columns.
+      if self.pool is None:
+        import multiprocessing.pool
+        self.pool = multiprocessing.pool.ThreadPool(self.workers)
+      return self.pending.append(self.pool.apply_async(self.execOnce, (value,)))
+    proc = next(self.cycle)
+    proc.submit(value)
+    self.pending.append(proc)
+  def collect(self):
+    'Returns the result for the oldest value passed to `submit()`.'
+    if self.cache is None:
+      return self._collect()
+    ret, value = self.results.popleft()
+    if ret is None:
+      ret = self._collect()
+      self.cache.put(self.command, self.flags, value, ret)
+    return ret
+  def _collect(self):
+    if not self.csv:
+      return self.pending.popleft().get()
+    return self.pending.popleft().collect()
+  def close(self):
+    if self.pool is not None:
+      self.pool.close()
+      self.pool.join()
+    for proc in self.procs or []:
+      proc.close()
+    if self.cache is not None:
+      self.cache.close()
   def execOnce(self, value):
+    import subprocess
     p = subprocess.Popen(
       self.command, shell=True,
       stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     output, errput = p.communicate(value)
     if p.returncode != 0:
-      raise Exception('command "%s" failed: %s' % (self.command, errput))
+      raise CommandError('command "%s" failed: %s' % (self.command, errput))
     if output[-1] == '\n':
       output = output[:-1]
     return output
@@ -19,8 +19,9 @@
 # along with this program. If not, see http://www.gnu.org/licenses/.
 #------------------------------------------------------------------------------
 
-import unittest, StringIO, csvkit
-from . import sed
+import os, re, sys, json, signal, shutil, unittest, StringIO, tempfile, subprocess
+import gzip, bz2, csvkit
+from . import sed, cli, lean, bench, compress
 
 #------------------------------------------------------------------------------
 def run(source, modifiers, header=True):
@@ -33,6 +34,25 @@ def run(source, modifiers, header=True):
     writer.writerow(row)
   return dst.getvalue()
 
+#------------------------------------------------------------------------------
+def runcli(args, source=None, tool=cli.CsvSed):
+  # note: CSVKitUtility resets the SIGPIPE handler and the excepthook
+  #       process-wide, which would affect subsequent tests.
+  sigpipe = signal.getsignal(signal.SIGPIPE)
+  excepthook = sys.excepthook
+  dst = StringIO.StringIO()
+  try:
+    with tempfile.NamedTemporaryFile() as src:
+      if source is not None:
+        src.write(source)
+        src.flush()
+        args = list(args) + [src.name]
+      tool(args, output_file=dst).main()
+  finally:
+    signal.signal(signal.SIGPIPE, sigpipe)
+    sys.excepthook = excepthook
+  return dst.getvalue()
+
 #------------------------------------------------------------------------------
 class TestSed(unittest.TestCase):
 
@@ -60,6 +80,20 @@ field 3.1,field 3.2,field 3.3,field 3.4,field 3.5
     self.assertEqual(sed.Y_modifier('y/a-z/A-Z/')('Back-Up'), 'BACK-UP')
     self.assertEqual(sed.Y_modifier('y/a\-z/A~Z/')('Back-Up'), 'BAck~Up')
 
+  #----------------------------------------------------------------------------
+  def test_modifier_y_tables(self):
+    mod = sed.Y_modifier('y/aab/xyz/')
+    self.assertEqual(mod('abba'), 'xzzx')
+    self.assertEqual(mod(u'abba'), u'xzzx')
+    self.assertIsInstance(mod(u'abba'), unicode)
+    mod = sed.Y_modifier('y/a-c/A-C/i')
+    self.assertEqual(mod('aBcD'), 'ABCD')
+    self.assertEqual(mod(u'aBcD\u00e9'), u'ABCD\u00e9')
+    mod = sed.Y_modifier(u'y/a\u00e9/A\u00c9/')
+    self.assertIsNone(mod.btable)
+    self.assertEqual(mod(u'a\u00e9b'), u'A\u00c9b')
+    self.assertEqual(mod('ab'), 'Ab')
+
   #----------------------------------------------------------------------------
   def test_modifier_y_toupper(self):
     chk = '''\
@@ -77,6 +111,24 @@ field 3.1,field 3.2,FIELD 3.3,field 3.4,field 3.5
     self.assertEqual(sed.S_modifier('s/a/b/g')('abcABC'), 'bbcABC')
     self.assertEqual(sed.S_modifier('s/a/b/gi')('abcABC'), 'bbcbBC')
 
+  #----------------------------------------------------------------------------
+  def test_modifier_s_prefilter(self):
+    lits = lambda expr: sed.required_literals(re.compile(expr))
+    self.assertEqual(lits(','), (None, ','))
+    self.assertEqual(lits('^ab(c)d+'), ('abc', None))
+    self.assertEqual(lits('foo[0-9]+barbaz'), (None, 'barbaz'))
+    self.assertEqual(lits('(?m)^abc'), (None, 'abc'))
+    self.assertEqual(lits('(?i)abc'), (None, None))
+    self.assertEqual(lits('^a|b'), (None, None))
+    self.assertEqual(lits('x*'), (None, None))
+    mod = sed.S_modifier(u's/,//g')
+    value = u'1234.56'
+    self.assertIs(mod(value), value)
+    self.assertEqual(mod(u'1,234.56'), u'1234.56')
+    mod = sed.S_modifier(u's/^A-(.*)/\\1/')
+    self.assertIs(mod(value), value)
+    self.assertEqual(mod.batch([u'A-OK', value, u'xA-']), [u'OK', value, u'xA-'])
+
   #----------------------------------------------------------------------------
   def test_modifier_s_noflags(self):
     chk = '''\
@@ -149,6 +201,95 @@ f....ld 3.1,field 3.2,field 3.3,field 3.4,field 3.5
     chk = 'cell 1,123456789.0\n'
     self.assertMultiLineEqual(run(src, {1: 's/,//g'}, header=False), chk)
 
+  #----------------------------------------------------------------------------
+  def test_bytes_mode(self):
+    for pattern in ('a', 'a+b', '^[a-z0-9]*\\b', '\\d\\s\\w', '(?:ab|cd){2}'):
+      self.assertTrue(sed.byte_safe(re.compile(pattern)))
+    for pattern in (u'a', '.', '[^a]', '\\W', '(?u)a', u'\u00e9'.encode('utf-8') + '+'):
+      self.assertFalse(sed.byte_safe(re.compile(pattern)))
+    value = u'h\u00e9llo'.encode('utf-8')
+    for spec, chk in (
+        ('s/l/L/g', u'h\u00e9LLo'), ('s/./_/g', u'_____'),
+        (u's/\u00e9/e/', u'hello'), ('y/a-z/A-Z/', u'H\u00e9LLO'),
+        (u'y/\u00e9/E/', u'hEllo'), ('p/len(s)/', u'5')):
+      mod = sed.spec2modifier(spec, bytes_mode=True)
+      self.assertEqual(mod(value), chk.encode('utf-8'))
+      self.assertEqual(sed.modify_batch(mod, [value]), [chk.encode('utf-8')])
+    for spec in (u'/\u00e9/', '/^.{5}$/', '/^h/'):
+      addr = sed.Address.parse(spec + 's/x/y/', bytes_mode=True)[0]
+      addr.resolve(0, None)
+      self.assertTrue(addr.matches([value], 1, False))
+    self.assertIsInstance(
+      sed.spec2modifier('s/l/L/', bytes_mode=True), sed.S_modifier)
+    self.assertIsInstance(
+      sed.spec2modifier('s/./L/', bytes_mode=True), sed.UnicodeModifier)
+    src = u'n,v\n1,h\u00e9llo\n2,"a\r\nb"\n'.encode('utf-8')
+    dst = StringIO.StringIO()
+    writer = sed.BytesWriter(dst)
+    writer.writerows(sed.CsvFilter(
+      sed.bytes_reader(StringIO.StringIO(src)),
+      {'v': ['s/l/L/g', 'p/s.upper()/']}, options=dict(bytes_mode=True)))
+    self.assertEqual(
+      dst.getvalue(), u'n,v\n1,H\u00c9LLO\n2,"A\n\nB"\n'.encode('utf-8'))
+
+  #----------------------------------------------------------------------------
+  def test_modifier_p_directcall(self):
+    self.assertEqual(sed.P_modifier('p/v * 2/')(u'21'), u'42')
+    self.assertEqual(sed.P_modifier('p/v * 2/')(u'1.25'), u'2.5')
+    self.assertEqual(sed.P_modifier('p/v * 2/')(u'ab'), u'abab')
+    self.assertEqual(sed.P_modifier('p|"%.2f" % (v / 3.0)|')(u'1e1'), u'3.33')
+    self.assertEqual(sed.P_modifier('p/s.upper() + str(len(s))/')(u'007'), u'0073')
+    self.assertEqual(sed.P_modifier('p/int(math.sqrt(v))/')(u'16'), u'4')
+    self.assertRaises(sed.ExpressionError, sed.P_modifier('p/v + 1/'), u'x')
+    self.assertEqual(sed.P_modifier('p/v + 1/i')(u'x'), u'x')
+    self.assertEqual(sed.P_modifier('p|v / 2|')(u'7'), u'3.5')
+    self.assertEqual(sed.P_modifier('p|v // 2|')(u'7'), u'3')
+    self.assertEqual(sed.P_modifier('p|"%.2f" % (v / 30)|')(u'1000'), u'33.33')
+    for spec in ('p/v.__class__/', 'p/__import__("os")/', 'p/open/', 'p/v +/',
+                 'p/row[s]/', 'p/v/x/'):
+      if spec == 'p/open/':
+        self.assertRaises(sed.ExpressionError, sed.P_modifier(spec), u'x')
+      else:
+        self.assertRaises(sed.InvalidModifierSpec, sed.P_modifier, spec)
+    # frame introspection (e.g. through a generator) must be rejected
+    for spec in (
+        'p|[g for g in [(z.gi_frame.f_back.f_globals["sys"] for w in [0] for z in [g])]]|',
+        'p/len.func_globals/', 'p/(lambda: 1)()/', 'p/{"a": 1}["a"]/',
+        'p|"{0.real}".format(v)|'):
+      self.assertRaises(sed.InvalidModifierSpec, sed.P_modifier, spec)
+    self.assertEqual(
+      sed.P_modifier('p/sum(int(c) for c in s.strip())/')(u' 123'), u'6')
+
+  #----------------------------------------------------------------------------
+  def test_modifier_p_columns(self):
+    chk = '''\
+header 1,header 2,header 3,header 4,header 5
+field 1.1,3.7,FIELD 1.3,FIELD 1.4,field 1.5
+field 2.1,6.7,FIELD 2.3,FIELD 2.4,field 2.5
+field 3.1,9.7,FIELD 3.3,FIELD 3.4,field 3.5
+'''
+    # note: the other columns are their unmodified values
+    mods = {
+      'header 2': 'p|round(float(row["header 1"][6:]) + float(row[3][6:]) * 2, 1)|',
+      2: 'y/a-z/A-Z/',
+      'header 4': 'p/s.upper()/',
+    }
+    self.assertMultiLineEqual(run(self.baseCsv, mods), chk)
+    src = 'Age,Wage,Hours\n40,1000,40\n32,oops,0\n'
+    reader = sed.CsvFilter(
+      csvkit.CSVKitReader(StringIO.StringIO(src)),
+      {'Wage': ['p|Wage / Hours|', 's/^/$/'], 'Age': '1p/Age + 1/'})
+    self.assertEqual(reader.next(), [u'Age', u'Wage', u'Hours'])
+    self.assertEqual(reader.next(), [u'41', u'$25.0', u'40'])
+    self.assertRaises(sed.ExpressionError, reader.next)
+    reader = sed.CsvFilter(
+      csvkit.CSVKitReader(StringIO.StringIO(src)),
+      {'Wage': 'p|Wage / Hours|i'}, options=dict(cache_size=10))
+    self.assertEqual(
+      list(reader.iter_batches(2)),
+      [[[u'Age', u'Wage', u'Hours']],
+       [[u'40', u'25.0', u'40'], [u'32', u'oops', u'0']]])
+
   #----------------------------------------------------------------------------
   def test_modifier_e_directcall(self):
     self.assertEqual(sed.E_modifier('e/tr ab xy/')('b,a,c'), 'y,x,c')
@@ -165,6 +306,765 @@ field 3.1,field 3.2,field 3.3,11.56,field 3.5
     self.assertMultiLineEqual(
       run(self.baseCsv, {3: 'e/cut -f2 -d" " | xargs -I {} echo "scale=3;{}^2" | bc/'}), chk)
 
+  #----------------------------------------------------------------------------
+  def test_modifier_e_continuous(self):
+    cmd = 'while read l; do echo "$l" | tr a-z A-Z; echo noise >&2; done'
+    chk = '''\
+header 1,header 2,header 3,header 4,header 5
+field 1.1,FIELD 1.2,field 1.3,field 1.4,field 1.5
+field 2.1,FIELD 2.2,field 2.3,field 2.4,field 2.5
+field 3.1,FIELD 3.2,field 3.3,field 3.4,field 3.5
+'''
+    self.assertMultiLineEqual(run(self.baseCsv, {1: 'e#%s#c' % (cmd,)}), chk)
+    src = self.baseCsv + 'a,b,c,d,e\n' * 200
+    dst = StringIO.StringIO()
+    reader = sed.CsvFilter(
+      csvkit.CSVKitReader(StringIO.StringIO(src)), {1: 'e#%s#c' % (cmd,)},
+      window=16)
+    csvkit.CSVKitWriter(dst).writerows(reader)
+    self.assertMultiLineEqual(dst.getvalue(), src.replace(',b,', ',B,')
+                              .replace('field 1.2', 'FIELD 1.2')
+                              .replace('field 2.2', 'FIELD 2.2')
+                              .replace('field 3.2', 'FIELD 3.2'))
+
+  #----------------------------------------------------------------------------
+  def test_modifier_e_timeout(self):
+    mod = sed.E_modifier('e/read l; sleep 10/c', timeout=0.2)
+    with self.assertRaises(sed.CommandError):
+      mod('value')
+    mod = sed.E_modifier('e/echo failure >&2; exit 3/c')
+    with self.assertRaises(sed.CommandError) as cm:
+      mod('value')
+    self.assertIn('failure', str(cm.exception))
+
+  #----------------------------------------------------------------------------
+  def test_modifier_e_workers(self):
+    src = self.baseCsv + ''.join('%i,b,c,d,e\n' % (idx,) for idx in range(50))
+    for spec in ('e/sed s:^:n:/', 'e#while read l; do echo "n$l"; done#c'):
+      reader = sed.CsvFilter(
+        csvkit.CSVKitReader(StringIO.StringIO(src)), {0: spec},
+        window=8, options=dict(workers=3))
+      self.assertEqual(
+        [row[0] for row in reader][4:], ['n%i' % (idx,) for idx in range(50)])
+
+  #----------------------------------------------------------------------------
+  def test_modifier_e_concurrent(self):
+    src = self.baseCsv + 'a,b,c,d,e\n' * 4
+    # note: each program waits (for up to 5 seconds) until the other
+    #       column\'s program has also received the current row, which
+    #       only happens if the rows are sent to both concurrently.
+    cmd = 'e#n=0; while read l; do n=$((n+1)); touch %s/%s.$n; i=0;' \
+      ' while [ ! -e %s/%s.$n ] && [ $i -lt 500 ]; do sleep 0.01; i=$((i+1)); done;' \
+      ' if [ -e %s/%s.$n ]; then echo "$l" | tr a-z A-Z; else echo timeout; fi;' \
+      ' done#c'
+    tmpdir = tempfile.mkdtemp()
+    try:
+      barrier = lambda me, other: cmd % (tmpdir, me, tmpdir, other, tmpdir, other)
+      mods = {0: barrier('a', 'b'), 1: ['s/b/xb/', barrier('b', 'a'), 'y/X/_/']}
+      reader = sed.CsvFilter(
+        csvkit.CSVKitReader(StringIO.StringIO(src)), mods, window=1)
+      self.assertIsNotNone(reader.pipelined)
+      rows = list(reader)
+      reader.close()
+    finally:
+      shutil.rmtree(tmpdir)
+    self.assertEqual(rows[4:], [['A', '_B', 'c', 'd', 'e']] * 4)
+    self.assertEqual(rows[1][:2], ['FIELD 1.1', 'FIELD 1.2'])
+
+  #----------------------------------------------------------------------------
+  def test_modifier_e_failure_rowno(self):
+    src = self.baseCsv + 'ok\nfail\nok\n'
+    for window in (1, 4):
+      reader = sed.CsvFilter(
+        csvkit.CSVKitReader(StringIO.StringIO(src)),
+        {0: 'e/read v; test "$v" != fail && echo "$v"/'},
+        window=window, options=dict(workers=2))
+      with self.assertRaises(sed.CommandError) as cm:
+        list(reader)
+      self.assertTrue(str(cm.exception).startswith('row 5: '))
+
+  #----------------------------------------------------------------------------
+  def test_batch_failure_rowno(self):
+    src = 'v\n1\n2\nx\n4\n'
+    for mods, options in (
+      ({0: 'p/v+1/'}, {}),
+      ({0: 'p/v+1/'}, dict(cache_size=10)),
+      ({0: '2,$p/v+1/'}, {}),
+      ({0: 'e/read v; test "$v" != x && echo "$v"/'}, {}),
+      ):
+      reader = sed.CsvFilter(
+        csvkit.CSVKitReader(StringIO.StringIO(src)), mods,
+        header=True, options=options)
+      with self.assertRaises(sed.CommandError) as cm:
+        list(reader.iter_batches(4))
+      self.assertTrue(str(cm.exception).startswith('row 3: '))
+      reader.close()
+
+  #----------------------------------------------------------------------------
+  def test_modifier_cache(self):
+    calls = []
+    def upper(value):
+      calls.append(value)
+      return value.upper()
+    mod = sed.spec2modifier(upper, cache_size=2)
+    self.assertIsInstance(mod, sed.CachedModifier)
+    self.assertEqual(
+      [mod(val) for val in 'abacab'], ['A', 'B', 'A', 'C', 'A', 'B'])
+    self.assertEqual(calls, ['a', 'b', 'c', 'b'])
+    self.assertEqual((mod.hits, mod.misses, mod.evictions), (2, 4, 2))
+    self.assertEqual(sorted(mod.cache.keys()), ['a', 'b'])
+    mod = sed.CachedModifier(upper, memory=1)
+    self.assertEqual(mod('abc'), 'ABC')
+    self.assertEqual((len(mod.cache), mod.used), (0, 0))
+
+  #----------------------------------------------------------------------------
+  def test_modifier_cache_pipelined(self):
+    src = self.baseCsv + 'x,b,c,d,e\ny,b,c,d,e\nx,b,c,d,e\n'
+    reader = sed.CsvFilter(
+      csvkit.CSVKitReader(StringIO.StringIO(src)),
+      {0: 'e#while read l; do echo "n$l"; done#c'},
+      window=8, options=dict(cache_size=10))
+    self.assertEqual(
+      [row[0] for row in reader][4:], ['nx', 'ny', 'nx'])
+    self.assertEqual((reader.modifiers[0].hits, reader.modifiers[0].misses), (1, 5))
+
+  #----------------------------------------------------------------------------
+  def test_diskcache(self):
+    with tempfile.NamedTemporaryFile() as db:
+      cache = sed.DiskCache(db.name)
+      self.assertIsNone(cache.get('cmd', '', 'a'))
+      cache.put('cmd', '', 'a', u'é')
+      cache.put('cmd', 'c', u'a', 'b')
+      self.assertEqual(cache.get('cmd', '', u'a'), u'é')
+      self.assertIsInstance(cache.get('cmd', 'c', 'a'), str)
+      self.assertIsNone(cache.get('other', '', 'a'))
+      cache.close()
+      cache = sed.DiskCache(db.name, max_entries=1)
+      self.assertIsNone(cache.get('cmd', '', 'a'))
+      self.assertEqual(cache.get('cmd', 'c', 'a'), 'b')
+      cache.clear('cmd')
+      self.assertIsNone(cache.get('cmd', 'c', 'a'))
+      cache.close()
+
+  #----------------------------------------------------------------------------
+  def test_modifier_e_diskcache(self):
+    with tempfile.NamedTemporaryFile() as db:
+      with tempfile.NamedTemporaryFile() as log:
+        spec = 'e#tee -a %s | tr a-z A-Z#' % (log.name,)
+        for window in (1, 4, 1):
+          reader = sed.CsvFilter(
+            csvkit.CSVKitReader(StringIO.StringIO(self.baseCsv)), {1: spec},
+            window=window, options=dict(exec_cache=db.name))
+          self.assertEqual(
+            [row[1] for row in reader][1:],
+            ['FIELD 1.2', 'FIELD 2.2', 'FIELD 3.2'])
+          reader.close()
+        self.assertEqual(log.read(), 'field 1.2field 2.2field 3.2')
+
+  #----------------------------------------------------------------------------
+  def test_batches(self):
+    mods = {0: 's/./x/g', 2: ['y/a-z/A-Z/', 's/ /_/'], 'header 4': 'e/tr 1 9/'}
+    chk  = list(csvkit.CSVKitReader(StringIO.StringIO(run(self.baseCsv, mods))))
+    reader = sed.CsvFilter(
+      csvkit.CSVKitReader(StringIO.StringIO(self.baseCsv)), mods)
+    batches = list(reader.iter_batches(2))
+    self.assertEqual([len(batch) for batch in batches], [1, 2, 1])
+    self.assertEqual(sum(batches, []), chk)
+
+  #----------------------------------------------------------------------------
+  def test_modify_batch(self):
+    self.assertEqual(
+      sed.modify_batch(sed.Y_modifier('y/a-c/A-C/'), [u'abc', 'cab']),
+      [u'ABC', 'CAB'])
+    self.assertEqual(
+      sed.modify_batch(sed.spec2modifier('s/a/b/', cache_size=5), list('abac')),
+      list('bbbc'))
+    calls = []
+    def upper(value):
+      calls.append(value)
+      return value.upper()
+    mod = sed.CachedModifier(upper, size=10)
+    self.assertEqual(sed.modify_batch(mod, list('abab')), list('ABAB'))
+    self.assertEqual(calls, ['a', 'b'])
+    self.assertEqual((mod.hits, mod.misses), (2, 2))
+
+  #----------------------------------------------------------------------------
+  def test_modifier_chain(self):
+    chk = '''\
+header 1,header 2,header 3,header 4,header 5
+FIELD-1.1,field 1.2,field 1.3,field 1.4,field 1.5
+FIELD-2.1,field 2.2,field 2.3,field 2.4,field 2.5
+FIELD-3.1,field 3.2,field 3.3,field 3.4,field 3.5
+'''
+    self.assertMultiLineEqual(
+      run(self.baseCsv, {0: ['s/ /-/', 'y/a-z/A-Z/']}), chk)
+    self.assertMultiLineEqual(
+      run(self.baseCsv, [['s/ /-/', 'y/a-z/A-Z/']]), chk)
+
+  #----------------------------------------------------------------------------
+  def test_modifier_chain_order(self):
+    mod = sed.spec2modifier(['s/a/b/g', 's/b/c/g'])
+    self.assertIsInstance(mod, sed.ModifierChain)
+    self.assertEqual(mod('abba'), 'cccc')
+    mod = sed.spec2modifier(['s/b/c/g', 's/a/b/g'])
+    self.assertEqual(mod('abba'), 'bccb')
+
+  #----------------------------------------------------------------------------
+  def test_modifier_fused(self):
+    mod = sed.spec2modifier(
+      [u's/St\\./Street/g', u's/(Ave|Av)\\./Avenue/g', u's/[NW]/X/g'])
+    self.assertIsInstance(mod, sed.FusedModifier)
+    self.assertEqual(mod(u'N St. & W Ave.'), u'X Street & X Avenue')
+    self.assertEqual(mod.batch([u'Av. N', u'-']), [u'Avenue X', u'-'])
+    # not global, or patterns that overlap a preceding replacement
+    for specs in (['s/a/b/', 's/c/d/g'], ['s/a/xy/g', 's/yz/q/g'],
+                  ['s/,//g', 's/12/x/g'], ['s/a/b/gi', 's/c/d/g'],
+                  ['s/a+/b/g', 's/c/d/g']):
+      mod = sed.spec2modifier(specs)
+      self.assertIsInstance(mod, sed.ModifierChain)
+      self.assertEqual([type(m) for m in mod.modifiers], [sed.S_modifier] * 2)
+    mod = sed.spec2modifier(['s/,//g', 's/2/x/g', 's/3/y/'])
+    self.assertEqual([type(m) for m in mod.modifiers],
+                     [sed.FusedModifier, sed.S_modifier])
+    self.assertEqual(mod('1,234,345'), '1xy4345')
+
+  #----------------------------------------------------------------------------
+  def test_iter_records(self):
+    src = 'a,b\n"multi\nline, ""quoted""",x\n"c\n\n",d\ne,f'
+    self.assertEqual(
+      list(sed.iter_records(StringIO.StringIO(src))),
+      ['a,b\n', '"multi\nline, ""quoted""",x\n', '"c\n\n",d\n', 'e,f'])
+    self.assertEqual(
+      list(sed.iter_chunks(['ab', 'cd', 'ef', 'g'], 3)), ['abcd', 'efg'])
+
+  #----------------------------------------------------------------------------
+  def test_passthrough(self):
+    src = 'a,b\r\n"multi\nline",x\r\n"y",\xc3\xa9\n"z",""'
+    reader = sed.RecordReader(StringIO.StringIO(src))
+    rows = list(reader)
+    self.assertEqual(
+      [row.raw for row in rows],
+      ['a,b\r\n', '"multi\nline",x\r\n', '"y",\xc3\xa9\n', '"z",""'])
+    self.assertEqual(rows[2], [u'y', u'\u00e9'])
+    dst = StringIO.StringIO()
+    reader = sed.CsvFilter(sed.RecordReader(StringIO.StringIO(src)), {1: 's/x/X/'})
+    sed.PassthroughWriter(csvkit.CSVKitWriter(dst), dst).writerows(reader)
+    self.assertEqual(
+      dst.getvalue(), 'a,b\r\n"multi\nline",X\n"y",\xc3\xa9\n"z",""')
+
+  #----------------------------------------------------------------------------
+  def test_partial(self):
+    src = 'a,b,c,d\r\n' \
+      '"x,1","say ""hi""","multi\nline",4\r\n' \
+      '\n' \
+      'y,"2\n2",3\n' \
+      'z,"",,"q ""r"", s"\n' \
+      '"bad"x,5,6,7'
+    mods = {0: 's/^/_/', 1: 'y/a-z/A-Z/'}
+    reader = sed.RecordReader(StringIO.StringIO(src))
+    reader.next()
+    reader.limit = 2
+    rows = list(reader)
+    self.assertEqual(
+      [list(row) for row in rows],
+      [[u'x,1', u'say "hi"'], [], [u'y', u'2\n2'], [u'z', u''],
+       [u'badx', u'5', u'6', u'7']])
+    self.assertEqual(
+      [row.tail for row in rows],
+      [',"multi\nline",4', '', ',3', ',,"q ""r"", s"', ''])
+    # note: blank lines are not supported by `CsvFilter`
+    src = src.replace('\r\n\n', '\r\n')
+    reader = sed.RecordReader(StringIO.StringIO(src))
+    reader = sed.CsvFilter(reader, mods)
+    reader.reader.limit = reader.width
+    self.assertEqual(reader.width, 2)
+    dst = StringIO.StringIO()
+    sed.PassthroughWriter(csvkit.CSVKitWriter(dst), dst, unchanged=False) \
+      .writerows(reader)
+    self.assertMultiLineEqual(
+      dst.getvalue(), run(src, mods))
+
+  #----------------------------------------------------------------------------
+  def test_compress_streams(self):
+    data = ''.join('line %i\n' % (idx,) for idx in range(2000))
+    for format in ('gzip', 'bz2'):
+      buf = StringIO.StringIO()
+      buf.close = lambda: None
+      writer = compress.CompressingWriter(buf, format, blocksize=100)
+      for line in data.splitlines(True):
+        writer.write(line)
+      writer.close()
+      reader = compress.DecompressingReader(
+        StringIO.StringIO(buf.getvalue() * 2), format, blocksize=7)
+      self.assertEqual(reader.readline(), 'line 0\n')
+      self.assertEqual(reader.read(7), 'line 1\n')
+      self.assertEqual(list(reader), data.splitlines(True)[2:] + data.splitlines(True))
+      for trunc in (buf.getvalue()[:-5], buf.getvalue() + buf.getvalue()[:20]):
+        reader = compress.DecompressingReader(StringIO.StringIO(trunc), format)
+        with self.assertRaises(compress.CompressionError) as cm:
+          list(reader)
+        self.assertIn('truncated', str(cm.exception))
+    reader = compress.DecompressingReader(StringIO.StringIO('garbage'), 'gzip')
+    self.assertRaises(compress.CompressionError, reader.read)
+
+  #----------------------------------------------------------------------------
+  def test_parallel(self):
+    src = self.baseCsv + 'field "4.1",field 4.2,"multi\nline",x,y\n' * 20
+    mods = {0: 's/./x/g', 'header 3': 'y/a-z/A-Z/'}
+    dst = StringIO.StringIO()
+    sed.ParallelCsvFilter(
+      StringIO.StringIO(src), mods, jobs=2, chunksize=64).write(dst)
+    self.assertMultiLineEqual(dst.getvalue(), run(src, mods))
+
+  #----------------------------------------------------------------------------
+  def test_address(self):
+    chk = '''\
+header 1,header 2,header 3,header 4,header 5
+field 1.1,FIELD 1.2,field 1.Q,field 1.4,field 1.5
+field 2.1,field 2.2,field_2.Q,field 2.4,field 2.5
+x,field 3.2,field_3.3,field 3.4,field 3.5
+'''
+    mods = {1: '1y/a-z/A-Z/', 2: ['2,$s/ /_/', '$!s/3/Q/'],
+            0: '[header 5]/3\\.5$/s/.*/x/'}
+    self.assertMultiLineEqual(run(self.baseCsv, mods), chk)
+    self.assertMultiLineEqual(
+      run(self.baseCsv, {0: '/2/!s/.*/x/', 2: '2!s/ /_/g'}), '''\
+header 1,header 2,header 3,header 4,header 5
+x,field 1.2,field_1.3,field 1.4,field 1.5
+field 2.1,field 2.2,field 2.3,field 2.4,field 2.5
+x,field 3.2,field_3.3,field 3.4,field 3.5
+''')
+    reader = sed.CsvFilter(
+      csvkit.CSVKitReader(StringIO.StringIO(self.baseCsv)), mods)
+    self.assertEqual(
+      sum(reader.iter_batches(2), []),
+      list(csvkit.CSVKitReader(StringIO.StringIO(chk))))
+    mods[3] = ['$e/tr 4 X/', 's/ /_/']
+    src = self.baseCsv + 'a,b,c 3,d 4,e\n' * 20
+    dst = StringIO.StringIO()
+    sed.ParallelCsvFilter(
+      StringIO.StringIO(src), mods, jobs=2, chunksize=64).write(dst)
+    self.assertMultiLineEqual(dst.getvalue(), run(src, mods))
+    self.assertTrue(
+      dst.getvalue().endswith('a,b,c_Q,d_4,e\na,b,c_3,d_X,e\n'))
+    with self.assertRaises(sed.InvalidModifierSpec):
+      sed.spec2modifier('1,2')
+
+  #----------------------------------------------------------------------------
+  def test_stats(self):
+    stats = sed.Stats()
+    mods  = {0: ['s/3/X/', '2y/a-z/A-Z/'], 'header 3': 'e#sed -u s/3/Z/#c'}
+    reader = sed.CsvFilter(
+      csvkit.CSVKitReader(StringIO.StringIO(self.baseCsv)), mods,
+      window=4, stats=stats)
+    rows = list(reader)
+    reader.close()
+    self.assertEqual(rows[2], ['FIELD 2.1', 'field 2.2', 'field 2.Z', 'field 2.4', 'field 2.5'])
+    self.assertEqual(
+      [(entry.column, entry.name, entry.calls, entry.changed, entry.unchanged)
+       for entry in stats.modifiers],
+      [('header 1', 's/3/X/', 3, 1, 2),
+       ('header 1', '2 y/a-z/A-Z/', 1, 1, 0),
+       ('header 3', 'e#sed -u s/3/Z/#c', 3, 3, 0)])
+    self.assertEqual(stats.timers['read'].calls, 4)
+    self.assertIn('s/3/X/', stats.format())
+    self.assertEqual(len(stats.as_dict()['modifiers']), 3)
+    reader = sed.TimedReader(iter([['a'], ['b']]), stats.timer('other'))
+    self.assertEqual(list(reader), [['a'], ['b']])
+    self.assertEqual(stats.timers['other'].calls, 3)
+
+#------------------------------------------------------------------------------
+class TestBench(unittest.TestCase):
+
+  #----------------------------------------------------------------------------
+  def test_generate(self):
+    buf = StringIO.StringIO()
+    size = bench.generate(buf, rows=50, columns=3, quoting=0.5, cardinality=4)
+    self.assertEqual(size, len(buf.getvalue()))
+    rows = list(csvkit.CSVKitReader(StringIO.StringIO(buf.getvalue())))
+    self.assertEqual(rows[0], ['col1', 'col2', 'col3'])
+    self.assertEqual(len(rows), 51)
+    self.assertLessEqual(len(set(row[0] for row in rows[1:])), 4)
+    self.assertTrue(any(',' in value for row in rows[1:] for value in row))
+    buf2 = StringIO.StringIO()
+    bench.generate(buf2, rows=50, columns=3, quoting=0.5, cardinality=4)
+    self.assertEqual(buf.getvalue(), buf2.getvalue())
+
+  #----------------------------------------------------------------------------
+  def test_benchmark(self):
+    report = bench.benchmark(
+      scenarios=['s', 'y', 'w'], modes=['api'], rows=20, repeat=1)
+    self.assertEqual(
+      [(res['scenario'], res['mode'], res['rows']) for res in report['results']],
+      [('s', 'api', 20), ('y', 'api', 20), ('w', 'api', 20)])
+    for res in report['results']:
+      self.assertGreater(res['rows_per_sec'], 0)
+      self.assertGreater(res['peak_rss_kb'], 0)
+    self.assertEqual(len(bench.compare(report, report)), 3)
+
+#------------------------------------------------------------------------------
+class TestCli(unittest.TestCase):
+
+  sampleCsv = '''\
+Employee ID,Age,Wage,Status
+8783,47,"104,343,873.83","All good, but nowhere to go."
+2003,32,"98,878,784.00",A-OK
+'''
+
+  #----------------------------------------------------------------------------
+  def test_single_expr(self):
+    chk = '''\
+Employee ID,Age,Wage,Status
+8783,47,104343873.83,"All good, but nowhere to go."
+2003,32,98878784.00,A-OK
+'''
+    self.assertMultiLineEqual(
+      runcli(['-c', 'Wage', 's/,//g'], self.sampleCsv), chk)
+    self.assertMultiLineEqual(
+      runcli(['-j', '2', '-c', 'Wage', 's/,//g'], self.sampleCsv), chk)
+    for args in (['-p', '\\'], ['-u', '3']):
+      self.assertRaises(
+        SystemExit, runcli, ['-j', '2'] + args + ['s/,//g'], self.sampleCsv)
+
+  #----------------------------------------------------------------------------
+  def test_multi_expr(self):
+    chk = '''\
+Employee ID,Age,Wage,Status
+8783,47,104343873.83,good
+2003,32,98878784.00,ok
+'''
+    self.assertMultiLineEqual(
+      runcli(['-c', 'Wage', '-e', 's/,//g',
+              '-c', 'Status', '-e', 'y/A-Z/a-z/', '-e', 's/.*(ok|good).*/\\1/'],
+             self.sampleCsv), chk)
+
+  #----------------------------------------------------------------------------
+  def test_inplace(self):
+    chk = '''\
+Employee ID,Age,Wage,Status
+8783,47,104343873.83,"All good, but nowhere to go."
+2003,32,98878784.00,A-OK
+'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+      paths = [os.path.join(tmpdir, name) for name in ('a.csv', 'b.csv')]
+      for path in paths:
+        with open(path, 'wb') as fp:
+          fp.write(self.sampleCsv)
+      self.assertEqual(
+        runcli(['-i.orig', '-c', 'Wage', 's/,//g'] + paths), '')
+      for path in paths:
+        with open(path, 'rb') as fp:
+          self.assertMultiLineEqual(fp.read(), chk)
+        with open(path + '.orig', 'rb') as fp:
+          self.assertMultiLineEqual(fp.read(), self.sampleCsv)
+      runcli(['-c', 'Wage', '-i', '-e', 's/^1/X/', paths[0]])
+      with open(paths[0], 'rb') as fp:
+        self.assertMultiLineEqual(fp.read(), chk.replace(',104', ',X04'))
+      self.assertEqual(
+        sorted(os.listdir(tmpdir)), ['a.csv', 'a.csv.orig', 'b.csv', 'b.csv.orig'])
+    finally:
+      shutil.rmtree(tmpdir)
+
+  #----------------------------------------------------------------------------
+  def test_output_dir(self):
+    chk = self.sampleCsv.replace('"104,343,873.83"', '104343873.83') \
+      .replace('"98,878,784.00"', '98878784.00')
+    tmpdir = tempfile.mkdtemp()
+    try:
+      names = ['%02i.csv' % (idx,) for idx in range(8)]
+      for name in names:
+        with open(os.path.join(tmpdir, name), 'wb') as fp:
+          fp.write(self.sampleCsv)
+      with gzip.open(os.path.join(tmpdir, 'z.csv.gz'), 'wb') as fp:
+        fp.write(self.sampleCsv)
+      pattern = os.path.join(tmpdir, '*.csv*')
+      for tool in (cli.CsvSed, lean.LeanSed):
+        for jobs in ('1', '3'):
+          outdir = os.path.join(tmpdir, 'out', jobs)
+          self.assertEqual(runcli(
+            ['-j', jobs, '--output-dir', outdir, '-c', 'Wage', 's/,//g', pattern],
+            tool=tool), '')
+          self.assertEqual(sorted(os.listdir(outdir)), names + ['z.csv.gz'])
+          for name in names:
+            with open(os.path.join(outdir, name), 'rb') as fp:
+              self.assertMultiLineEqual(fp.read(), chk)
+          with gzip.open(os.path.join(outdir, 'z.csv.gz'), 'rb') as fp:
+            self.assertMultiLineEqual(fp.read(), chk)
+          shutil.rmtree(outdir)
+      runcli(['-j', '2', '-i', '-c', 'Wage', 's/,//g', pattern])
+      with open(os.path.join(tmpdir, names[-1]), 'rb') as fp:
+        self.assertMultiLineEqual(fp.read(), chk)
+      for args in (
+          ['--output-dir', tmpdir, '-i', 's/,//g', pattern],
+          ['--output-dir', tmpdir, 's/,//g', pattern, os.path.join(tmpdir, 'out', names[0])],
+          ['s/,//g', pattern],
+          ):
+        self.assertRaises(SystemExit, runcli, args)
+    finally:
+      shutil.rmtree(tmpdir)
+
+  #----------------------------------------------------------------------------
+  def test_script_file(self):
+    chk = '''\
+Employee ID,Age,Wage,Status
+8783,47,104343873.83,good
+2003,32,98878784.00,ok
+'''
+    with tempfile.NamedTemporaryFile() as script:
+      script.write('''\
+# comments and blank lines are ignored
+
+Wage s/,//g
+Status 'y/A-Z/a-z/'
+'s/.*(ok|good).*/\\1/'
+''')
+      script.flush()
+      self.assertMultiLineEqual(
+        runcli(['-c', 'Status', '-f', script.name], self.sampleCsv), chk)
+
+  #----------------------------------------------------------------------------
+  def test_compressed(self):
+    chk = self.sampleCsv.replace('"104,343,873.83"', '104343873.83') \
+      .replace('"98,878,784.00"', '98878784.00')
+    tmpdir = tempfile.mkdtemp()
+    try:
+      src = os.path.join(tmpdir, 'src.csv.gz')
+      with gzip.open(src, 'wb') as fp:
+        fp.write(self.sampleCsv[:40])
+      # note: a second gzip member, as produced by e.g. "pigz"
+      with open(src, 'ab') as fp:
+        member = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=member, mode='wb') as gz:
+          gz.write(self.sampleCsv[40:])
+        fp.write(member.getvalue())
+      # note: detection is by magic bytes, not by file name
+      plain = os.path.join(tmpdir, 'src.csv')
+      os.rename(src, plain)
+      for tool in (cli.CsvSed, lean.LeanSed):
+        for name in ('out.csv', 'out.csv.gz', 'out.csv.bz2'):
+          out = os.path.join(tmpdir, name)
+          self.assertEqual(
+            runcli(['-o', out, '-c', 'Wage', 's/,//g', plain], tool=tool), '')
+          with compress.open_input(out) as fp:
+            self.assertMultiLineEqual(fp.read(), chk)
+        self.assertEqual(compress.detect(out), 'bz2')
+        with open(out, 'rb') as fp:
+          self.assertMultiLineEqual(bz2.decompress(fp.read()), chk)
+      runcli(['-i.orig', '-c', 'Wage', 's/,//g', out])
+      with compress.open_input(out) as fp:
+        self.assertMultiLineEqual(fp.read(), chk)
+      self.assertEqual(compress.detect(out + '.orig'), 'bz2')
+      self.assertEqual(compress.detect('x.csv.xz', magic=False), 'xz')
+      # note: with magic, the extension is not used and a "BZh" prefix
+      #       alone is not bz2
+      for name, data in (('plain.csv.gz', self.sampleCsv),
+                         ('plain.csv', 'BZh9,BZh91AY\n1,2\n')):
+        path = os.path.join(tmpdir, name)
+        with open(path, 'wb') as fp:
+          fp.write(data)
+        self.assertIsNone(compress.detect(path))
+        for tool in (cli.CsvSed, lean.LeanSed):
+          self.assertMultiLineEqual(runcli(['s/x/x/', path], tool=tool), data)
+    finally:
+      shutil.rmtree(tmpdir)
+
+  #----------------------------------------------------------------------------
+  def test_checkpoint(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      src  = os.path.join(tmpdir, 'src.csv')
+      out  = os.path.join(tmpdir, 'out.csv')
+      log  = os.path.join(tmpdir, 'log')
+      flag = os.path.join(tmpdir, 'flag')
+      with open(src, 'wb') as fp:
+        fp.write('n,v\n' + ''.join('%i,"x\n%i"\n' % (i, i) for i in range(1, 11)))
+      chk = 'n,v\n' + ''.join('n%i,"x\n%i"\n' % (i, i) for i in range(1, 11))
+      # note: the program fails on row 8 until `flag` exists
+      expr = 'e|read v; echo $v >> %s; test $v -lt 8 -o -e %s && echo n$v|' % (log, flag)
+      for tool in (cli.CsvSed, lean.LeanSed):
+        args = ['--checkpoint', '3', '--batch-size', '1', '--exec-window', '1',
+                '-o', out, '-c', 'n', expr, src]
+        self.assertRaises(sed.CommandError, runcli, args, tool=tool)
+        with open(out + '.checkpoint', 'rb') as fp:
+          self.assertEqual(json.load(fp)['rows'], 6)
+        open(flag, 'wb').close()
+        runcli(['--resume'] + args, tool=tool)
+        with open(out, 'rb') as fp:
+          self.assertMultiLineEqual(fp.read(), chk)
+        self.assertFalse(os.path.exists(out + '.checkpoint'))
+        with open(log, 'rb') as fp:
+          self.assertEqual(fp.read().split(), '1 2 3 4 5 6 7 8 7 8 9 10'.split())
+        os.unlink(log)
+        os.unlink(flag)
+      self.assertRaises(
+        SystemExit, runcli, ['--checkpoint', '3', '-c', 'n', 's/1/2/', src])
+      # line numbers cannot be resumed, so "-l" is rejected up front
+      with open(out, 'wb') as fp:
+        fp.write('partial')
+      for extra in (['-l'], ['-l', '--resume']):
+        self.assertRaises(SystemExit, runcli, extra + args)
+      with open(out, 'rb') as fp:
+        self.assertEqual(fp.read(), 'partial')
+    finally:
+      shutil.rmtree(tmpdir)
+
+  #----------------------------------------------------------------------------
+  def test_passthrough(self):
+    source = self.sampleCsv.replace('\n', '\r\n').replace('2003', '"2003"')
+    chk = source.replace('"2003",32,"98,878,784.00",A-OK\r\n', '2003,32,98878784.00,A-OK\n')
+    for args in (
+        ['--passthrough', '-c', 'Wage', '2s/,//g'],
+        ['--passthrough', '--batch-size', '1', '-c', 'Wage', '2s/,//g'],
+        ['--passthrough', '-j', '2', '-c', 'Wage', '2s/,//g'],
+        ):
+      self.assertEqual(runcli(args, source), chk)
+      self.assertEqual(runcli(args, source, tool=lean.LeanSed), chk)
+    self.assertRaises(
+      SystemExit, runcli, ['--passthrough', '-t', 's/,//g'], source)
+
+  #----------------------------------------------------------------------------
+  def test_partial(self):
+    source = self.sampleCsv.replace('A-OK', '"A-OK, ""really"""') \
+      + ',33,"1,000.00",y\n'
+    for args in (
+        ['-c', 'Age', '-e', 's/^/_/', '-c', 'Wage', '-e', '[1]/8783/s/,//g'],
+        ['-c', '1', '[Status]/OK/s/$/!/'],
+        ['-c', '1', 's/q/Q/'],
+        ):
+      chk = runcli(args, source)
+      for extra in (['--partial'], ['--partial', '-j', '2'],
+                    ['--partial', '--passthrough']):
+        self.assertMultiLineEqual(runcli(extra + args, source), chk)
+        self.assertMultiLineEqual(
+          runcli(extra + args, source, tool=lean.LeanSed), chk)
+
+  #----------------------------------------------------------------------------
+  def test_bytes(self):
+    source = self.sampleCsv + u'4,5,"line\r\nbreak",\u00e9t\u00e9\n'.encode('utf-8')
+    for args in (
+        ['-c', 'Wage', 's/,//g'],
+        ['-c', 'Status', '-e', 'y/a-z/A-Z/', '-e', '2s/^/+/', '-e', 'p/s[:3]/'],
+        ['-c', '1-2', '[Status]/OK/s/.*/x/'],
+        ['--batch-size', '1', '-c', 'Status', 's/^.{3}//'],
+        ):
+      chk = runcli(args, source)
+      for extra in (['--bytes'], ['--bytes', '-j', '2'], ['--bytes', '--partial'],
+                    ['--bytes', '--flush', 'row']):
+        self.assertMultiLineEqual(runcli(extra + args, source), chk)
+        self.assertMultiLineEqual(
+          runcli(extra + args, source, tool=lean.LeanSed), chk)
+    # non-ASCII specifications (which are byte strings on the command line)
+    self.assertMultiLineEqual(
+      runcli(['--bytes', '-c', 'Status', u'y/\u00e9/E/'.encode('utf-8')], source),
+      source.replace('\r\n', '\n\n').replace(u'\u00e9t\u00e9'.encode('utf-8'), 'EtE'))
+    self.assertRaises(
+      SystemExit, runcli, ['--bytes', '--encoding', 'latin-1', 's/,//g'], source)
+
+  #----------------------------------------------------------------------------
+  def test_flush(self):
+    import select
+    chk = runcli(['-c', 'Wage', 's/,//g'], self.sampleCsv)
+    for args in (['--flush', 'buffered'], ['--flush', 'buffered', '--batch-size', '1'],
+                 ['--flush', '2'], ['--flush', '10ms'], ['--flush', 'row']):
+      for tool in (cli.CsvSed, lean.LeanSed):
+        self.assertMultiLineEqual(
+          runcli(args + ['-c', 'Wage', 's/,//g'], self.sampleCsv, tool=tool), chk)
+    for args in (['--flush', '0'], ['--flush', 'x'], ['--flush', 'row', '-j', '2']):
+      self.assertRaises(SystemExit, runcli, args + ['s/,//g'], self.sampleCsv)
+    # each row must be output as soon as it is input, while the input
+    # stays open (i.e. like a "tail -f" feed)
+    lines = self.sampleCsv.splitlines(True)
+    for module, extra in (('csvsed.lean', []), ('csvsed.cli', ['-d', ','])):
+      for policy in ('row', '50ms'):
+        proc = subprocess.Popen(
+          [sys.executable, '-m', module, '--flush', policy] + extra
+          + ['-c', 'Wage', 's/,//g'],
+          stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+          proc.stdin.write(''.join(lines[:2]))
+          proc.stdin.flush()
+          for line in chk.splitlines(True)[:2]:
+            self.assertTrue(select.select([proc.stdout], [], [], 20)[0])
+            self.assertEqual(proc.stdout.readline(), line)
+          proc.stdin.write(lines[2])
+          proc.stdin.close()
+          self.assertEqual(proc.stdout.read(), chk.splitlines(True)[2])
+        finally:
+          if proc.poll() is None:
+            proc.kill()
+          proc.wait()
+
+  #----------------------------------------------------------------------------
+  def test_main_pipes(self):
+    # note: run as child processes, since a SIGPIPE would kill them.
+    with tempfile.NamedTemporaryFile() as src:
+      src.write('n\n' + ''.join('%i\n' % (idx,) for idx in range(20000)))
+      src.flush()
+      cmd = [sys.executable, '-c', 'import sys, csvsed.lean; sys.exit(csvsed.lean.main())']
+      # a failing "continuous" mode program is reported, not fatal
+      for expr, error in (
+          ('e|read v; echo boom >&2; exit 3|c', 'row 1: command "read v; echo'
+           ' boom >&2; exit 3" terminated with status 3: boom'),
+          ('e|head -c 3|c', 'row 3: command "head -c 3" terminated with status 0'),
+          ):
+        proc = subprocess.Popen(
+          cmd + ['-c', 'n', expr, src.name],
+          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, errput = proc.communicate()
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn(error, errput)
+      # a closed output (e.g. when piped to "head") ends the program quietly
+      proc = subprocess.Popen(
+        cmd + ['-c', 'n', 's/1/x/', src.name],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+      self.assertEqual(proc.stdout.readline(), 'n\n')
+      proc.stdout.close()
+      self.assertEqual(proc.stderr.read(), '')
+      self.assertEqual(proc.wait(), 1)
+
+  #----------------------------------------------------------------------------
+  def test_exec_window(self):
+    # note: as in `runcli`, LeanSed changes the excepthook process-wide.
+    excepthook = sys.excepthook
+    try:
+      for args, window in (
+          (['-c', 'Wage', 's/,//g'], 1),
+          (['-c', 'Wage', 'e/tr , _/'], 1),
+          (['-c', 'Wage', '-e', 's/,//g', '-e', '2e/tr , _/C'], lean.EXEC_WINDOW),
+          (['--exec-window', '8', '-c', 'Wage', 'e/tr , _/'], 8),
+          ):
+        self.assertEqual(lean.LeanSed(args).args.exec_window, window)
+    finally:
+      sys.excepthook = excepthook
+    self.assertTrue(lean.is_continuous('[Status]/OK/e#cat#c'))
+    self.assertFalse(lean.is_continuous('/c/e#cat#'))
+    self.assertFalse(lean.is_continuous('s/c/C/c'))
+
+  #----------------------------------------------------------------------------
+  def test_lean(self):
+    source = self.sampleCsv + u'4,5,"line\r\nbreak",\u00e9t\u00e9\n'.encode('utf-8')
+    for args in (
+        ['-c', 'Wage', 's/,//g'],
+        ['-j', '2', '-c', 'Wage', 's/,//g'],
+        ['-c', 'Status', '-e', u'y/a-z\u00e9/A-Z\u00c9/', '-e', '2s/^/+/'],
+        ['--batch-size', '1', '-c', '1-2', '[Status]/OK/s/.*/x/'],
+        ):
+      self.assertMultiLineEqual(
+        runcli(args, source, tool=lean.LeanSed), runcli(args, source))
+    for args in (
+        ['-t', '-c', 'Wage', 's/,//g'],
+        ['-H', 's/,//g'],
+        ['-h'],
+        ['--encoding', 'utf-16', 's/,//g'],
+        ['-c', 'Wage'],
+        ):
+      self.assertRaises(lean.Fallback, lean.LeanSed, args)
+    # the lean entry point must not import csvkit
+    cmd = 'import sys, csvsed.lean; print sorted(sys.modules)'
+    modules = subprocess.check_output([sys.executable, '-c', cmd])
+    self.assertNotIn("'csvkit", modules)
+
 #------------------------------------------------------------------------------
 # end of $Id$
 # $ChangeLog$